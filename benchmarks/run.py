@@ -0,0 +1,216 @@
+# benchmark suite for the local stages and the full pipeline.
+# every scenario is a synthetic PR (see synthetic.py). each local stage is timed on its own,
+# best of --repeat runs, and the whole of __main__.main() runs end to end against the fake
+# LLM backend and the fake GitHub server. results are written as JSON and compared against
+# thresholds.json; the exit status is 1 if any stage is over its threshold.
+#
+#   python -m benchmarks.run                       # all scenarios
+#   python -m benchmarks.run --scenarios tiny,large --output bench.json
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from codereviewer.diffs import compute_diff_stat, parse_diff
+from codereviewer.fake_github import FakeGitHub
+from codereviewer.github_client import format_issue
+from codereviewer.prompts import get_complex_review_prompt, get_simple_review_prompt, get_summarizer_prompt
+from codereviewer.reviewer import merge_reviews
+from codereviewer.sharding import DEFAULT_SHARD_TOKEN_BUDGET, shard_files
+from codereviewer.summarizer import build_local_summary
+from codereviewer.telemetry import get_tracer
+
+from .synthetic import generate_files, render_diff, write_repo
+
+SCENARIOS = {
+    "tiny": {"lines": 10, "files": 1},
+    "small": {"lines": 500, "files": 10},
+    "medium": {"lines": 5000, "files": 100},
+    "large": {"lines": 20000, "files": 500},
+    "huge": {"lines": 50000, "files": 2000},
+}
+DEFAULT_THRESHOLDS = Path(__file__).parent / "thresholds.json"
+REPO = "bench/repo"
+
+
+def best_of(fn: Callable[[], object], repeat: int) -> float:
+    """Fastest of `repeat` runs, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def synthetic_issues(files) -> list[dict]:
+    """One issue per hunk on its first line, as a reviewer might report it."""
+    return [
+        {
+            "category": "Maintainability",
+            "file": file.path,
+            "line": hunk.new_start,
+            "issue": f"Repeated computation in {file.path}",
+            "impact": "Slower requests",
+            "recommendation": "Reuse the cached value",
+        }
+        for file in files
+        for hunk in file.hunks
+    ]
+
+
+def time_local_stages(diff: str, repeat: int) -> dict[str, float]:
+    files = parse_diff(diff)
+    stat = compute_diff_stat(files)
+    summary = build_local_summary(stat)["summary"]
+    issues = synthetic_issues(files)
+    # every issue reported by two overlapping shards
+    reviews = [{"issues": issues}, {"issues": [dict(issue) for issue in issues]}]
+
+    return {
+        "parse_diff": best_of(lambda: parse_diff(diff), repeat),
+        "diff_stat": best_of(lambda: compute_diff_stat(files), repeat),
+        "prompts": best_of(lambda: (
+            get_summarizer_prompt(diff),
+            get_simple_review_prompt(diff, summary),
+            get_complex_review_prompt("/repo", diff, summary),
+        ), repeat),
+        "sharding": best_of(lambda: shard_files(files, DEFAULT_SHARD_TOKEN_BUDGET), repeat),
+        "merge_reviews": best_of(lambda: merge_reviews(reviews), repeat),
+        "format_comments": best_of(lambda: [format_issue(issue) for issue in issues], repeat),
+    }
+
+
+def run_end_to_end(synthetic_files) -> dict:
+    """Runs __main__.main() in a checkout of the synthetic PR with LLM and GitHub stubbed out."""
+    from codereviewer.__main__ import main
+
+    with tempfile.TemporaryDirectory() as root, FakeGitHub() as github:
+        work = write_repo(root, synthetic_files)
+        head_sha = subprocess.run(["git", "rev-parse", "HEAD"], cwd=work, capture_output=True, text=True, check=True).stdout.strip()
+        pr = github.add_pull_request(REPO, 1, head_sha=head_sha)
+        env = {
+            "LLM_BACKEND": "fake",
+            "GITHUB_TOKEN": "bench",
+            "GITHUB_API_URL": github.url,
+            "GITHUB_REPOSITORY": REPO,
+            "GITHUB_PULL_REQUEST_NUMBER": "1",
+            "GITHUB_BASE_REF": "main",
+            "REVIEW_CACHE_PATH": os.path.join(root, "cache.sqlite"),
+            # the flush window is idle waiting, not work
+            "REVIEW_POST_FLUSH_SECONDS": "0",
+        }
+        saved = {key: os.environ.get(key) for key in env}
+        cwd = os.getcwd()
+        os.environ.update(env)
+        os.chdir(work)
+        try:
+            start = time.perf_counter()
+            asyncio.run(main())
+            elapsed = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+        spans: dict[str, float] = {}
+        for span in get_tracer().report()["spans"]:
+            spans[span["name"]] = spans.get(span["name"], 0.0) + span["seconds"]
+        return {
+            "seconds": elapsed,
+            "github_requests": len(github.requests),
+            "comments_posted": len(pr.review_comments),
+            "spans": spans,
+        }
+
+
+def check_thresholds(results: list[dict], thresholds: dict) -> list[dict]:
+    regressions = []
+    for result in results:
+        limits = thresholds.get(result["name"], {})
+        for stage, seconds in result["stages"].items():
+            limit = limits.get(stage)
+            if limit is not None and seconds > limit:
+                regressions.append({"scenario": result["name"], "stage": stage, "seconds": seconds, "threshold": limit})
+    return regressions
+
+
+def run_scenarios(args: argparse.Namespace) -> list[dict]:
+    results = []
+    for name in args.scenarios.split(","):
+        scenario = SCENARIOS[name]
+        synthetic_files = generate_files(scenario["lines"], scenario["files"])
+        diff = render_diff(synthetic_files)
+        stat = compute_diff_stat(parse_diff(diff))
+        result = {
+            "name": name,
+            **scenario,
+            "diff_lines": diff.count("\n"),
+            "diff_bytes": len(diff.encode()),
+            "insertions": stat["insertions"],
+            "deletions": stat["deletions"],
+            "stages": time_local_stages(diff, args.repeat),
+        }
+        if not args.no_end_to_end:
+            end_to_end = run_end_to_end(synthetic_files)
+            result["stages"]["end_to_end"] = end_to_end.pop("seconds")
+            result["end_to_end"] = end_to_end
+        print(f"{name}: " + ", ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in result["stages"].items()), file=sys.stderr)
+        results.append(result)
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the code reviewer on synthetic PRs.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma separated scenario names.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per local stage, the fastest is kept.")
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout.")
+    parser.add_argument("--thresholds", default=str(DEFAULT_THRESHOLDS), help="JSON file of per-stage limits in seconds.")
+    parser.add_argument("--no-end-to-end", action="store_true", help="Only time the local stages.")
+    args = parser.parse_args(argv)
+
+    # the pipeline logs every stage at INFO, which would dominate the timings
+    logging.disable(logging.INFO)
+    try:
+        results = run_scenarios(args)
+    finally:
+        logging.disable(logging.NOTSET)
+
+    thresholds = {}
+    if args.thresholds and os.path.exists(args.thresholds):
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+    regressions = check_thresholds(results, thresholds)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scenarios": results,
+        "regressions": regressions,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    for regression in regressions:
+        print(f"❌ {regression['scenario']}/{regression['stage']}: {regression['seconds']:.3f}s > {regression['threshold']:.3f}s", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
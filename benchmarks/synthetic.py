@@ -0,0 +1,155 @@
+# synthetic pull requests for the benchmarks.
+# a change set is a list of files with a base and a head version. the same change set can be
+# rendered straight to git diff text (for the local stage timings) or written out as a git repo
+# with an origin remote (for the end to end run), so both measure the same PR.
+# a few files are renamed with a small edit and a few are binary, like real big PRs.
+
+import difflib
+import hashlib
+import os
+import random
+import subprocess
+from dataclasses import dataclass
+
+LINES_PER_FUNCTION = 10
+
+
+@dataclass
+class SyntheticFile:
+    old_path: str
+    new_path: str
+    old: list[str] | bytes
+    new: list[str] | bytes
+
+    @property
+    def binary(self) -> bool:
+        return isinstance(self.new, bytes)
+
+    @property
+    def renamed(self) -> bool:
+        return self.old_path != self.new_path
+
+
+def _source(index: int, length: int) -> list[str]:
+    lines = []
+    for number in range(length):
+        if number % LINES_PER_FUNCTION == 0:
+            lines.append(f"def handler_{index}_{number // LINES_PER_FUNCTION}(request):")
+        else:
+            lines.append(f"    value_{number} = compute(request, {index}, {number})")
+    return lines
+
+
+def _edit(lines: list[str], changes: int, rng: random.Random) -> list[str]:
+    """Rewrites `changes` body lines, spread over the file so hunks vary in size."""
+    body = [number for number in range(len(lines)) if number % LINES_PER_FUNCTION]
+    new = list(lines)
+    for number in sorted(rng.sample(body, min(changes, len(body)))):
+        new[number] = new[number].replace("compute(", "compute_cached(")
+    return new
+
+
+def generate_files(lines: int, files: int, seed: int = 0) -> list[SyntheticFile]:
+    """
+    Builds a change set with roughly `lines` changed lines (insertions plus deletions) over `files` files.
+    About one file in twenty is a rename and one in fifty is binary, at least one of each from three files up.
+    """
+    rng = random.Random(seed)
+    binaries = max(1, files // 50) if files >= 3 else 0
+    renames = max(1, files // 20) if files >= 3 else 0
+    text_files = files - binaries
+    # each edited line shows up as one deletion and one insertion
+    changes_per_file = max(1, lines // 2 // max(text_files, 1))
+
+    result = []
+    for index in range(files):
+        directory = f"pkg{index % 25}"
+        path = f"{directory}/module_{index}.py"
+        if index < binaries:
+            path = f"assets/image_{index}.png"
+            old = b"\x89PNG\r\n\x1a\n\x00" + rng.randbytes(256)
+            new = b"\x89PNG\r\n\x1a\n\x00" + rng.randbytes(256)
+            result.append(SyntheticFile(path, path, old, new))
+            continue
+        old = _source(index, max(40, changes_per_file * 8 + 20))
+        new = _edit(old, changes_per_file, rng)
+        new_path = f"{directory}/moved/module_{index}.py" if index < binaries + renames else path
+        result.append(SyntheticFile(path, new_path, old, new))
+    return result
+
+
+def _blob_id(content: list[str] | bytes) -> str:
+    data = content if isinstance(content, bytes) else ("\n".join(content) + "\n").encode()
+    return hashlib.sha1(data).hexdigest()[:7]
+
+
+def render_diff(files: list[SyntheticFile], context: int = 3) -> str:
+    """Renders a change set as git diff output."""
+    out = []
+    for file in files:
+        out.append(f"diff --git a/{file.old_path} b/{file.new_path}")
+        if file.renamed:
+            out += ["similarity index 95%", f"rename from {file.old_path}", f"rename to {file.new_path}"]
+        out.append(f"index {_blob_id(file.old)}..{_blob_id(file.new)} 100644")
+        if file.binary:
+            out.append(f"Binary files a/{file.old_path} and b/{file.new_path} differ")
+            continue
+        hunks = list(difflib.unified_diff(file.old, file.new, lineterm="", n=context))
+        if hunks:
+            out += [f"--- a/{file.old_path}", f"+++ b/{file.new_path}", *hunks[2:]]
+    return "\n".join(out) + "\n"
+
+
+def generate_diff(lines: int, files: int, seed: int = 0, context: int = 3) -> str:
+    """Synthetic git diff text, see generate_files."""
+    return render_diff(generate_files(lines, files, seed), context)
+
+
+def _git(*args: str, cwd: str) -> None:
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+def _write(root: str, path: str, content: list[str] | bytes) -> None:
+    full = os.path.join(root, path)
+    os.makedirs(os.path.dirname(full), exist_ok=True)
+    if isinstance(content, bytes):
+        with open(full, "wb") as f:
+            f.write(content)
+    else:
+        with open(full, "w") as f:
+            f.write("\n".join(content) + "\n")
+
+
+def write_repo(root: str, files: list[SyntheticFile], base_branch: str = "main") -> str:
+    """
+    Writes the change set as a checkout of a PR branch with an `origin` remote holding the base branch.
+
+    Args:
+        root: An empty directory, the checkout goes in root/work and the remote in root/origin.git.
+        files: The change set.
+        base_branch: The branch the PR merges into.
+
+    Returns:
+        The path of the checkout.
+    """
+    origin, work = os.path.join(root, "origin.git"), os.path.join(root, "work")
+    _git("init", "-q", "--bare", "-b", base_branch, origin, cwd=root)
+    _git("init", "-q", "-b", base_branch, work, cwd=root)
+    for key, value in (("user.name", "bench"), ("user.email", "bench@example.com"), ("commit.gpgsign", "false")):
+        _git("config", key, value, cwd=work)
+    _git("remote", "add", "origin", origin, cwd=work)
+
+    for file in files:
+        _write(work, file.old_path, file.old)
+    _git("add", "-A", cwd=work)
+    _git("commit", "-q", "-m", "base", cwd=work)
+    _git("push", "-q", "origin", base_branch, cwd=work)
+
+    _git("checkout", "-q", "-b", "feature", cwd=work)
+    for file in files:
+        if file.renamed:
+            os.remove(os.path.join(work, file.old_path))
+        _write(work, file.new_path, file.new)
+    _git("add", "-A", cwd=work)
+    _git("commit", "-q", "-m", "change", cwd=work)
+    return work
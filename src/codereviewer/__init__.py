@@ -1 +1,7 @@
-__version__ = "0.1.0"
\ No newline at end of file
+__version__ = "0.1.0"
+
+# must run before any backend is imported, see startup.py
+from .startup import install as _install_import_profiler, profiling_enabled as _profiling_enabled
+
+if _profiling_enabled():
+    _install_import_profiler()
\ No newline at end of file
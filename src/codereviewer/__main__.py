@@ -1,51 +1,326 @@
 # main entry point for code review
-# gets the diff of the pr and determines if it's a major or minor change.
-# if it's major, it will run the agentic reviewer and if minor, it will run the simple reviewer.
+# gets the diff of the pr and routes it file by file (see router.py): a cheap sharded pass with the
+# simple reviewer, and the agentic reviewer only for high-risk files and what the cheap pass flags.
+# REVIEW_ROUTER=legacy restores the old >100 insertions switch between the two.
 # pr summarizer is always run.
 # I use structured output to get the review and summary formated for gh comments.
+# the summary is only a hint for the reviewer, so by default both run at the same time and
+# the reviewer gets a cheap local summary. REVIEW_PIPELINE_MODE=sequential restores the old
+# summarize-then-review order.
+# follow-up pushes are reviewed incrementally from the last reviewed head commit, which is
+# recorded in a hidden marker in the summary comment. REVIEW_INCREMENTAL=off always reviews the whole PR.
+# every stage runs in a telemetry span, the report goes to REVIEW_TELEMETRY_PATH and the step summary.
+# by default findings are posted progressively (see posting.py): each shard's issues go to the PR as
+# soon as the shard is done. REVIEW_POST_MODE=batched posts them all as one review at the end.
+# REVIEW_DEADLINE_SECONDS and REVIEW_BUDGET_USD bound a run, the stages degrade to stay within them
+# (see budget.py) and a degraded run says so on the PR.
 
-from .diffs import get_diff, get_diff_stat
-from .reviewer import review_commplex_changes, review_simple_changes
-from .summarizer import summarize_changes
-from .github_client import post_comments_and_summary
+from .diffs import acquire_diff
+from .reviewer import (
+    review_commplex_changes,
+    review_partitioned_changes,
+    review_simple_changes,
+    review_sharded_changes,
+    COMPLEX_REVIEW_MODEL,
+    SIMPLE_REVIEW_MODEL,
+)
+from .summarizer import summarize_changes, build_local_summary
+from .github_client import (
+    post_summary,
+    post_comments,
+    post_review,
+    get_head_sha,
+    get_incremental_base,
+    mark_reviewed,
+    annotate_summary,
+    aclose_client,
+)
+from .providers import aclose_clients
+from .posting import PostingQueue, publishing
+from .positions import build_line_index
+from .job import current_job
+from .budget import SEQUENTIAL_SUMMARY_SHARE, Budget, budgeted, current_budget
+from .cache import open_review_cache, review_with_cache
+from .context import make_file_reader, with_context
+from .router import review_routed
+from .telemetry import span, get_tracer, reset_tracer, write_reports
+from .startup import profiling_enabled, log_import_profile
 import asyncio
 import logging
+import os
+from functools import partial
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+PIPELINE_MODES = ("concurrent", "sequential")
+POST_MODES = ("progressive", "batched", "individual")
+
+
+async def summarize_stage(diff: str, diff_stat: dict, post: bool, share: float = 1.0) -> tuple[dict, int | None]:
+    """
+    Runs the summarizer and, if asked, posts the summary as soon as it is ready.
+    Under a run budget the summarizer gets `share` of the time left, and the local
+    summary is used if it runs out.
+
+    Returns:
+        The summary and the id of the posted summary comment.
+    """
+    budget = current_budget()
+    cache = open_review_cache()
+    try:
+        with span("summarize"):
+            if budget.exhausted():
+                budget.degrade("No budget left for the summary, it lists the changed files instead")
+                summary = build_local_summary(diff_stat)
+            else:
+                try:
+                    summary = await budget.run(summarize_changes(diff, cache), share)
+                except TimeoutError:
+                    budget.degrade("The summary was not ready in time, it lists the changed files instead")
+                    summary = build_local_summary(diff_stat)
+    finally:
+        if cache is not None:
+            cache.close()
+    logger.info(f"Summary generated: {len(summary.get('summary', ''))} chars")
+    comment_id = None
+    if post:
+        with span("github.post_summary"):
+            comment_id = await post_summary(summary)
+    return summary, comment_id
+
+
+async def review_stage(diff: str, diff_stat: dict, summary: dict, read_file=None) -> dict:
+    """
+    Picks the reviewer for the size of the PR and runs it on the hunks the review cache has not seen.
+    Each request gets its hunk context grown from read_file before it is sent.
+    """
+    read_file = read_file or make_file_reader()
+    if not diff.strip():
+        logger.info("Nothing new to review")
+        return {"issues": []}
+
+    if os.getenv("REVIEW_ROUTER", "tiered") == "legacy":
+        if diff_stat["insertions"] > 100:
+            logger.info("PR is major (>100 insertions), running complex review with Claude")
+            review_fn = partial(review_partitioned_changes, agent_fn=with_context(review_commplex_changes, read_file))
+            model = COMPLEX_REVIEW_MODEL
+        else:
+            logger.info("PR is minor (<100 insertions), running simple review with OpenAI")
+            review_fn = partial(review_sharded_changes, review_fn=with_context(review_simple_changes, read_file))
+            model = SIMPLE_REVIEW_MODEL
+    else:
+        # cheap pass for everything, the agent for high-risk files and whatever the cheap pass flags
+        review_fn = partial(
+            review_routed,
+            simple_fn=with_context(review_simple_changes, read_file),
+            # the agent runs as concurrent sessions over subsystem partitions when its diff is big
+            agent_fn=partial(review_partitioned_changes, agent_fn=with_context(review_commplex_changes, read_file)),
+        )
+        model = f"{SIMPLE_REVIEW_MODEL}+{COMPLEX_REVIEW_MODEL}"
+
+    cache = open_review_cache()
+    try:
+        with span("review", model=model) as review_span:
+            review = await review_with_cache(diff, summary, review_fn, model, cache)
+            if cache is not None:
+                review_span.record(cache_hits=cache.hits, cache_misses=cache.misses)
+    finally:
+        if cache is not None:
+            cache.close()
+
+    logger.info(f"Review complete: {len(review.get('issues', []))} issues found")
+    return review
+
+
+async def run_pipeline(
+    diff: str,
+    diff_stat: dict,
+    mode: str = "concurrent",
+    review_diff: str | None = None,
+    review_stat: dict | None = None,
+    read_file=None,
+    post_summary_early: bool = True,
+) -> tuple[dict, dict, int | None]:
+    """
+    Schedules the summarize and review stages.
+
+    In concurrent mode both stages start at once, the reviewer works from a local
+    summary and the real summary is posted the moment it is ready. In sequential
+    mode the reviewer waits for the real summary, which is only posted on its own
+    if post_summary_early is set.
+
+    Args:
+        diff: The diff of the pull request.
+        diff_stat: The diff stats of the pull request.
+        mode: One of PIPELINE_MODES.
+        review_diff: The part of the diff to review, defaults to the whole diff.
+        review_stat: The diff stats of review_diff.
+        read_file: Loads the new version of a file for hunk context, see context.make_file_reader.
+        post_summary_early: Post the summary as its own comment as soon as it is ready.
+
+    Returns:
+        The review, the summary and the id of the summary comment.
+    """
+    if review_diff is None:
+        review_diff, review_stat = diff, diff_stat
+
+    if mode == "sequential":
+        summary, comment_id = await summarize_stage(diff, diff_stat, post=post_summary_early, share=SEQUENTIAL_SUMMARY_SHARE)
+        review = await review_stage(review_diff, review_stat, summary, read_file)
+        return review, summary, comment_id
+
+    summary_task = asyncio.create_task(summarize_stage(diff, diff_stat, post=True))
+    review_task = asyncio.create_task(review_stage(review_diff, review_stat, build_local_summary(review_stat), read_file))
+    try:
+        review, (summary, comment_id) = await asyncio.gather(review_task, summary_task)
+    except BaseException:
+        summary_task.cancel()
+        review_task.cancel()
+        raise
+    return review, summary, comment_id
+
+
 async def main():
-    import os
-    
+    reset_tracer()
+    try:
+        with span("run"):
+            await run()
+    finally:
+        await aclose_clients()
+        await aclose_client()
+        if profiling_enabled():
+            get_tracer().extra["imports"] = log_import_profile()
+        write_reports()
+
+
+async def run():
+    """
+    Reviews one PR: the one in the action environment, or the running service job's.
+    The shared LLM and GitHub clients are left open, main() closes them at the end of an action run.
+    """
+    with budgeted(Budget.from_env()) as budget:
+        await review_pr(budget)
+        if budget.limited:
+            get_tracer().extra["budget"] = budget.report()
+
+
+async def review_pr(budget: Budget):
+    """
+    The stages of run(), under the run's deadline and spend budget.
+    """
     logger.info("Starting code review")
-    
+
     # Log environment variables
-    logger.info(f"GITHUB_REPOSITORY: {os.getenv('GITHUB_REPOSITORY', 'NOT SET')}")
-    logger.info(f"GITHUB_PULL_REQUEST_NUMBER: {os.getenv('GITHUB_PULL_REQUEST_NUMBER', 'NOT SET')}")
+    job = current_job()
+    if job is not None:
+        logger.info(f"Reviewing {job} in {job.workdir}")
+    else:
+        logger.info(f"GITHUB_REPOSITORY: {os.getenv('GITHUB_REPOSITORY', 'NOT SET')}")
+        logger.info(f"GITHUB_PULL_REQUEST_NUMBER: {os.getenv('GITHUB_PULL_REQUEST_NUMBER', 'NOT SET')}")
     logger.info(f"API keys present - CLAUDE: {bool(os.getenv('ANTHROPIC_API_KEY'))}, OPENAI: {bool(os.getenv('OPENAI_API_KEY'))}")
     logger.info(f"GITHUB_TOKEN present: {bool(os.getenv('GITHUB_TOKEN'))}")
-    
-    diff = get_diff()
-    diff_stat = get_diff_stat()
+
+    mode = os.getenv("REVIEW_PIPELINE_MODE", "concurrent")
+    if mode not in PIPELINE_MODES:
+        logger.warning(f"Unknown REVIEW_PIPELINE_MODE '{mode}', using concurrent")
+        mode = "concurrent"
+    logger.info(f"Pipeline mode: {mode}")
+    if budget.limited:
+        logger.info(f"Run budget: deadline {budget.deadline_seconds or 'none'}s, spend ${budget.max_cost_usd or 'unlimited'}")
+
+    post_mode = os.getenv("REVIEW_POST_MODE", "progressive")
+    if post_mode not in POST_MODES:
+        logger.warning(f"Unknown REVIEW_POST_MODE '{post_mode}', using progressive")
+        post_mode = "progressive"
+    # a sequential batched run sends the summary and all comments as one review
+    post_summary_early = mode == "concurrent" or post_mode != "batched"
+
+    # fetch with small context, each review request grows it to its token budget
+    context = int(os.getenv("REVIEW_DIFF_CONTEXT", "3"))
+    with span("git.diff") as diff_span:
+        acquired = await asyncio.to_thread(acquire_diff, context=context)
+        diff, diff_stat = acquired.text, acquired.stat
+        # GitHub only takes comments on the lines of this diff, findings are placed on it before posting
+        positions = build_line_index(acquired.files)
+        acquired.cleanup()
+        if acquired.over_memory:
+            budget.degrade(f"{len(acquired.over_memory)} files were left out of review, the diff is over REVIEW_DIFF_MEMORY_MB")
+        diff_span.record(bytes_in=len(diff.encode()), files=len(diff_stat["files"]), lines=diff_stat["total"])
     logger.info(f"Diff stats: insertions={diff_stat['insertions']}, deletions={diff_stat['deletions']}, files={len(diff_stat['files'])}")
-    
-    summary = await summarize_changes(diff)
-    logger.info(f"Summary generated: {len(summary.get('summary', ''))} chars")
-    
-    if diff_stat["insertions"] > 100:
-        logger.info("PR is major (>100 insertions), running complex review with Claude")
-        review = await review_commplex_changes(diff, summary)
+
+    # only review what was pushed since the last reviewed head, if that head is still in the branch.
+    # a job reviews the commit it checked out, a newer push may already be the PR's head and must not be marked
+    if job is not None and job.head_sha:
+        head_sha = job.head_sha
     else:
-        logger.info("PR is minor (<100 insertions), running simple review with OpenAI")
-        review = await review_simple_changes(diff, summary)
-    
-    logger.info(f"Review complete: {len(review.get('issues', []))} issues found")
-    
+        with span("github.head_sha"):
+            head_sha = await get_head_sha()
+    review_diff, review_stat = diff, diff_stat
+    read_file = make_file_reader()
+    if head_sha and os.getenv("REVIEW_INCREMENTAL", "on").lower() not in ("0", "off", "false", "no"):
+        with span("github.incremental_base"):
+            base_sha = await get_incremental_base(head_sha)
+        if base_sha:
+            with span("git.diff_incremental") as diff_span:
+                incremental = await asyncio.to_thread(acquire_diff, base_sha, head_sha, context=context)
+                review_diff, review_stat = incremental.text, incremental.stat
+                incremental.cleanup()
+                if incremental.over_memory and not acquired.over_memory:
+                    budget.degrade(f"{len(incremental.over_memory)} files were left out of review, the diff is over REVIEW_DIFF_MEMORY_MB")
+                diff_span.record(bytes_in=len(review_diff.encode()), files=len(review_stat["files"]), lines=review_stat["total"])
+            read_file = make_file_reader(head_sha)
+            logger.info(f"Incremental diff stats: insertions={review_stat['insertions']}, deletions={review_stat['deletions']}, files={len(review_stat['files'])}")
+
+    # findings are posted from the background while the review is still running
+    queue = PostingQueue(head_sha, positions=positions) if post_mode == "progressive" and head_sha else None
+    if queue is not None:
+        queue.start()
     try:
-        post_comments_and_summary(review, summary)
+        with publishing(queue):
+            review, summary, comment_id = await run_pipeline(
+                diff, diff_stat, mode, review_diff, review_stat, read_file, post_summary_early
+            )
+        if queue is not None:
+            # whatever the stages did not publish themselves, e.g. a legacy agent-only review
+            queue.publish(review.get("issues", []))
+    except asyncio.CancelledError:
+        # superseded by a newer push in service mode, findings for the outdated commit are dropped
+        if queue is not None:
+            queue.cancel()
+        raise
+    finally:
+        if queue is not None:
+            # also when the pipeline failed, so the findings it got to are still posted
+            await queue.close()
+
+    # a partial review says what it left out, and is not marked reviewed so the next push gets a full one
+    note = budget.note()
+    if note and comment_id is None:
+        summary = {**summary, "summary": f"{summary['summary']}\n\n{note}"}
+
+    try:
+        # the reviewed-sha marker goes in the batched review body, otherwise on the summary comment
+        with span("github.post", issues=len(review.get("issues", []))):
+            if note and comment_id is not None:
+                await annotate_summary(comment_id, note)
+            mark_summary = False
+            if queue is not None:
+                # everything is posted already, the marker goes on the summary comment unless a batch failed
+                mark_summary = queue.failed == 0
+                if queue.failed:
+                    logger.warning(f"{queue.failed} findings could not be posted, not marking {head_sha[:7]} as reviewed")
+            elif post_mode == "individual":
+                mark_summary = await post_comments(review, positions=positions)
+            elif review.get("issues") or not post_summary_early:
+                await post_review(review, None if post_summary_early else summary, head_sha, mark=not note, positions=positions)
+            else:
+                mark_summary = True
+            if mark_summary and head_sha and comment_id is not None and not note:
+                await mark_reviewed(comment_id, head_sha)
     except Exception as e:
         logger.error(f"Error posting comments and summary: {e}", exc_info=True)
-    
+
 
 if __name__ == "__main__":
     asyncio.run(main())
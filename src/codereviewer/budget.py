@@ -0,0 +1,146 @@
+# deadline and spend budget of a review run.
+# REVIEW_DEADLINE_SECONDS bounds the wall time of a run and REVIEW_BUDGET_USD its LLM spend. the
+# stages ask the run's budget before they start expensive work and degrade instead of overrunning:
+# the summary falls back to the local file list, the agent only gets the riskiest files it can
+# afford (the cheap pass reviews the rest), shards not started by the deadline are dropped and the
+# LLM repair of unparseable agent output is skipped. shards that fail and files left out by the diff
+# memory cap are recorded the same way. the last part of the deadline is kept for
+# posting, so whatever was found still gets posted. every degradation is logged, put in the
+# telemetry report and noted on the PR, and a degraded run does not mark its head as reviewed.
+
+import asyncio
+import logging
+import math
+import os
+import time
+from collections.abc import Awaitable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TypeVar
+
+from .telemetry import get_tracer, record
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# share of the deadline kept for posting the findings, at least MIN_POST_RESERVE_SECONDS
+DEFAULT_POST_RESERVE = 0.1
+MIN_POST_RESERVE_SECONDS = 15
+# the agent is not started with less time than this left
+AGENT_MIN_SECONDS = 60
+# share of the review window the summary gets when the review waits for it
+SEQUENTIAL_SUMMARY_SHARE = 0.25
+
+
+class Budget:
+    """
+    Wall-clock deadline and spend limit of one run. Either can be None for no limit.
+
+    Usage:
+        with budgeted(Budget.from_env()) as budget:
+            ...  # stages call current_budget() before expensive work
+        budget.report()
+    """
+
+    def __init__(self, deadline_seconds: float | None = None, max_cost_usd: float | None = None, post_reserve: float = DEFAULT_POST_RESERVE):
+        self.deadline_seconds = deadline_seconds
+        self.max_cost_usd = max_cost_usd
+        self.started = time.monotonic()
+        self.deadline = self.started + deadline_seconds if deadline_seconds else None
+        # the review stages stop this long before the deadline, posting gets the rest
+        reserve = min(max(deadline_seconds * post_reserve, MIN_POST_RESERVE_SECONDS), deadline_seconds / 2) if deadline_seconds else 0
+        self.review_deadline = self.deadline - reserve if self.deadline else None
+        self._cost_at_start = get_tracer().total("cost_usd")
+        self.degradations: list[str] = []
+
+    @classmethod
+    def from_env(cls) -> "Budget":
+        deadline = os.getenv("REVIEW_DEADLINE_SECONDS")
+        cost = os.getenv("REVIEW_BUDGET_USD")
+        return cls(
+            deadline_seconds=float(deadline) if deadline else None,
+            max_cost_usd=float(cost) if cost else None,
+            post_reserve=float(os.getenv("REVIEW_POST_RESERVE", DEFAULT_POST_RESERVE)),
+        )
+
+    @property
+    def limited(self) -> bool:
+        return self.deadline is not None or self.max_cost_usd is not None
+
+    def seconds_left(self, stage: str = "review") -> float:
+        """Time left for a stage, "post" may use the reserve. inf without a deadline."""
+        deadline = self.deadline if stage == "post" else self.review_deadline
+        if deadline is None:
+            return math.inf
+        return max(deadline - time.monotonic(), 0.0)
+
+    def spent(self) -> float:
+        return get_tracer().total("cost_usd") - self._cost_at_start
+
+    def cost_left(self) -> float:
+        """USD left to spend, inf without a limit."""
+        if self.max_cost_usd is None:
+            return math.inf
+        return max(self.max_cost_usd - self.spent(), 0.0)
+
+    def exhausted(self) -> bool:
+        return self.seconds_left() <= 0 or self.cost_left() <= 0
+
+    def timeout(self, share: float = 1.0, stage: str = "review") -> float | None:
+        """A timeout for asyncio.wait_for, a share of the time left. None without a deadline."""
+        left = self.seconds_left(stage)
+        return None if math.isinf(left) else left * share
+
+    async def run(self, coro: Awaitable[T], share: float = 1.0) -> T:
+        """
+        Awaits coro within the time left for the review stages.
+
+        Raises:
+            TimeoutError: If the review window closes first, coro is cancelled.
+        """
+        return await asyncio.wait_for(coro, self.timeout(share))
+
+    def degrade(self, reason: str) -> None:
+        """Records that the run did less than it would have without the budget."""
+        self.degradations.append(reason)
+        logger.warning(f"Budget: {reason}")
+        record(degraded=reason)
+        get_tracer().extra["budget"] = self.report()
+
+    def report(self) -> dict:
+        return {
+            "deadline_seconds": self.deadline_seconds,
+            "max_cost_usd": self.max_cost_usd,
+            "seconds": round(time.monotonic() - self.started, 3),
+            "spent_usd": round(self.spent(), 6),
+            "degradations": list(self.degradations),
+        }
+
+    def note(self) -> str:
+        """Markdown for the PR listing what was cut, empty when nothing was."""
+        if not self.degradations:
+            return ""
+        lines = ["> [!NOTE]", "> **Partial review:** this run did not review everything."]
+        lines.extend(f"> - {reason}" for reason in self.degradations)
+        return "\n".join(lines)
+
+
+_current: ContextVar[Budget | None] = ContextVar("codereviewer_budget", default=None)
+# returned outside a budgeted run, never degrades anything
+_UNLIMITED = Budget()
+
+
+def current_budget() -> Budget:
+    """The budget of the running review, unlimited outside one."""
+    return _current.get() or _UNLIMITED
+
+
+@contextmanager
+def budgeted(budget: Budget) -> Iterator[Budget]:
+    """Runs the stages in this context, and the tasks started from it, under the budget."""
+    token = _current.set(budget)
+    try:
+        yield budget
+    finally:
+        _current.reset(token)
@@ -0,0 +1,216 @@
+# content-addressed review cache.
+# every hunk is keyed by a hash of its content, the file it belongs to, the prompt version and
+# the model, and the issues found in it are stored relative to the start of the hunk. on a
+# follow-up push only the hunks that changed miss the cache and get sent to the LLM.
+# the store is a single sqlite file so it can be persisted between runs with actions/cache.
+# the map-reduce summarizer keeps its per-file summaries in the same file, keyed by file content.
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from .diffs import FileDiff, Hunk, parse_diff
+from .posting import publish
+from .prompts import PROMPT_VERSION
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "codereviewer", "reviews.sqlite")
+
+
+def hunk_key(path: str, hunk: Hunk, model: str, prompt_version: str = PROMPT_VERSION) -> str:
+    """
+    Hashes a hunk for the cache. The @@ header is left out so a hunk that only moved
+    because of edits above it still hits.
+    """
+    digest = hashlib.sha256()
+    for part in (prompt_version, model, path, "\n".join(hunk.lines)):
+        digest.update(part.encode("utf-8", "surrogateescape"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def summary_key(file: FileDiff, model: str, prompt_version: str = PROMPT_VERSION) -> str:
+    """
+    Hashes a file diff for the summary cache, without the @@ headers like hunk_key.
+    """
+    digest = hashlib.sha256()
+    for part in (prompt_version, model, file.path, *("\n".join(hunk.lines) for hunk in file.hunks)):
+        digest.update(part.encode("utf-8", "surrogateescape"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ReviewCache:
+    """
+    SQLite store of the issues found per hunk and the summaries per file, evicted by age and entry count.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 20000, max_age_days: float = 30):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_days * 24 * 3600
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS reviews ("
+            "key TEXT PRIMARY KEY, issues TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            "key TEXT PRIMARY KEY, summary TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> list[dict] | None:
+        row = self.conn.execute("SELECT issues FROM reviews WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute("UPDATE reviews SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, issues: list[dict]) -> None:
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO reviews (key, issues, created, last_used) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(issues), now, now),
+        )
+
+    def get_summary(self, key: str) -> str | None:
+        row = self.conn.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put_summary(self, key: str, summary: str) -> None:
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO summaries (key, summary, created, last_used) VALUES (?, ?, ?, ?)",
+            (key, summary, now, now),
+        )
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def evict(self) -> int:
+        """
+        Drops entries older than max_age_days, then the least recently used ones above max_entries.
+
+        Returns:
+            The number of entries removed.
+        """
+        removed = 0
+        for table in ("reviews", "summaries"):
+            removed += self.conn.execute(
+                f"DELETE FROM {table} WHERE created < ?", (time.time() - self.max_age_seconds,)
+            ).rowcount
+            removed += self.conn.execute(
+                f"DELETE FROM {table} WHERE key NOT IN (SELECT key FROM {table} ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            ).rowcount
+        return removed
+
+    def close(self) -> None:
+        removed = self.evict()
+        self.commit()
+        self.conn.close()
+        logger.info(f"Review cache: {self.hits} hits, {self.misses} misses, {removed} evicted")
+
+
+def open_review_cache() -> ReviewCache | None:
+    """
+    Opens the review cache configured by the environment, or None when it is turned off.
+    """
+    if os.getenv("REVIEW_CACHE", "on").lower() in ("0", "off", "false", "no"):
+        return None
+    try:
+        return ReviewCache(
+            path=os.getenv("REVIEW_CACHE_PATH", DEFAULT_CACHE_PATH),
+            max_entries=int(os.getenv("REVIEW_CACHE_MAX_ENTRIES", "20000")),
+            max_age_days=float(os.getenv("REVIEW_CACHE_MAX_AGE_DAYS", "30")),
+        )
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"Review cache unavailable, reviewing without it: {e}")
+        return None
+
+
+def _hunk_contains(hunk: Hunk, line: int) -> bool:
+    return hunk.new_start <= line < hunk.new_start + max(hunk.new_len, 1)
+
+
+async def review_with_cache(diff: str, summary: dict, review_fn, model: str, cache: ReviewCache | None) -> dict:
+    """
+    Reviews only the hunks that miss the cache and fills in the rest from earlier runs.
+    Hunks of files the review lists as unreviewed (dropped by the budget, or the agent
+    submitted nothing) are not cached, so the next run reviews them again.
+
+    Args:
+        diff: The diff of the pull request.
+        summary: The summary of the changes.
+        review_fn: The reviewer to run on the hunks that miss, called as review_fn(diff, summary).
+        model: The model the reviewer uses, part of the cache key.
+        cache: The review cache, or None to always review the whole diff.
+
+    Returns:
+        A dictionary containing the issues.
+    """
+    if cache is None:
+        return await review_fn(diff, summary)
+
+    cached_issues: list[dict] = []
+    missed_files: list[FileDiff] = []
+    pending: list[tuple[str, Hunk, str]] = []
+
+    for file in parse_diff(diff):
+        missed_hunks = []
+        for hunk in file.hunks:
+            key = hunk_key(file.path, hunk, model)
+            stored = cache.get(key)
+            if stored is None:
+                missed_hunks.append(hunk)
+                pending.append((file.path, hunk, key))
+                continue
+            for issue in stored:
+                offset = issue.pop("offset")
+                cached_issues.append({**issue, "file": file.path, "line": hunk.new_start + offset})
+        if missed_hunks or not file.hunks:
+            missed_files.append(file.with_hunks(missed_hunks))
+
+    # the lookups touch last_used, commit them so the summarizer's connection is not locked out during the review
+    cache.commit()
+    logger.info(f"Review cache: {len(pending)} hunks to review, {len(cached_issues)} cached issues reused")
+    publish(cached_issues)
+    if not pending:
+        return {"issues": cached_issues}
+
+    missed_diff = "".join(file.text for file in missed_files)
+    review = await review_fn(missed_diff, summary)
+
+    found: dict[str, list[dict]] = {key: [] for _, _, key in pending}
+    for issue in review.get("issues", []):
+        for path, hunk, key in pending:
+            if path == issue["file"] and _hunk_contains(hunk, issue["line"]):
+                stored = {k: v for k, v in issue.items() if k not in ("file", "line")}
+                found[key].append({**stored, "offset": issue["line"] - hunk.new_start})
+                break
+    unreviewed = set(review.get("unreviewed", []))
+    for path, _, key in pending:
+        if path not in unreviewed:
+            cache.put(key, found[key])
+    cache.commit()
+
+    if unreviewed:
+        logger.info(f"Review cache: {len(unreviewed)} unreviewed files not cached")
+        return {"issues": cached_issues + review.get("issues", []), "unreviewed": sorted(unreviewed)}
+    return {"issues": cached_issues + review.get("issues", [])}
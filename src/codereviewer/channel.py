@@ -0,0 +1,111 @@
+# in-process hand-back of the complex reviewer's findings.
+# the agent calls a submit_review tool served from this process (an SDK MCP server), so the
+# findings arrive as validated data without a Write turn or a shared file. every review also
+# gets its own scratch directory with a review.json path the agent can write to if the tool is
+# unavailable, so any number of complex reviews can run at once in one process or on one runner.
+
+import json
+import logging
+import shutil
+import tempfile
+
+from .providers import load_backend
+from .repair import ReviewRepairError, parse_review
+
+logger = logging.getLogger(__name__)
+
+SERVER_NAME = "codereviewer"
+TOOL_NAME = "submit_review"
+# the name the agent sees, and the one allowed_tools has to list
+QUALIFIED_TOOL_NAME = f"mcp__{SERVER_NAME}__{TOOL_NAME}"
+
+ISSUE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "category": {"type": "string", "enum": ["Security", "Logic", "Performance", "Maintainability"]},
+        "file": {"type": "string", "description": "Path relative to the repo root"},
+        "line": {"type": "integer", "description": "Line number in the new version of the file"},
+        "issue": {"type": "string", "description": "Brief description of the issue"},
+        "impact": {"type": "string", "description": "Why this matters / what could go wrong"},
+        "recommendation": {"type": "string", "description": "How to fix it"},
+    },
+    "required": ["category", "file", "line", "issue", "impact", "recommendation"],
+}
+REVIEW_SCHEMA = {
+    "type": "object",
+    "properties": {"issues": {"type": "array", "items": ISSUE_SCHEMA}},
+    "required": ["issues"],
+}
+
+
+class ReviewChannel:
+    """
+    Collects one complex review's findings, from the submit_review tool or the scratch file.
+
+    Usage:
+        with ReviewChannel() as channel:
+            options = ClaudeAgentOptions(mcp_servers=channel.mcp_servers(), ...)
+            ...
+            raw_review = channel.read()
+    """
+
+    def __init__(self):
+        self.issues: list[dict] = []
+        self.submissions = 0
+        self.scratch_dir = tempfile.mkdtemp(prefix="codereviewer-")
+        self.result_file = f"{self.scratch_dir}/review.json"
+
+    def submit(self, data: dict) -> int:
+        """
+        Validates and stores findings handed back by the agent.
+
+        Returns:
+            The number of issues stored.
+
+        Raises:
+            ReviewRepairError: If the findings do not validate.
+        """
+        review = parse_review(json.dumps(data))
+        self.issues.extend(issue.model_dump() for issue in review.issues)
+        self.submissions += 1
+        return len(review.issues)
+
+    def submit_tool(self):
+        """The submit_review tool, bound to this channel."""
+        channel = self
+
+        @load_backend("claude").tool(TOOL_NAME, "Submit your final code review findings. Call once, after your investigation.", REVIEW_SCHEMA)
+        async def submit_review(args: dict) -> dict:
+            try:
+                count = channel.submit(args)
+            except ReviewRepairError as e:
+                return {"content": [{"type": "text", "text": f"Invalid findings, fix and resubmit: {e}"}], "is_error": True}
+            return {"content": [{"type": "text", "text": f"Recorded {count} issues. You are done."}]}
+
+        return submit_review
+
+    def mcp_servers(self, tools: list | None = None) -> dict:
+        """The SDK MCP server config serving submit_review, and any extra tools, for this review."""
+        return {SERVER_NAME: load_backend("claude").create_sdk_mcp_server(SERVER_NAME, tools=[self.submit_tool(), *(tools or [])])}
+
+    def read(self) -> str | None:
+        """
+        The raw review: the submitted findings if the tool was used, else the scratch file, else None.
+        """
+        if self.submissions:
+            return json.dumps({"issues": self.issues})
+        try:
+            with open(self.result_file) as f:
+                logger.info(f"Read review from {self.result_file}")
+                return f.read()
+        except OSError:
+            return None
+
+    def close(self) -> None:
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+    def __enter__(self) -> "ReviewChannel":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,268 @@
+# token-budgeted diff context.
+# the diff is fetched with a few lines of context and each hunk is then grown from the new version
+# of the file: non-trivial hunks get their enclosing function or class (python via ast, other
+# languages via a definition-line heuristic), trivial hunks keep the small default context.
+# if the grown diff is over the token budget, the hunk with the most added context is shrunk
+# first, one hunk at a time, until it fits.
+
+import ast
+import asyncio
+import heapq
+import logging
+import os
+import re
+import subprocess
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from .diffs import FileDiff, Hunk, parse_diff
+from .job import workdir
+from .sharding import CHARS_PER_TOKEN, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTEXT_TOKEN_BUDGET = 40000
+# hunks with at most this many changed lines keep the diff's own context
+TRIVIAL_HUNK_LINES = 2
+# context added around a non-trivial hunk when no enclosing scope is found
+DEFAULT_SCOPE_LINES = 10
+# never add more than this many lines on either side of a hunk
+MAX_SCOPE_LINES = 80
+
+DEFINITION_RE = re.compile(
+    r"^\s*(?:(?:export|public|private|protected|internal|static|async|pub|override|abstract|final)\s+)*"
+    r"(?:def|class|function|func|fn|interface|struct|impl|enum|module|trait|object)\b"
+)
+# the name a definition line defines
+NAME_RE = re.compile(r"(?:def|class|function|func|fn|interface|struct|impl|enum|trait|object)\s+([A-Za-z_]\w*)")
+
+FileReader = Callable[[str], list[str] | None]
+
+
+def make_file_reader(head: str | None = None, cwd: str | None = None) -> FileReader:
+    """
+    Returns a function that loads the new version of a file as a list of lines.
+    Reads the working tree, or the given commit when reviewing a commit range.
+    The repository defaults to the job's checkout or the current directory.
+    """
+    cwd = cwd or workdir()
+    cache: dict[str, list[str] | None] = {}
+
+    def read(path: str) -> list[str] | None:
+        if path in cache:
+            return cache[path]
+        lines = None
+        try:
+            if head is None:
+                with open(os.path.join(cwd or ".", path), encoding="utf-8", errors="replace", newline="") as f:
+                    lines = f.read().split("\n")
+            else:
+                result = subprocess.run(["git", "show", f"{head}:{path}"], cwd=cwd, capture_output=True, check=True)
+                lines = result.stdout.decode("utf-8", errors="replace").split("\n")
+        except (OSError, subprocess.CalledProcessError):
+            lines = None
+        if lines is not None and lines and lines[-1] == "":
+            lines.pop()
+        cache[path] = lines
+        return lines
+
+    return read
+
+
+def _python_scopes(source: list[str]) -> list[tuple[int, int]] | None:
+    """Line ranges (1-based, inclusive) of every function and class, decorators included."""
+    try:
+        tree = ast.parse("\n".join(source))
+    except (SyntaxError, ValueError):
+        return None
+    scopes = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            start = min([node.lineno, *(d.lineno for d in node.decorator_list)])
+            scopes.append((start, node.end_lineno or node.lineno))
+    return scopes
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+
+def _heuristic_scope_start(source: list[str], line: int) -> int | None:
+    """Walks up from a line to the nearest less-indented definition line."""
+    if not 1 <= line <= len(source):
+        return None
+    indent = _indent(source[line - 1])
+    for number in range(line - 1, max(0, line - MAX_SCOPE_LINES) - 1, -1):
+        text = source[number]
+        if text.strip() and DEFINITION_RE.match(text) and (_indent(text) < indent or _indent(text) == 0):
+            return number + 1
+    return None
+
+
+def _changed_new_lines(hunk: Hunk) -> list[int]:
+    """New-file line numbers of the changed lines, deletions mapped to the line after them."""
+    lines, number = [], hunk.new_start
+    for line in hunk.lines:
+        if line.startswith("+"):
+            lines.append(number)
+            number += 1
+        elif line.startswith("-"):
+            lines.append(number)
+        elif not line.startswith("\\"):
+            number += 1
+    return lines
+
+
+@dataclass
+class _Expansion:
+    file_index: int
+    hunk_index: int
+    pre: int
+    post: int
+
+
+def _desired_scope(hunk: Hunk, source: list[str], scopes: list[tuple[int, int]] | None) -> tuple[int, int]:
+    """The new-file line range a hunk should be shown with."""
+    start, end = hunk.new_start, hunk.new_start + hunk.new_len - 1
+    changed = _changed_new_lines(hunk)
+    if len(changed) <= TRIVIAL_HUNK_LINES:
+        return start, end
+
+    first, last = min(changed), max(changed)
+    if scopes is not None:
+        enclosing = [s for s in scopes if s[0] <= first and last <= s[1]]
+        if enclosing:
+            # innermost scope that holds every changed line
+            scope_start, scope_end = max(enclosing, key=lambda s: s[0])
+            return min(start, scope_start), max(end, scope_end)
+    else:
+        scope_start = _heuristic_scope_start(source, first)
+        if scope_start is not None:
+            return min(start, scope_start), max(end, end + DEFAULT_SCOPE_LINES)
+    return min(start, first - DEFAULT_SCOPE_LINES), max(end, last + DEFAULT_SCOPE_LINES)
+
+
+def _expand_hunk(hunk: Hunk, source: list[str], pre: int, post: int) -> Hunk:
+    if not pre and not post:
+        return hunk
+    start, end = hunk.new_start, hunk.new_start + hunk.new_len
+    before = [" " + line for line in source[start - 1 - pre:start - 1]]
+    after = [" " + line for line in source[end - 1:end - 1 + post]]
+    section = hunk.header.split("@@", 2)[-1] if hunk.header.count("@@") >= 2 else ""
+    old_start, new_start = hunk.old_start - pre, hunk.new_start - pre
+    old_len, new_len = hunk.old_len + pre + post, hunk.new_len + pre + post
+    return Hunk(
+        header=f"@@ -{old_start},{old_len} +{new_start},{new_len} @@{section}",
+        old_start=old_start,
+        old_len=old_len,
+        new_start=new_start,
+        new_len=new_len,
+        lines=before + hunk.lines + after,
+    )
+
+
+def _context_tokens(source: list[str], start: int, end: int) -> int:
+    """Estimated tokens of the context lines source[start:end] (0-based, end exclusive)."""
+    return sum(len(line) + 2 for line in source[max(start, 0):max(end, 0)]) // CHARS_PER_TOKEN
+
+
+def build_context(files: list[FileDiff], read_file: FileReader, token_budget: int = DEFAULT_CONTEXT_TOKEN_BUDGET) -> list[FileDiff]:
+    """
+    Grows each hunk to the context it needs, within a token budget for the whole diff.
+
+    Args:
+        files: The parsed diff, fetched with small context.
+        read_file: Loads the new version of a file, see make_file_reader.
+        token_budget: Estimated tokens the expanded diff may use.
+
+    Returns:
+        New file diffs with expanded hunks. Line numbers of changed lines are unchanged.
+    """
+    sources: dict[int, list[str]] = {}
+    expansions: list[_Expansion] = []
+
+    for file_index, file in enumerate(files):
+        if file.binary or not file.hunks:
+            continue
+        source = read_file(file.path)
+        if source is None:
+            continue
+        sources[file_index] = source
+        scopes = _python_scopes(source) if file.path.endswith(".py") else None
+
+        for hunk_index, hunk in enumerate(file.hunks):
+            if hunk.new_len == 0 or hunk.old_len == 0:
+                continue
+            start, end = hunk.new_start, hunk.new_start + hunk.new_len - 1
+            want_start, want_end = _desired_scope(hunk, source, scopes)
+            # stay clear of the neighbouring hunks and the ends of the file
+            prev_end = 0
+            if hunk_index > 0:
+                prev = file.hunks[hunk_index - 1]
+                prev_end = prev.new_start + prev.new_len - 1
+            next_start = len(source) + 1
+            if hunk_index + 1 < len(file.hunks):
+                next_start = file.hunks[hunk_index + 1].new_start
+            want_start = max(want_start, prev_end + 1, 1, start - MAX_SCOPE_LINES)
+            want_end = min(want_end, next_start - 1, len(source), end + MAX_SCOPE_LINES)
+            pre, post = max(0, start - want_start), max(0, want_end - end)
+            if pre or post:
+                expansions.append(_Expansion(file_index, hunk_index, pre, post))
+
+    def extra_tokens(e: _Expansion) -> int:
+        hunk = files[e.file_index].hunks[e.hunk_index]
+        source = sources[e.file_index]
+        start, end = hunk.new_start - 1, hunk.new_start - 1 + hunk.new_len
+        return _context_tokens(source, start - e.pre, start) + _context_tokens(source, end, end + e.post)
+
+    base_tokens = sum(estimate_tokens(file.text) for file in files)
+    costs = {id(e): extra_tokens(e) for e in expansions}
+    total = base_tokens + sum(costs.values())
+
+    # shrink the most expensive expansion first until the diff fits
+    heap = [(-costs[id(e)], i, e) for i, e in enumerate(expansions)]
+    heapq.heapify(heap)
+    while total > token_budget and heap:
+        _, i, e = heapq.heappop(heap)
+        old_cost = costs[id(e)]
+        e.pre, e.post = e.pre // 2, e.post // 2
+        new_cost = extra_tokens(e)
+        costs[id(e)] = new_cost
+        total -= old_cost - new_cost
+        if e.pre or e.post:
+            heapq.heappush(heap, (-new_cost, i, e))
+
+    logger.info(f"Diff context: ~{base_tokens} tokens of diff, ~{total - base_tokens} tokens of added context (budget {token_budget})")
+
+    by_hunk = {(e.file_index, e.hunk_index): e for e in expansions}
+    expanded = []
+    for file_index, file in enumerate(files):
+        if file_index not in sources:
+            expanded.append(file)
+            continue
+        hunks = []
+        for hunk_index, hunk in enumerate(file.hunks):
+            e = by_hunk.get((file_index, hunk_index))
+            hunks.append(_expand_hunk(hunk, sources[file_index], e.pre, e.post) if e else hunk)
+        expanded.append(file.with_hunks(hunks))
+    return expanded
+
+
+def expand_diff_context(diff: str, read_file: FileReader, token_budget: int | None = None) -> str:
+    """
+    Parses a diff and returns it with context grown to fit the token budget.
+    """
+    token_budget = token_budget or int(os.getenv("REVIEW_CONTEXT_TOKEN_BUDGET", DEFAULT_CONTEXT_TOKEN_BUDGET))
+    return "".join(file.text for file in build_context(parse_diff(diff), read_file, token_budget))
+
+
+def with_context(review_fn, read_file: FileReader, token_budget: int | None = None):
+    """
+    Wraps a reviewer so the diff it receives has its context grown first.
+    The files are read in a thread, git show would otherwise block the other stages.
+    """
+    async def review_with_context(diff: str, summary: dict, **kwargs) -> dict:
+        expanded = await asyncio.to_thread(expand_diff_context, diff, read_file, token_budget)
+        return await review_fn(expanded, summary, **kwargs)
+
+    return review_with_context
@@ -1,30 +1,420 @@
+# git diff acquisition and parsing.
+# the base ref is fetched once (shallow when the checkout is shallow), then a single git diff is
+# parsed as it streams out of the subprocess into per-file records. the diff text and the
+# diff stat are both built from those records, so there is no second fetch or numstat run.
+# memory is bounded while parsing: a file whose diff is over REVIEW_DIFF_MAX_FILE_KB, and every file
+# once REVIEW_DIFF_MEMORY_MB of diff is held, is written to a spill directory as it streams and only
+# kept in memory as its header, its line counts and a one-line note. vendored dependencies and
+# regenerated fixtures end up there, they are never worth sending to a model anyway. files spilled
+# only because of the memory cap are marked over_memory, the run reports them as left out.
+
+import io
+import logging
+import os
+import re
+import shutil
 import subprocess
+import tempfile
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+
+from .job import current_job, workdir
+
+logger = logging.getLogger(__name__)
+
+HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+DEFAULT_CONTEXT_LINES = 35
+DEFAULT_MAX_FILE_KB = 512
+DEFAULT_MEMORY_MB = 64
+# header line that stands in for the hunks of a spilled file
+SPILLED_NOTE = "# codereviewer: diff too large, {lines} changed lines ({kb} KB) omitted"
+
+
+@dataclass
+class Hunk:
+    header: str
+    old_start: int
+    old_len: int
+    new_start: int
+    new_len: int
+    lines: list[str] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "\n".join([self.header, *self.lines]) + "\n"
+
+    @property
+    def insertions(self) -> int:
+        return sum(1 for line in self.lines if line.startswith("+"))
+
+    @property
+    def deletions(self) -> int:
+        return sum(1 for line in self.lines if line.startswith("-"))
+
+
+@dataclass
+class FileDiff:
+    path: str
+    header: list[str] = field(default_factory=list)
+    hunks: list[Hunk] = field(default_factory=list)
+    binary: bool = False
+    # set when the hunks were written to disk instead of kept, see iter_file_diffs
+    spill_path: str | None = None
+    spilled_insertions: int = 0
+    spilled_deletions: int = 0
+    # spilled because the memory cap was reached, not because the file itself is too large
+    over_memory: bool = False
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.header) + "\n" + "".join(hunk.text for hunk in self.hunks)
+
+    @property
+    def insertions(self) -> int:
+        return sum(hunk.insertions for hunk in self.hunks) + self.spilled_insertions
+
+    @property
+    def deletions(self) -> int:
+        return sum(hunk.deletions for hunk in self.hunks) + self.spilled_deletions
+
+    def with_hunks(self, hunks: list[Hunk]) -> "FileDiff":
+        """Returns a copy of this file diff that only carries the given hunks."""
+        return FileDiff(path=self.path, header=self.header, hunks=hunks, binary=self.binary)
+
+    def load_spilled(self) -> "FileDiff":
+        """The full diff of a spilled file, read back from disk. Other files are returned as they are."""
+        if self.spill_path is None:
+            return self
+        with open(self.spill_path, encoding="utf-8", errors="replace", newline="\n") as f:
+            return next(iter_file_diffs(line[:-1] if line.endswith("\n") else line for line in f))
+
+
+@dataclass
+class DiffResult:
+    files: list[FileDiff]
+    # where spilled files were written, removed by cleanup()
+    spill_dir: str | None = None
+
+    @property
+    def text(self) -> str:
+        return "".join(file.text for file in self.files)
+
+    @property
+    def stat(self) -> dict:
+        return compute_diff_stat(self.files)
+
+    @property
+    def spilled(self) -> list[FileDiff]:
+        return [file for file in self.files if file.spill_path is not None]
+
+    @property
+    def over_memory(self) -> list[FileDiff]:
+        return [file for file in self.files if file.over_memory]
+
+    def cleanup(self) -> None:
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+
+
+def _strip_prefix(path: str) -> str:
+    path = path.strip().strip('"')
+    if path.startswith(("a/", "b/")):
+        return path[2:]
+    return path
+
+
+def parse_hunk_header(line: str) -> Hunk | None:
+    match = HUNK_HEADER_RE.match(line)
+    if not match:
+        return None
+    old_start, old_len, new_start, new_len = match.groups()
+    return Hunk(
+        header=line,
+        old_start=int(old_start),
+        old_len=int(old_len) if old_len is not None else 1,
+        new_start=int(new_start),
+        new_len=int(new_len) if new_len is not None else 1,
+    )
+
+
+class _Spill:
+    """A file whose hunks stream to disk instead of memory."""
+
+    def __init__(self, file: FileDiff, spill_dir: str):
+        fd, file.spill_path = tempfile.mkstemp(prefix="file-", suffix=".diff", dir=spill_dir)
+        self.file = file
+        self.out = os.fdopen(fd, "w", encoding="utf-8", errors="surrogateescape", newline="\n")
+        self.out.write(file.text)
+        self.bytes = len(file.text)
+        file.spilled_insertions = sum(hunk.insertions for hunk in file.hunks)
+        file.spilled_deletions = sum(hunk.deletions for hunk in file.hunks)
+        file.hunks = []
+
+    def write(self, line: str) -> None:
+        self.out.write(line + "\n")
+        self.bytes += len(line) + 1
+        if line.startswith("+"):
+            self.file.spilled_insertions += 1
+        elif line.startswith("-"):
+            self.file.spilled_deletions += 1
+
+    def close(self) -> FileDiff:
+        self.out.close()
+        lines = self.file.spilled_insertions + self.file.spilled_deletions
+        self.file.header.append(SPILLED_NOTE.format(lines=lines, kb=self.bytes // 1024))
+        return self.file
 
-def get_diff():
-    subprocess.run(["git", "fetch", "origin"], check=True)
-    result = subprocess.run(["git", "diff", "-U35", "origin/main"], check=True, capture_output=True, text=True)
-    return result.stdout
 
-def get_diff_stat():
-    subprocess.run(["git", "fetch", "origin"], check=True)
-    result = subprocess.run(["git", "diff", "origin/main",  "--numstat"], check=True, capture_output=True, text=True)
+def iter_file_diffs(
+    lines: Iterable[str],
+    max_file_bytes: int | None = None,
+    max_total_bytes: int | None = None,
+    spill_dir: str | None = None,
+) -> Iterator[FileDiff]:
+    """
+    Parses unified git diff lines (without line endings) into per-file records,
+    yielding each file as soon as the next one starts.
 
-    files, insertions, deletions = [], 0, 0
+    Args:
+        lines: The diff lines.
+        max_file_bytes: A file whose diff grows past this is spilled to spill_dir.
+        max_total_bytes: Once the files kept in memory reach this, the rest are spilled too
+            and marked over_memory.
+        spill_dir: Where spilled files go. Without it nothing is spilled.
+    """
+    current: FileDiff | None = None
+    hunk: Hunk | None = None
+    spill: _Spill | None = None
+    size = total = 0
+    file_limit = max_file_bytes if spill_dir is not None and max_file_bytes else float("inf")
+    total_limit = max_total_bytes if spill_dir is not None and max_total_bytes else float("inf")
 
-    for line in result.stdout.splitlines():
-        if not line:
+    def finish() -> FileDiff:
+        nonlocal total
+        if spill is not None:
+            return spill.close()
+        total += size
+        return current
+
+    for line in lines:
+        if line.startswith("diff --git "):
+            if current is not None:
+                yield finish()
+            # fall back to the b/ side of the header until a ---/+++ pair names the file
+            current = FileDiff(path=_strip_prefix(line.split(" b/", 1)[-1]), header=[line])
+            hunk, spill, size = None, None, len(line) + 1
+            continue
+        if current is None:
             continue
-        parts = line.split("\t")
-        if len(parts) < 3:
+        if spill is not None:
+            spill.write(line)
             continue
-        ins, dels, file = parts
-        files.append(file)
-        insertions += int(ins)
-        deletions += int(dels)
+        size += len(line) + 1
+        if hunk is None or line.startswith("@@"):
+            new_hunk = parse_hunk_header(line) if line.startswith("@@") else None
+            if new_hunk is not None:
+                hunk = new_hunk
+                current.hunks.append(hunk)
+                continue
+            if hunk is None:
+                current.header.append(line)
+                if line.startswith("+++ ") and line[4:].strip() != "/dev/null":
+                    current.path = _strip_prefix(line[4:])
+                elif line.startswith("--- ") and line[4:].strip() != "/dev/null":
+                    current.path = _strip_prefix(line[4:])
+                elif line.startswith("rename to "):
+                    current.path = line[len("rename to "):].strip()
+                elif line.startswith("Binary files ") or line == "GIT binary patch":
+                    current.binary = True
+                continue
+        hunk.lines.append(line)
+        if size > file_limit or total + size > total_limit:
+            current.over_memory = size <= file_limit
+            spill = _Spill(current, spill_dir)
+
+    if current is not None:
+        yield finish()
+
+
+def parse_diff(diff: str) -> list[FileDiff]:
+    """
+    Parses unified git diff output into per-file records.
+
+    Args:
+        diff: The output of git diff.
+
+    Returns:
+        One FileDiff per file in the diff, in diff order.
+    """
+    return list(iter_file_diffs(_split_lines(diff)))
+
 
+def _split_lines(text: str, block: int = 1 << 20) -> Iterator[str]:
+    """The lines of text without line endings, split a block at a time instead of all at once."""
+    start, end = 0, len(text)
+    while start < end:
+        stop = text.find("\n", min(start + block, end - 1))
+        if stop == -1:
+            stop = end
+        yield from text[start:stop].split("\n")
+        start = stop + 1
+
+
+def compute_diff_stat(files: list[FileDiff]) -> dict:
+    """
+    Sums insertions and deletions over parsed file diffs, like git diff --numstat.
+    Binary files count as changed files with no lines.
+    """
+    insertions = deletions = 0
+    for file in files:
+        insertions += file.insertions
+        deletions += file.deletions
     return {
-        "files": files,
+        "files": [file.path for file in files],
         "insertions": insertions,
         "deletions": deletions,
         "total": insertions + deletions
-    }
\ No newline at end of file
+    }
+
+
+def _is_shallow(cwd: str | None = None) -> bool:
+    result = subprocess.run(
+        ["git", "rev-parse", "--is-shallow-repository"], cwd=cwd, capture_output=True, text=True
+    )
+    return result.stdout.strip() == "true"
+
+
+def get_base_branch() -> str:
+    """The branch the PR merges into, from the running service job or the action environment."""
+    job = current_job()
+    if job is not None and job.base_ref:
+        return job.base_ref
+    return os.getenv("GITHUB_BASE_REF") or "main"
+
+
+def fetch_base(branch: str, cwd: str | None = None) -> str:
+    """
+    Fetches only the base branch from origin, shallow when the checkout is shallow.
+
+    Returns:
+        The remote-tracking ref to diff against, e.g. origin/main.
+    """
+    depth = ["--depth=1"] if _is_shallow(cwd) else []
+    subprocess.run(
+        ["git", "fetch", "--no-tags", *depth, "origin", f"+refs/heads/{branch}:refs/remotes/origin/{branch}"],
+        cwd=cwd,
+        check=True,
+    )
+    return f"origin/{branch}"
+
+
+def fetch_commits(*shas: str, cwd: str | None = None) -> None:
+    """
+    Fetches the given commits from origin unless they are already present locally.
+    """
+    missing = [
+        sha for sha in shas
+        if subprocess.run(["git", "cat-file", "-e", f"{sha}^{{commit}}"], cwd=cwd, capture_output=True).returncode != 0
+    ]
+    if missing:
+        depth = ["--depth=1"] if _is_shallow(cwd) else []
+        subprocess.run(["git", "fetch", "--no-tags", *depth, "origin", *missing], cwd=cwd, check=True)
+
+
+def merge_base(base: str, head: str = "HEAD", cwd: str | None = None) -> str | None:
+    """
+    The commit the head branched off base, None when the history does not reach it (e.g. a shallow checkout).
+    """
+    result = subprocess.run(["git", "merge-base", base, head], cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip() or None
+
+
+def stream_diff(
+    refs: list[str],
+    context: int = DEFAULT_CONTEXT_LINES,
+    cwd: str | None = None,
+    spill_dir: str | None = None,
+) -> Iterator[FileDiff]:
+    """
+    Runs git diff once and yields per-file records while the output is still streaming.
+    With a spill_dir, files over REVIEW_DIFF_MAX_FILE_KB, and all files once REVIEW_DIFF_MEMORY_MB
+    is held, are written there instead of kept in memory.
+
+    Raises:
+        subprocess.CalledProcessError: If git diff fails.
+    """
+    max_file_bytes = int(os.getenv("REVIEW_DIFF_MAX_FILE_KB", DEFAULT_MAX_FILE_KB)) * 1024
+    max_total_bytes = int(os.getenv("REVIEW_DIFF_MEMORY_MB", DEFAULT_MEMORY_MB)) * 1024 * 1024
+    cmd = ["git", "diff", "--no-color", "--no-ext-diff", f"-U{context}", *refs]
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        # split on \n only, so \r and form feeds inside source lines stay part of the line
+        stdout = io.TextIOWrapper(proc.stdout, encoding="utf-8", errors="replace", newline="\n")
+        lines = (line[:-1] if line.endswith("\n") else line for line in stdout)
+        yield from iter_file_diffs(lines, max_file_bytes, max_total_bytes, spill_dir)
+    finally:
+        proc.stdout.close()
+        stderr = proc.stderr.read()
+        proc.stderr.close()
+        returncode = proc.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+
+
+def acquire_diff(
+    base: str | None = None,
+    head: str | None = None,
+    context: int = DEFAULT_CONTEXT_LINES,
+    cwd: str | None = None,
+) -> DiffResult:
+    """
+    Fetches what is needed and parses the diff in a single pass.
+
+    Args:
+        base: The commit to diff from. Defaults to where the checkout branched off the fetched base
+            branch, so commits that landed on the base since do not show up as reverted.
+        head: The commit to diff to. Defaults to the working tree.
+        context: Lines of context around each hunk.
+        cwd: The repository to run git in, defaults to the job's checkout or the current directory.
+
+    Returns:
+        The parsed diff, with text and stat computed from the same records. Call cleanup()
+        on it when done, oversized files are spilled to a temporary directory.
+    """
+    cwd = cwd or workdir()
+    if base is None:
+        branch = fetch_base(get_base_branch(), cwd)
+        base = merge_base(branch, cwd=cwd)
+        if base is None:
+            # a merge ref checkout has the base as its first parent, the branch tip is right there
+            logger.warning(f"No merge base of HEAD and {branch} in the fetched history, diffing against {branch}")
+            base = branch
+    elif head is not None:
+        fetch_commits(base, head, cwd=cwd)
+    refs = [base] if head is None else [base, head]
+    result = DiffResult(files=[], spill_dir=tempfile.mkdtemp(prefix="codereviewer-diff-"))
+    try:
+        result.files = list(stream_diff(refs, context, cwd, result.spill_dir))
+    except BaseException:
+        result.cleanup()
+        raise
+    if result.spilled:
+        kb = sum(os.path.getsize(file.spill_path) for file in result.spilled) // 1024
+        logger.info(f"Diff: {len(result.spilled)} files ({kb} KB) spilled to disk and left out of review")
+    if result.over_memory:
+        logger.warning(f"Diff: {len(result.over_memory)} files spilled only because REVIEW_DIFF_MEMORY_MB was reached")
+    return result
+
+
+def get_diff(base: str | None = None, head: str | None = None) -> str:
+    result = acquire_diff(base, head)
+    result.cleanup()
+    return result.text
+
+def get_diff_stat(base: str | None = None, head: str | None = None) -> dict:
+    result = acquire_diff(base, head)
+    result.cleanup()
+    return result.stat
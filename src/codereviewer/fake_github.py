@@ -0,0 +1,213 @@
+# local stand-in for the slice of the GitHub REST API the reviewer uses.
+# keeps PRs, comments and reviews in memory, validates inline comment lines, and can inject
+# throttling (429 + Retry-After, exhausted X-RateLimit-*) and 5xx errors so throughput and
+# retry behaviour can be tested offline. point GITHUB_API_URL at FakeGitHub.url to use it.
+
+import json
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+@dataclass
+class FakePullRequest:
+    number: int
+    head_sha: str = "0" * 40
+    base_ref: str = "main"
+    # path -> lines that accept inline comments; paths not listed accept any line
+    commentable_lines: dict[str, set[int]] = field(default_factory=dict)
+    comments: list[dict] = field(default_factory=list)
+    reviews: list[dict] = field(default_factory=list)
+    review_comments: list[dict] = field(default_factory=list)
+
+
+@dataclass
+class _Fault:
+    status: int
+    headers: dict[str, str]
+
+
+class FakeGitHub:
+    """
+    In-memory fake GitHub server running on a background thread.
+
+    Usage:
+        with FakeGitHub() as github:
+            github.add_pull_request("owner/repo", 1, head_sha="abc...")
+            os.environ["GITHUB_API_URL"] = github.url
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.pull_requests: dict[tuple[str, int], FakePullRequest] = {}
+        # (base, head) -> compare status, anything not listed is "ahead"
+        self.compare_status: dict[tuple[str, str], str] = {}
+        self.requests: list[tuple[float, str, str, int]] = []
+        self._faults: list[_Fault] = []
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._server: ThreadingHTTPServer | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def add_pull_request(self, repo: str, number: int, **kwargs) -> FakePullRequest:
+        pr = FakePullRequest(number=number, **kwargs)
+        self.pull_requests[(repo, number)] = pr
+        return pr
+
+    def fail_next(self, count: int = 1, status: int = 502, headers: dict[str, str] | None = None) -> None:
+        """Makes the next count requests fail with the given status and headers."""
+        with self._lock:
+            self._faults.extend(_Fault(status, headers or {}) for _ in range(count))
+
+    def throttle_next(self, count: int = 1, retry_after: float = 0) -> None:
+        """Makes the next count requests hit the secondary rate limit."""
+        self.fail_next(count, 429, {"Retry-After": str(retry_after)})
+
+    def exhaust_rate_limit(self, count: int = 1, reset_in: float = 0) -> None:
+        """Makes the next count requests hit the primary rate limit."""
+        headers = {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(time.time() + reset_in))}
+        self.fail_next(count, 403, headers)
+
+    def start(self) -> "FakeGitHub":
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                payload = json.loads(raw) if raw else None
+                status, headers, body = fake._dispatch(self.command, self.path.split("?")[0], payload)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = do_PUT = _handle
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeGitHub":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _new_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def _dispatch(self, method: str, path: str, payload: dict | None) -> tuple[int, dict, object]:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            fault = self._faults.pop(0) if self._faults else None
+        if fault is not None:
+            self.requests.append((time.time(), method, path, fault.status))
+            return fault.status, fault.headers, {"message": "injected failure"}
+
+        with self._lock:
+            status, body = self._route(method, path, payload)
+        self.requests.append((time.time(), method, path, status))
+        return status, {"X-RateLimit-Remaining": "5000"}, body
+
+    def _route(self, method: str, path: str, payload: dict | None) -> tuple[int, object]:
+        match = re.fullmatch(r"/repos/([^/]+/[^/]+)/(.+)", path)
+        if not match:
+            return 404, {"message": "Not Found"}
+        repo, rest = match.groups()
+
+        if m := re.fullmatch(r"compare/([^.]+)\.\.\.(.+)", rest):
+            return 200, {"status": self.compare_status.get(m.groups(), "ahead")}
+
+        if m := re.fullmatch(r"issues/comments/(\d+)", rest):
+            comment = next(
+                (c for pr in self.pull_requests.values() for c in pr.comments if c["id"] == int(m.group(1))), None
+            )
+            if comment is None:
+                return 404, {"message": "Not Found"}
+            if method == "PATCH":
+                comment["body"] = payload["body"]
+            return 200, comment
+
+        if m := re.fullmatch(r"pulls/(\d+)/reviews/(\d+)", rest):
+            pr = self.pull_requests.get((repo, int(m.group(1))))
+            review = next((r for r in pr.reviews if r["id"] == int(m.group(2))), None) if pr else None
+            if review is None:
+                return 404, {"message": "Not Found"}
+            if method == "PUT":
+                review["body"] = payload["body"]
+            return 200, review
+
+        if not (m := re.fullmatch(r"(pulls|issues)/(\d+)(?:/(\w+))?", rest)):
+            return 404, {"message": "Not Found"}
+        kind, number, sub = m.group(1), int(m.group(2)), m.group(3)
+        pr = self.pull_requests.get((repo, number))
+        if pr is None:
+            return 404, {"message": "Not Found"}
+        now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+        if kind == "pulls" and sub is None and method == "GET":
+            return 200, {"number": pr.number, "head": {"sha": pr.head_sha}, "base": {"ref": pr.base_ref}}
+
+        if kind == "issues" and sub == "comments":
+            if method == "GET":
+                return 200, pr.comments
+            comment = {"id": self._new_id(), "body": payload["body"], "created_at": now}
+            pr.comments.append(comment)
+            return 201, comment
+
+        if kind == "pulls" and sub == "reviews":
+            if method == "GET":
+                return 200, pr.reviews
+            comments = payload.get("comments") or []
+            for comment in comments:
+                if not self._commentable(pr, comment):
+                    return 422, {"message": "Unprocessable Entity", "errors": ["Line could not be resolved"]}
+            if not comments and not payload.get("body"):
+                return 422, {"message": "Unprocessable Entity", "errors": ["Review body is required"]}
+            review = {"id": self._new_id(), "body": payload.get("body", ""), "submitted_at": now}
+            pr.reviews.append(review)
+            pr.review_comments.extend(comments)
+            return 200, review
+
+        if kind == "pulls" and sub == "comments" and method == "POST":
+            if not self._commentable(pr, payload):
+                return 422, {"message": "Unprocessable Entity", "errors": ["Line could not be resolved"]}
+            comment = {"id": self._new_id(), **payload}
+            pr.review_comments.append(comment)
+            return 201, comment
+
+        return 404, {"message": "Not Found"}
+
+    @staticmethod
+    def _commentable(pr: FakePullRequest, comment: dict) -> bool:
+        if comment.get("subject_type") == "file":
+            return True
+        lines = pr.commentable_lines.get(comment.get("path"))
+        return lines is None or comment.get("line") in lines
@@ -1,56 +1,574 @@
+# async GitHub REST client used for everything the reviewer reads from or posts to a PR.
+# one pooled keep-alive http session per event loop, a semaphore that bounds concurrent
+# requests, and retries that wait out Retry-After / X-RateLimit-Reset on throttling and
+# back off on 5xx and connection errors. GITHUB_API_URL points it at GitHub Enterprise or
+# at the local fake server in fake_github.py.
+# comment lines are checked against the PR diff's hunks before posting (see positions.py), so
+# findings off the diff are moved onto it or posted file-level instead of costing a 422.
+
+import asyncio
 import os
+import random
+import re
 import logging
-from github import Github
+import time
+from dataclasses import dataclass
+
+import httpx
+
+from .job import current_job
+from .positions import LineIndex
+from .telemetry import record
 
 logger = logging.getLogger(__name__)
 
-def post_comments_and_summary(review: dict, summary: dict) -> None:
+DEFAULT_API_URL = "https://api.github.com"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# never sleep longer than this for one retry, even if the rate limit resets later
+MAX_RETRY_WAIT = 60.0
+
+# hidden marker in the summary comment that records the head commit the review covered,
+# so the next push can be reviewed incrementally from there
+REVIEWED_SHA_MARKER = "<!-- codereviewer:reviewed-sha={sha} -->"
+REVIEWED_SHA_RE = re.compile(r"<!-- codereviewer:reviewed-sha=([0-9a-f]{7,40}) -->")
+
+
+class GitHubAPIError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"{status} {message}")
+        self.status = status
+        self.message = message
+
+
+@dataclass(frozen=True)
+class PullRequestRef:
+    repo: str
+    number: int
+
+
+def _retry_wait(response: httpx.Response | None, attempt: int, backoff: float = 1.0) -> float | None:
     """
-    Posts the comments and summary to the GitHub PR.
+    How long to wait before retrying a response, or None if it should not be retried.
+    """
+    if response is not None:
+        throttled = response.status_code == 429 or (
+            response.status_code == 403
+            and (response.headers.get("x-ratelimit-remaining") == "0" or "retry-after" in response.headers)
+        )
+        if not throttled and response.status_code not in RETRY_STATUSES:
+            return None
+        retry_after = response.headers.get("retry-after")
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), MAX_RETRY_WAIT)
+            except ValueError:
+                pass
+        if response.headers.get("x-ratelimit-remaining") == "0":
+            reset = float(response.headers.get("x-ratelimit-reset", time.time()))
+            return min(max(reset - time.time(), 0.0) + 1.0, MAX_RETRY_WAIT)
+    # exponential backoff with jitter for 5xx and connection errors
+    return min(backoff * (2 ** attempt + random.random()), MAX_RETRY_WAIT)
+
+
+class GitHubClient:
+    """
+    Pooled async client for the GitHub REST API with bounded concurrency and retries.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        api_url: str | None = None,
+        max_concurrency: int = 8,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+    ):
+        self.api_url = (api_url or DEFAULT_API_URL).rstrip("/")
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.retries = 0
+        self.requests = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._http = httpx.AsyncClient(
+            base_url=self.api_url,
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Accept": "application/vnd.github+json",
+                "X-GitHub-Api-Version": "2022-11-28",
+                "User-Agent": "codereviewer",
+            },
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            timeout=httpx.Timeout(30, connect=10),
+        )
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """
+        Sends a request, retrying throttled, 5xx and failed-connection attempts.
+
+        Raises:
+            GitHubAPIError: If the final response is not a success.
+        """
+        attempt = 0
+        while True:
+            response, error = None, None
+            async with self._semaphore:
+                try:
+                    self.requests += 1
+                    response = await self._http.request(method, path, **kwargs)
+                    record(requests=1, bytes_out=len(response.request.content), bytes_in=len(response.content))
+                except httpx.TransportError as e:
+                    error = e
+                    record(requests=1)
+            if response is not None and response.is_success:
+                return response
+
+            wait = _retry_wait(response, attempt, self.backoff)
+            if wait is None or attempt >= self.max_retries:
+                if response is None:
+                    raise GitHubAPIError(0, f"{method} {path} failed: {error}")
+                raise GitHubAPIError(response.status_code, f"{method} {path}: {response.text[:200]}")
+
+            status = response.status_code if response is not None else error
+            logger.warning(f"GitHub {method} {path} got {status}, retrying in {wait:.1f}s")
+            attempt += 1
+            self.retries += 1
+            record(retries=1)
+            await asyncio.sleep(wait)
+
+    async def paginate(self, path: str, per_page: int = 100) -> list[dict]:
+        """
+        Fetches every page of a list endpoint by following the Link header.
+        """
+        items = []
+        response = await self.request("GET", path, params={"per_page": per_page})
+        while True:
+            items.extend(response.json())
+            next_url = response.links.get("next", {}).get("url")
+            if not next_url:
+                return items
+            response = await self.request("GET", next_url)
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+
+_loop: asyncio.AbstractEventLoop | None = None
+_client: GitHubClient | None = None
+
+
+def get_client() -> GitHubClient | None:
+    """
+    Returns the shared GitHub client for the running event loop, or None without a token.
+    """
+    global _loop, _client
+    loop = asyncio.get_running_loop()
+    if _client is not None and _loop is loop:
+        return _client
+    token = os.getenv("GITHUB_TOKEN")
+    if not token:
+        logger.error("Missing GITHUB_TOKEN")
+        return None
+    _loop = loop
+    _client = GitHubClient(
+        token,
+        api_url=os.getenv("GITHUB_API_URL"),
+        max_concurrency=int(os.getenv("GITHUB_MAX_CONCURRENCY", "8")),
+        max_retries=int(os.getenv("GITHUB_MAX_RETRIES", "5")),
+    )
+    return _client
+
+
+async def aclose_client() -> None:
     """
-    github_token = os.getenv("GITHUB_TOKEN")
+    Closes the shared GitHub client. Call once at the end of a run.
+    """
+    global _client
+    if _client is not None:
+        logger.info(f"GitHub: {_client.requests} requests, {_client.retries} retries")
+        if _loop is asyncio.get_running_loop():
+            await _client.aclose()
+    _client = None
+
+
+def pull_request_from_env() -> PullRequestRef | None:
+    """
+    Reads the PR this run is reviewing: the running service job's, else the action environment's.
+
+    Returns:
+        The PR, or None if the environment is incomplete.
+    """
+    job = current_job()
+    if job is not None:
+        return PullRequestRef(job.repo, job.number)
+
     repo_name = os.getenv("GITHUB_REPOSITORY")
     pr_number_str = os.getenv("GITHUB_PULL_REQUEST_NUMBER")
-    
-    logger.info(f"Starting to post comments - repo: {repo_name}, pr_number: {pr_number_str}")
-    
-    if not github_token or not repo_name or not pr_number_str:
-        logger.error(f"Missing required environment variables - token: {bool(github_token)}, repo: {bool(repo_name)}, pr_number: {bool(pr_number_str)}")
-        return
-    
-    try:
-        pr_number = int(pr_number_str)
+
+    logger.debug(f"Looking up PR - repo: {repo_name}, pr_number: {pr_number_str}")
+
+    if not repo_name or not pr_number_str:
+        logger.error(f"Missing required environment variables - repo: {bool(repo_name)}, pr_number: {bool(pr_number_str)}")
+        return None
+
+    try:
+        return PullRequestRef(repo_name, int(pr_number_str))
     except ValueError:
         logger.error(f"Invalid PR number format: {pr_number_str}")
-        return
-    
-    try:
-        gh_client = Github(github_token)
-        repo = gh_client.get_repo(repo_name)
-        pr = repo.get_pull(pr_number)
-        
-        # post the summary comment at the top of the pr
+        return None
+
+
+def _resolve(pr: PullRequestRef | None) -> tuple[GitHubClient, PullRequestRef] | None:
+    pr = pr or pull_request_from_env()
+    client = get_client()
+    if pr is None or client is None:
+        return None
+    return client, pr
+
+
+async def get_head_sha(pr: PullRequestRef | None = None) -> str | None:
+    """
+    Returns the head commit of the PR, or None if the PR can't be reached.
+    """
+    try:
+        resolved = _resolve(pr)
+        if resolved is None:
+            return None
+        client, pr = resolved
+        response = await client.request("GET", f"/repos/{pr.repo}/pulls/{pr.number}")
+        return response.json()["head"]["sha"]
+    except Exception as e:
+        logger.error(f"❌ Failed to authenticate or access PR: {e}", exc_info=True)
+        return None
+
+
+async def get_incremental_base(head_sha: str, pr: PullRequestRef | None = None) -> str | None:
+    """
+    Finds the last head commit a previous run reviewed, if the new head builds on it.
+
+    Args:
+        head_sha: The current head commit of the PR.
+        pr: The PR, defaults to the one in the action environment.
+
+    Returns:
+        The last reviewed commit, or None when the whole PR has to be reviewed
+        (first run, or the branch was force-pushed since).
+    """
+    try:
+        resolved = _resolve(pr)
+        if resolved is None:
+            return None
+        client, pr = resolved
+
+        # the marker is in the summary comment or in the body of a batched review
+        comments, reviews = await asyncio.gather(
+            client.paginate(f"/repos/{pr.repo}/issues/{pr.number}/comments"),
+            client.paginate(f"/repos/{pr.repo}/pulls/{pr.number}/reviews"),
+        )
+        last_sha, last_time = None, ""
+        for item in [*comments, *reviews]:
+            match = REVIEWED_SHA_RE.search(item.get("body") or "")
+            # ISO 8601 timestamps in UTC sort as strings
+            created = item.get("created_at") or item.get("submitted_at") or ""
+            if match and created >= last_time:
+                last_sha, last_time = match.group(1), created
+        if last_sha is None:
+            logger.info("No earlier review found, reviewing the whole PR")
+            return None
+
+        # the compare is relative to last_sha, so "ahead" means head still contains it
+        response = await client.request("GET", f"/repos/{pr.repo}/compare/{last_sha}...{head_sha}")
+        status = response.json()["status"]
+        if status not in ("ahead", "identical"):
+            logger.info(f"Head {head_sha[:7]} is {status} of last reviewed {last_sha[:7]} (force-push?), reviewing the whole PR")
+            return None
+
+        logger.info(f"Last reviewed commit {last_sha[:7]}, reviewing {last_sha[:7]}..{head_sha[:7]}")
+        return last_sha
+
+    except Exception as e:
+        logger.warning(f"Could not find last reviewed commit, reviewing the whole PR: {e}")
+        return None
+
+
+async def post_summary(summary: dict, pr: PullRequestRef | None = None) -> int | None:
+    """
+    Posts the summary comment at the top of the GitHub PR.
+
+    Returns:
+        The id of the summary comment, or None if it could not be posted.
+    """
+    try:
+        resolved = _resolve(pr)
+        if resolved is None:
+            return None
+        client, pr = resolved
+
         summary_comment = f"## Code Review Summary\n\n{summary['summary']}"
-        summary_result = pr.create_issue_comment(summary_comment)
+        response = await client.request(
+            "POST", f"/repos/{pr.repo}/issues/{pr.number}/comments", json={"body": summary_comment}
+        )
         logger.info(f"✅ Summary comment posted")
+        return response.json()["id"]
+
+    except Exception as e:
+        logger.error(f"❌ Failed to authenticate or access PR: {e}", exc_info=True)
+        return None
+
+
+async def _append_to_comment(client: GitHubClient, pr: PullRequestRef, comment_id: int, text: str) -> None:
+    path = f"/repos/{pr.repo}/issues/comments/{comment_id}"
+    body = (await client.request("GET", path)).json()["body"]
+    await client.request("PATCH", path, json={"body": f"{body}\n\n{text}"})
+
+
+async def mark_reviewed(comment_id: int, head_sha: str, pr: PullRequestRef | None = None) -> None:
+    """
+    Records the reviewed head commit in a hidden marker in the summary comment.
+    Only called once the review comments are posted, so a failed run is reviewed again in full.
+    """
+    try:
+        resolved = _resolve(pr)
+        if resolved is None:
+            return
+        client, pr = resolved
+
+        await _append_to_comment(client, pr, comment_id, REVIEWED_SHA_MARKER.format(sha=head_sha))
+        logger.info(f"✅ Marked {head_sha[:7]} as reviewed")
+
+    except Exception as e:
+        logger.error(f"❌ Failed to mark {head_sha[:7]} as reviewed: {e}", exc_info=True)
+
+
+async def annotate_summary(comment_id: int, note: str, pr: PullRequestRef | None = None) -> None:
+    """
+    Appends a note to the summary comment, e.g. what a partial review left out.
+    """
+    try:
+        resolved = _resolve(pr)
+        if resolved is None:
+            return
+        client, pr = resolved
+
+        await _append_to_comment(client, pr, comment_id, note)
+        logger.info(f"✅ Added note to the summary comment")
+
+    except Exception as e:
+        logger.error(f"❌ Failed to add note to the summary comment: {e}", exc_info=True)
+
+
+def format_issue(issue: dict) -> str:
+    return f"**{issue['category']}**: {issue['issue']}\n\n**Impact**: {issue['impact']}\n\n**Recommendation**: {issue['recommendation']}"
+
+
+def issue_comments(issues: list[dict], positions: LineIndex | None = None) -> list[dict]:
+    """
+    The review comment payloads for issues. With a line index each line is checked against the
+    PR diff first: lines near a hunk are moved onto it, others become file-level comments, and
+    issues on files outside the PR are dropped.
+
+    Args:
+        issues: The issues to post.
+        positions: The line index of the PR diff, None to post every line as reported.
+
+    Returns:
+        Inline comments (path, line, side, body) and file-level comments (path, subject_type, body).
+    """
+    if positions is None:
+        return [
+            {"path": issue["file"], "line": issue["line"], "side": "RIGHT", "body": format_issue(issue)}
+            for issue in issues
+        ]
+    comments, moved, file_level, dropped = [], 0, 0, 0
+    for issue in issues:
+        placement = positions.place(issue["file"], issue["line"])
+        if placement is None:
+            dropped += 1
+            logger.warning(f"Dropping finding on {issue['file']}:{issue['line']}, the file is not part of the PR")
+            continue
+        body = format_issue(issue)
+        if placement.line is None:
+            file_level += 1
+            body = f"{body}\n\n_Reported for line {placement.reported}, which is outside the diff._"
+            comments.append({"path": placement.path, "subject_type": "file", "body": body})
+            continue
+        if placement.moved:
+            moved += 1
+            body = f"{body}\n\n_Reported for line {placement.reported}, moved to the nearest line in the diff._"
+        comments.append({"path": placement.path, "line": placement.line, "side": "RIGHT", "body": body})
+    if moved or file_level or dropped:
+        logger.info(f"Comment lines: {moved} moved onto the diff, {file_level} file-level, {dropped} dropped")
+        record(comments_moved=moved, comments_file_level=file_level, comments_dropped=dropped)
+    return comments
+
+
+async def _submit_review(
+    client: GitHubClient,
+    pr: PullRequestRef,
+    head_sha: str,
+    comments: list[dict],
+    body: str | None,
+    marker: str | None = None,
+) -> int:
+    """
+    Submits the comments as one review. If GitHub rejects the batch as unprocessable (422,
+    usually a line outside the diff) it is split in half and retried, so one bad line only
+    costs its own chunk. The marker is added to the review body at the end, and only if
+    every comment was posted.
+
+    Returns:
+        The number of comments posted.
+
+    Raises:
+        GitHubAPIError: On any other error, splitting would only repeat it for every chunk.
+    """
+    path = f"/repos/{pr.repo}/pulls/{pr.number}/reviews"
+    # a review only takes line comments, file-level ones are posted on their own below
+    file_level = [comment for comment in comments if comment.get("subject_type") == "file"]
+    comments = [comment for comment in comments if comment.get("subject_type") != "file"]
+    pending = [comments] if comments else []
+    body_left = body
+    # the review that carries the body, the marker is added to it once everything is posted
+    body_review = None
+    posted = 0
+    while pending:
+        chunk = pending.pop(0)
+        payload = {"commit_id": head_sha, "event": "COMMENT", "comments": chunk}
+        if body_left:
+            payload["body"] = body_left
+        try:
+            response = await client.request("POST", path, json=payload)
+            if body_left:
+                body_review = response.json()["id"]
+            body_left = None
+            posted += len(chunk)
+        except GitHubAPIError as e:
+            if e.status != 422:
+                raise
+            if len(chunk) > 1:
+                logger.warning(f"Review with {len(chunk)} comments rejected ({e.status}), retrying in smaller chunks")
+                mid = len(chunk) // 2
+                pending[:0] = [chunk[:mid], chunk[mid:]]
+            else:
+                logger.error(f"❌ Error posting comment for {chunk[0]['path']}:{chunk[0]['line']}: {e}")
+
+    if body_left:
+        response = await client.request("POST", path, json={"commit_id": head_sha, "event": "COMMENT", "body": body_left})
+        body_review = response.json()["id"]
+    for comment in file_level:
+        try:
+            await client.request("POST", f"/repos/{pr.repo}/pulls/{pr.number}/comments", json={"commit_id": head_sha, **comment})
+            posted += 1
+        except GitHubAPIError as e:
+            logger.error(f"❌ Error posting file comment for {comment['path']}: {e}")
+
+    if marker and body_review is not None:
+        if posted == len(comments) + len(file_level):
+            await client.request("PUT", f"{path}/{body_review}", json={"body": f"{body}\n\n{marker}"})
+        else:
+            logger.warning(f"{len(comments) + len(file_level) - posted} comments could not be posted, not adding the marker")
+    return posted
+
+
+async def post_review(
+    review: dict,
+    summary: dict | None = None,
+    head_sha: str | None = None,
+    pr: PullRequestRef | None = None,
+    mark: bool = True,
+    positions: LineIndex | None = None,
+) -> bool:
+    """
+    Posts all issues, and the summary if given, as one pull request review.
+    Once every comment is posted, the review body gets the reviewed-sha marker for incremental reviews.
+
+    Args:
+        review: The review dictionary.
+        summary: The summary to put in the review body, None if it was posted already.
+        head_sha: The head commit that was reviewed.
+        pr: The PR, defaults to the one in the action environment.
+        mark: Add the reviewed-sha marker if every comment is posted, False for a partial review.
+        positions: The line index of the PR diff, to place comments before posting.
+
+    Returns:
+        True if the review and all its comments were posted, False if there was nothing to post,
+        a comment could not be posted or the PR could not be reached.
+    """
+    issues = review.get("issues", [])
+    if not issues and summary is None:
+        return False
+
+    try:
+        resolved = _resolve(pr)
+        if resolved is None:
+            return False
+        client, pr = resolved
+
+        head_sha = head_sha or await get_head_sha(pr)
+        body = f"## Code Review Summary\n\n{summary['summary']}" if summary is not None else f"Code review found {len(issues)} issues."
+        marker = REVIEWED_SHA_MARKER.format(sha=head_sha) if mark else None
+        comments = issue_comments(issues, positions)
+
+        logger.info(f"Posting review with {len(comments)} inline comments...")
+        posted = await _submit_review(client, pr, head_sha, comments, body, marker)
+        logger.info(f"✅ Review posted with {posted}/{len(comments)} comments")
+        return posted == len(comments)
+
+    except Exception as e:
+        logger.error(f"❌ Failed to authenticate or access PR: {e}", exc_info=True)
+        return False
+
+
+async def post_comments(review: dict, pr: PullRequestRef | None = None, positions: LineIndex | None = None) -> bool:
+    """
+    Posts the review issues as inline comments on the GitHub PR, a few at a time.
+    With the line index of the PR diff the lines are placed first, see issue_comments.
+
+    Returns:
+        True if every comment was posted, False if one failed or the PR could not be reached.
+    """
+    try:
+        resolved = _resolve(pr)
+        if resolved is None:
+            return False
+        client, pr = resolved
 
         # go through the review and post the comments on their respective lines
         issues = review.get("issues", [])
         logger.info(f"Posting {len(issues)} inline comments...")
-        
-        for issue in issues:
-            comment_body = f"**{issue['category']}**: {issue['issue']}\n\n**Impact**: {issue['impact']}\n\n**Recommendation**: {issue['recommendation']}"
+
+        head_sha = await get_head_sha(pr)
+        if head_sha is None:
+            return False
+
+        async def post_one(comment: dict) -> bool:
             try:
-                pr.create_review_comment(
-                    body=comment_body,
-                    commit=pr.head.sha,
-                    path=issue['file'],
-                    line=issue['line']
+                await client.request(
+                    "POST",
+                    f"/repos/{pr.repo}/pulls/{pr.number}/comments",
+                    json={"commit_id": head_sha, **comment},
                 )
-            except Exception as e:
-                logger.error(f"❌ Error posting comment for {issue['file']}:{issue['line']}: {e}", exc_info=True)
+                return True
+            except GitHubAPIError as e:
+                logger.error(f"❌ Error posting comment for {comment['path']}:{comment.get('line', 'file')}: {e}")
+                return False
+
+        results = await asyncio.gather(*(post_one(comment) for comment in issue_comments(issues, positions)))
 
+        failed = results.count(False)
+        if failed:
+            logger.warning(f"{failed} of {len(results)} comments could not be posted")
+            return False
         logger.info(f"✅ All comments posted successfully!")
-        
+        return True
+
     except Exception as e:
-        logger.error(f"❌ Failed to authenticate or access PR: {e}", exc_info=True)
\ No newline at end of file
+        logger.error(f"❌ Failed to authenticate or access PR: {e}", exc_info=True)
+        return False
+
+
+async def post_comments_and_summary(review: dict, summary: dict) -> None:
+    """
+    Posts the comments and summary to the GitHub PR.
+    """
+    await post_summary(summary)
+    await post_comments(review)
@@ -0,0 +1,53 @@
+# the PR a review is running for.
+# a one-shot action run reviews the PR in its environment (GITHUB_REPOSITORY,
+# GITHUB_PULL_REQUEST_NUMBER, GITHUB_BASE_REF) from the current directory. in service mode many
+# reviews run in one process, so each one runs inside running(job) and the GitHub client, diff
+# acquisition and reviewers read the PR, base branch and checkout from the job instead.
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+
+@dataclass
+class ReviewJob:
+    repo: str
+    number: int
+    head_sha: str | None = None
+    base_ref: str | None = None
+    clone_url: str | None = None
+    # the checkout the review runs in, set once it is prepared
+    workdir: str | None = None
+
+    @property
+    def key(self) -> tuple[str, int]:
+        return (self.repo, self.number)
+
+    def __str__(self) -> str:
+        sha = f"@{self.head_sha[:7]}" if self.head_sha else ""
+        return f"{self.repo}#{self.number}{sha}"
+
+
+_current: ContextVar[ReviewJob | None] = ContextVar("codereviewer_job", default=None)
+
+
+def current_job() -> ReviewJob | None:
+    """The job of the running review, None in a one-shot action run."""
+    return _current.get()
+
+
+def workdir() -> str | None:
+    """The checkout of the running review, None for the current directory."""
+    job = _current.get()
+    return job.workdir if job is not None else None
+
+
+@contextmanager
+def running(job: ReviewJob) -> Iterator[ReviewJob]:
+    """Runs the code in this context, and the tasks and threads started from it, for the job's PR."""
+    token = _current.set(job)
+    try:
+        yield job
+    finally:
+        _current.reset(token)
@@ -14,4 +14,12 @@ class ReviewOutput(BaseModel):
 
 class SummaryOutput(BaseModel):
     summary: str
-    number_of_changes: int
\ No newline at end of file
+    number_of_changes: int
+
+
+class FileSummary(BaseModel):
+    file: str
+    summary: str
+
+class FileSummariesOutput(BaseModel):
+    files: list[FileSummary]
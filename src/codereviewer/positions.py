@@ -0,0 +1,145 @@
+# where on the PR a finding can be commented.
+# GitHub only takes inline comments on lines inside the PR's diff hunks, anything else is a 422.
+# the index maps every file of the PR diff to the new-file line ranges of its hunks, so the line
+# of each finding is checked locally before posting: a line a few lines off a hunk is moved to the
+# nearest commentable line, a line nowhere near one becomes a file-level comment, and a path that
+# is not in the PR at all (after forgiving a/ b/ prefixes and partial paths) is dropped.
+# the diff may be fetched with more context than GitHub's, so the ranges are cut back to the
+# context GitHub shows around each run of changed lines.
+
+import bisect
+import os
+from dataclasses import dataclass, field
+
+from .diffs import FileDiff, Hunk
+
+# findings at most this many lines from a hunk are moved onto it
+DEFAULT_MAX_SNAP = 5
+# context lines GitHub shows around changes in a PR diff
+GITHUB_CONTEXT_LINES = 3
+
+
+@dataclass
+class Placement:
+    path: str
+    # None for a file-level comment
+    line: int | None
+    # the line the finding was reported for
+    reported: int
+
+    @property
+    def moved(self) -> bool:
+        return self.line != self.reported
+
+
+@dataclass
+class LineIndex:
+    """Commentable new-file line ranges of each file in a PR diff."""
+
+    # path -> sorted, non-overlapping (first, last) line ranges, empty for files without hunks
+    ranges: dict[str, list[tuple[int, int]]] = field(default_factory=dict)
+    max_snap: int = DEFAULT_MAX_SNAP
+
+    def resolve_path(self, path: str) -> str | None:
+        """The path of the diff a reported path means, None if the PR does not touch it."""
+        if path in self.ranges:
+            return path
+        stripped = path.strip().lstrip("/")
+        for prefix in ("./", "a/", "b/"):
+            stripped = stripped.removeprefix(prefix)
+        if stripped in self.ranges:
+            return stripped
+        # a partial path, e.g. the package path without src/, if it names one file only
+        matches = [known for known in self.ranges if known.endswith(f"/{stripped}")]
+        return matches[0] if len(matches) == 1 else None
+
+    def commentable(self, path: str, line: int) -> bool:
+        ranges = self.ranges.get(path, [])
+        i = bisect.bisect_right(ranges, (line, float("inf"))) - 1
+        return i >= 0 and ranges[i][0] <= line <= ranges[i][1]
+
+    def snap(self, path: str, line: int) -> int | None:
+        """The commentable line nearest to line, if it is at most max_snap lines away."""
+        ranges = self.ranges.get(path, [])
+        if self.commentable(path, line):
+            return line
+        i = bisect.bisect_right(ranges, (line, float("inf")))
+        candidates = []
+        if i > 0:
+            candidates.append(ranges[i - 1][1])
+        if i < len(ranges):
+            candidates.append(ranges[i][0])
+        nearest = min(candidates, key=lambda candidate: abs(candidate - line), default=None)
+        if nearest is None or abs(nearest - line) > self.max_snap:
+            return None
+        return nearest
+
+    def place(self, path: str, line: int) -> Placement | None:
+        """
+        Where to comment a finding.
+
+        Returns:
+            The placement, inline when the line is on or near a hunk and file-level otherwise,
+            None when the file is not part of the PR.
+        """
+        resolved = self.resolve_path(path)
+        if resolved is None:
+            return None
+        return Placement(resolved, self.snap(resolved, line), line)
+
+
+def _hunk_ranges(hunk: Hunk, context: int) -> list[tuple[int, int]]:
+    """The new-file lines of a hunk within `context` lines of a change, one range per run of changes."""
+    first, last = hunk.new_start, hunk.new_start + hunk.new_len - 1
+    ranges = []
+    line = hunk.new_start
+    start = None
+    for text in hunk.lines:
+        if text.startswith(("+", "-")):
+            if start is None:
+                start = line
+            if text.startswith("+"):
+                line += 1
+        elif text.startswith("\\"):
+            # "\ No newline at end of file"
+            continue
+        else:
+            if start is not None:
+                ranges.append((max(first, start - context), min(last, line - 1 + context)))
+                start = None
+            line += 1
+    if start is not None:
+        ranges.append((max(first, start - context), min(last, line - 1 + context)))
+    return ranges
+
+
+def build_line_index(
+    files: list[FileDiff], max_snap: int | None = None, context: int = GITHUB_CONTEXT_LINES
+) -> LineIndex:
+    """
+    Indexes the commentable lines of a parsed PR diff.
+
+    Args:
+        files: The PR diff, with any amount of context.
+        max_snap: How far a line may be moved onto a hunk, defaults to REVIEW_SNAP_LINES.
+        context: The context GitHub shows around changes, hunks are cut back to it.
+
+    Returns:
+        The index.
+    """
+    max_snap = max_snap if max_snap is not None else int(os.getenv("REVIEW_SNAP_LINES", DEFAULT_MAX_SNAP))
+    index = LineIndex(max_snap=max_snap)
+    for file in files:
+        ranges: list[tuple[int, int]] = []
+        for hunk in sorted(file.hunks, key=lambda hunk: hunk.new_start):
+            if hunk.new_len <= 0:
+                continue
+            for first, last in _hunk_ranges(hunk, context):
+                if first > last:
+                    continue
+                if ranges and first <= ranges[-1][1] + 1:
+                    ranges[-1] = (ranges[-1][0], max(ranges[-1][1], last))
+                else:
+                    ranges.append((first, last))
+        index.ranges[file.path] = ranges
+    return index
@@ -0,0 +1,160 @@
+# progressive posting of review findings.
+# while the review runs, every finished shard, cache lookup and agent run publishes its issues to
+# a background queue that posts them to the PR as small COMMENT reviews, so the first findings show
+# up seconds into the run and posting overlaps with the review work still going on.
+# issues arriving within REVIEW_POST_FLUSH_SECONDS of each other go out in one review, and an issue
+# is never posted twice, so publishing the final merged review at the end only posts what is new.
+
+import asyncio
+import logging
+import os
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .github_client import PullRequestRef, _resolve, _submit_review, issue_comments
+from .positions import LineIndex
+from .telemetry import span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_SECONDS = 2.0
+
+
+def issue_key(issue: dict) -> tuple:
+    """Identity of an issue, two findings with the same key are the same finding."""
+    return (issue["file"], issue["line"], issue["category"].lower(), issue["issue"].strip().lower())
+
+
+class PostingQueue:
+    """
+    Posts issues to a PR in the background as they are published.
+
+    Usage:
+        queue = PostingQueue(head_sha)
+        queue.start()
+        with publishing(queue):
+            ...  # anything that calls publish(issues)
+        posted = await queue.close()
+    """
+
+    def __init__(
+        self,
+        head_sha: str,
+        pr: PullRequestRef | None = None,
+        flush_seconds: float | None = None,
+        positions: LineIndex | None = None,
+    ):
+        self.head_sha = head_sha
+        self.pr = pr
+        # the PR diff's line index, lines are placed on it before each batch is posted
+        self.positions = positions
+        self.flush_seconds = flush_seconds if flush_seconds is not None else float(
+            os.getenv("REVIEW_POST_FLUSH_SECONDS", DEFAULT_FLUSH_SECONDS)
+        )
+        self.posted = 0
+        self.batches = 0
+        # findings that did not make it to the PR, a run with failures must not be marked reviewed
+        self.failed = 0
+        self._seen: set[tuple] = set()
+        self._queue: asyncio.Queue[dict | None] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def publish(self, issues: list[dict]) -> int:
+        """
+        Queues the issues that were not published before.
+
+        Returns:
+            The number of issues queued.
+        """
+        queued = 0
+        for issue in issues:
+            key = issue_key(issue)
+            if key in self._seen:
+                continue
+            self._seen.add(key)
+            self._queue.put_nowait(issue)
+            queued += 1
+        return queued
+
+    async def close(self) -> int:
+        """
+        Posts whatever is still queued and stops the worker.
+
+        Returns:
+            The number of comments posted.
+        """
+        if self._task is not None:
+            self._queue.put_nowait(None)
+            await self._task
+            self._task = None
+        logger.info(f"Progressive posting: {self.posted} comments in {self.batches} reviews, {self.failed} failed")
+        return self.posted
+
+    def cancel(self) -> None:
+        """Stops the worker and drops whatever is still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            first = await self._queue.get()
+            if first is None:
+                return
+            # give the rest of a shard's findings a moment to arrive, then post them together
+            await asyncio.sleep(self.flush_seconds)
+            batch, closing = [first], False
+            while not self._queue.empty():
+                issue = self._queue.get_nowait()
+                if issue is None:
+                    closing = True
+                    break
+                batch.append(issue)
+            await self._post(batch)
+            if closing:
+                return
+
+    async def _post(self, issues: list[dict]) -> None:
+        try:
+            resolved = _resolve(self.pr)
+            if resolved is None:
+                return
+            client, pr = resolved
+            comments = issue_comments(issues, self.positions)
+            if not comments:
+                return
+            with span("github.post_batch", comments=len(comments)):
+                posted = await _submit_review(client, pr, self.head_sha, comments, None)
+            self.posted += posted
+            self.failed += len(comments) - posted
+            self.batches += 1
+            logger.info(f"✅ Posted {posted}/{len(comments)} findings")
+        except Exception as e:
+            # a failed batch must not stop the review or the batches after it
+            self.failed += len(issues)
+            logger.error(f"❌ Error posting {len(issues)} findings: {e}", exc_info=True)
+
+
+_current: ContextVar[PostingQueue | None] = ContextVar("codereviewer_posting_queue", default=None)
+
+
+@contextmanager
+def publishing(queue: PostingQueue | None) -> Iterator[PostingQueue | None]:
+    """Routes publish calls in this context, and the tasks started from it, to the queue."""
+    token = _current.set(queue)
+    try:
+        yield queue
+    finally:
+        _current.reset(token)
+
+
+def publish(issues: list[dict]) -> None:
+    """Hands finished issues to the posting queue of the current run, if progressive posting is on."""
+    queue = _current.get()
+    if queue is not None and issues:
+        queue.publish(issues)
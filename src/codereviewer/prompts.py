@@ -2,34 +2,33 @@
 Prompts for the code review and summarization.
 """
 
-def get_complex_review_prompt(cwd: str, diff: str, summary: str) -> str:
-    return f"""
-Working directory: {cwd} (repo root)
+# bump when a review prompt changes so cached reviews made with the old prompt are not reused
+PROMPT_VERSION = "5"
+
+# the prompts are split into a static prefix (instructions, examples, output schema) that is
+# byte-identical for every shard and every PR, followed by the variable part (paths, summary, diff).
+# the providers cache prompt prefixes, so the static part is only billed at the cached rate after
+# the first call. keep anything that changes per call out of the *_INSTRUCTIONS constants.
+
+COMPLEX_REVIEW_INSTRUCTIONS = """
 <instructions>
 Review changes from the diff. The summary describes the intent of the changes at a high level. 
 Focus on finding issues not covered in the summary and high level flow breaks that are critical.
 
-CRITICAL: You have 15 turns MAX. YOU MUST FOLLOW THE TURN LIMIT INSTRUCTIONS.
-After your investigation, you MUST write your findings to /tmp/review.json
-Use the Write tool to create this file with the JSON format specified below.
+CRITICAL: You have the number of turns given in the turn limit below. YOU MUST FOLLOW THE TURN LIMIT INSTRUCTIONS.
+After your investigation, you MUST submit your findings with the submit_review tool.
+Only if that tool is not available, use the Write tool to save them to the review file given below.
 </instructions>
 
 </steps>
 Steps:
 1. Review the diff for issues within each file.
-2. For functions that are added/modified, grep for callers to check upstream impact.
-3. For functions being called, grep to verify they exist and signatures match
+2. For functions that are added/modified, check their callers in <symbols> for upstream impact.
+3. For functions being called, check in <symbols> that they exist and signatures match.
+   For anything <symbols> does not list, use the lookup_symbol tool before falling back to grep.
 3. Return a list of critical observations that need to be addressed.
 </steps>
 
-<summary>
-{summary}
-</summary>
-
-<diff>
-{diff}
-</diff>
-
 <requirements>
 Do NOT:
 - List files or explore structure
@@ -39,38 +38,60 @@ Do NOT:
 </requirements>
 
 <output format>
-Write your findings to /tmp/review.json in this exact JSON format:
-{{
+Submit your findings with submit_review (or write them to the review file) in this exact JSON format:
+{
   "issues": [
-    {{
+    {
       "category": "Security|Logic|Performance|Maintainability",
       "file": "path/to/file.py",
       "line": 123,
       "issue": "Brief description of the issue",
       "impact": "Why this matters / what could go wrong",
       "recommendation": "How to fix it"
-    }}
+    }
   ]
-}}
+}
 
-If no critical issues found, write to /tmp/review.json:
-{{
+If no critical issues found, submit:
+{
   "issues": []
-}}
+}
 
-IMPORTANT: Use the Write tool to create /tmp/review.json with the JSON content above.
+IMPORTANT: Call submit_review exactly once with the JSON content above.
 </output format>
 """
 
-def get_simple_review_prompt(diff: str, summary: str) -> str:
-    return f"""
-Review this pull request diff.
+COMPLEX_REVIEW_SYSTEM_PROMPT = (
+    "You are a fast code reviewer. Investigate the code, then submit your findings with the submit_review tool "
+    "(or, if it is unavailable, write them as JSON to the review file named in the prompt). "
+    "YOU MUST FOLLOW THE TURN LIMIT INSTRUCTIONS."
+)
 
-## Summary
+
+def get_complex_review_prompt(
+    cwd: str, diff: str, summary: str, review_file: str = "/tmp/review.json", symbols: str = "", max_turns: int = 15
+) -> str:
+    return f"""{COMPLEX_REVIEW_INSTRUCTIONS}
+Turn limit: You have {max_turns} turns MAX, submit your findings before you run out.
+Working directory: {cwd} (repo root)
+Review file: {review_file}
+
+<symbols>
+{symbols or "No changed definitions were indexed."}
+</symbols>
+
+<summary>
 {summary}
+</summary>
 
-## Diff
+<diff>
 {diff}
+</diff>
+"""
+
+
+SIMPLE_REVIEW_INSTRUCTIONS = """
+Review the pull request diff at the end of this message.
 
 Report issues that would cause bugs, crashes, security vulnerabilities, or significant maintainability problems.
 
@@ -96,13 +117,19 @@ If no real issues exist, return an empty issues list.
 """
 
 
-def get_summarizer_prompt(diff: str) -> str:
-    return f"""
-Summarize this pull request diff.
+def get_simple_review_prompt(diff: str, summary: str) -> str:
+    # the summary is the same for every shard of a PR, so it goes before the diff
+    return f"""{SIMPLE_REVIEW_INSTRUCTIONS}
+## Summary
+{summary}
 
 ## Diff
 {diff}
+"""
 
+
+# the output format of the summary, shared by the one-shot summarizer and the reduce step
+SUMMARY_FORMAT = """
 Output this exact format:
 
 ## [Verb] + [What] (e.g., "Add user authentication", "Fix cart calculation bug")
@@ -165,4 +192,63 @@ Mermaid Guidelines:
 - Only include components touched or connected by this PR
 - New modules go in "New" subgraph, modified existing in "Existing"
 - Show the integration point clearly (where new meets existing)
-"""
\ No newline at end of file
+"""
+
+
+SUMMARIZER_INSTRUCTIONS = """
+Summarize the pull request diff at the end of this message.
+""" + SUMMARY_FORMAT
+
+# map step for big diffs: short per-file notes that the reduce step turns into the summary
+FILE_SUMMARY_INSTRUCTIONS = """
+Summarize every file of the pull request diff at the end of this message, one entry per file.
+
+For each file write one or two sentences: what changed and why it matters. Mention new functions,
+classes or modules by name and what existing code they call or are called from, so the flow of the
+change can be drawn from the notes alone. Use the file path exactly as it appears in the diff.
+"""
+
+# middle step for PRs with too many files to reduce at once: per-directory notes from the file notes
+DIRECTORY_SUMMARY_INSTRUCTIONS = """
+Condense the per-file notes of a pull request at the end of this message into one entry per directory.
+
+For each directory write two or three sentences on what changed in it and why it matters. Keep the
+names of new functions, classes and modules and what they connect to. Use the directory path as the
+file of the entry.
+"""
+
+SUMMARY_REDUCE_INSTRUCTIONS = """
+Summarize the pull request from the per-file notes at the end of this message. The notes were written
+from the diff, one file or directory at a time.
+""" + SUMMARY_FORMAT
+
+
+def get_summarizer_prompt(diff: str) -> str:
+    return f"""{SUMMARIZER_INSTRUCTIONS}
+## Diff
+{diff}
+"""
+
+
+def get_file_summary_prompt(diff: str) -> str:
+    return f"""{FILE_SUMMARY_INSTRUCTIONS}
+## Diff
+{diff}
+"""
+
+
+def get_directory_summary_prompt(notes: str) -> str:
+    return f"""{DIRECTORY_SUMMARY_INSTRUCTIONS}
+## Notes
+{notes}
+"""
+
+
+def get_summary_reduce_prompt(notes: str, stat: str) -> str:
+    return f"""{SUMMARY_REDUCE_INSTRUCTIONS}
+## Stats
+{stat}
+
+## Notes
+{notes}
+"""
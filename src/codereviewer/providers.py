@@ -0,0 +1,348 @@
+# shared LLM provider layer for the summarizer and reviewer.
+# keeps one long-lived ChatOpenAI per model on top of a pooled keep-alive async http client,
+# and builds the structured-output binding for each (model, schema) pair only once.
+# every call goes through ainvoke so summaries, reviews and shards can overlap on the event loop.
+#
+# LLM_BACKEND picks where responses come from:
+#   openai  - the real APIs (default)
+#   record  - the real APIs, and every response is saved under LLM_FIXTURES_DIR
+#   replay  - responses are loaded from LLM_FIXTURES_DIR, no network
+#   fake    - deterministic schema-valid responses built from the prompt, no network
+# replay and fake wait LLM_FAKE_LATENCY seconds per call so the pipeline can be timed offline.
+# the Claude agent goes through agent_query, which is stubbed the same way.
+# the OpenAI (LangChain) and Claude SDKs take most of the startup time, so they are only imported
+# through load_backend, the first time a run actually calls them.
+# every structured call carries a prompt_cache_key per schema and prompt version, so OpenAI routes
+# the shared static prompt prefix of all shards and PRs to the same cache.
+
+import asyncio
+import hashlib
+import importlib
+import json
+import logging
+import os
+import re
+import time
+from collections.abc import AsyncIterator
+from types import ModuleType
+from typing import TYPE_CHECKING
+
+import httpx
+from pydantic import BaseModel
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+
+from .diffs import parse_diff
+from .models import FileSummariesOutput, FileSummary, Issue, ReviewOutput, SummaryOutput
+from .prompts import PROMPT_VERSION
+from .telemetry import span, token_cost
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gpt-5-mini"
+LLM_BACKENDS = ("openai", "record", "replay", "fake")
+DEFAULT_FIXTURES_DIR = os.path.join("tests", "fixtures", "llm")
+
+# backend name -> module, imported on first use
+BACKEND_MODULES = {
+    "openai": "langchain_openai",
+    "claude": "claude_agent_sdk",
+}
+_backends: dict[str, ModuleType] = {}
+
+
+def load_backend(name: str) -> ModuleType:
+    """
+    Imports a provider SDK the first time it is needed and returns the module.
+
+    Args:
+        name: One of BACKEND_MODULES.
+    """
+    module = _backends.get(name)
+    if module is None:
+        start = time.perf_counter()
+        with span(f"import.{name}"):
+            module = importlib.import_module(BACKEND_MODULES[name])
+        logger.debug(f"Loaded {name} backend in {time.perf_counter() - start:.3f}s")
+        _backends[name] = module
+    return module
+
+
+class FixtureNotFoundError(LookupError):
+    pass
+
+
+def get_backend() -> str:
+    backend = os.getenv("LLM_BACKEND", "openai")
+    if backend not in LLM_BACKENDS:
+        raise ValueError(f"Unknown LLM_BACKEND '{backend}', expected one of {LLM_BACKENDS}")
+    return backend
+
+
+def _fixture_path(kind: str, model: str, prompt: str) -> str:
+    key = hashlib.sha256(f"{kind}\0{model}\0{prompt}".encode("utf-8", "surrogateescape")).hexdigest()
+    return os.path.join(os.getenv("LLM_FIXTURES_DIR", DEFAULT_FIXTURES_DIR), f"{kind}-{key[:32]}.json")
+
+
+def _save_fixture(path: str, data: dict) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+    logger.debug(f"Recorded {path}")
+
+
+def _load_fixture(path: str) -> dict:
+    if not os.path.exists(path):
+        raise FixtureNotFoundError(f"No recorded response at {path}, record it with LLM_BACKEND=record")
+    with open(path) as f:
+        return json.load(f)
+
+
+async def _fake_latency() -> None:
+    latency = float(os.getenv("LLM_FAKE_LATENCY", "0"))
+    if latency > 0:
+        await asyncio.sleep(latency)
+
+
+def _fake_issues(prompt: str) -> list[Issue]:
+    """One finding on the first added line of every file in the prompt's diff."""
+    issues = []
+    for file in parse_diff(prompt):
+        for hunk in file.hunks:
+            line = hunk.new_start
+            added = None
+            for text in hunk.lines:
+                if text.startswith("+"):
+                    added = line
+                    break
+                if not text.startswith(("-", "\\")):
+                    line += 1
+            if added is not None:
+                issues.append(Issue(
+                    category="Maintainability",
+                    file=file.path,
+                    line=added,
+                    issue="Fake finding from the offline LLM backend",
+                    impact="None, this is a stand-in response",
+                    recommendation="Nothing to do",
+                ))
+                break
+    return issues
+
+
+def fake_response(schema: type[BaseModel], prompt: str) -> BaseModel:
+    """
+    Builds a deterministic response for a schema from the prompt alone.
+    """
+    if schema is ReviewOutput:
+        if "diff --git" not in prompt and "{" in prompt:
+            # validation pass over a review the agent already wrote, echo it back
+            try:
+                return ReviewOutput.model_validate_json(prompt[prompt.index("{"):prompt.rindex("}") + 1])
+            except ValueError:
+                return ReviewOutput(issues=[])
+        return ReviewOutput(issues=_fake_issues(prompt))
+    if schema is FileSummariesOutput:
+        entries = [FileSummary(file=file.path, summary=f"Changes {file.path}.") for file in parse_diff(prompt)]
+        if not entries and "## Notes" in prompt:
+            # directory pass, one entry per directory of the notes
+            paths = re.findall(r"^- \*\*(.+?)\*\*:", prompt.split("## Notes", 1)[1], re.MULTILINE)
+            directories = dict.fromkeys(os.path.dirname(path) or "." for path in paths)
+            entries = [FileSummary(file=directory, summary=f"Changes in {directory}.") for directory in directories]
+        return FileSummariesOutput(files=entries)
+    if schema is SummaryOutput:
+        paths = [file.path for file in parse_diff(prompt)]
+        if not paths and "## Notes" in prompt:
+            # reduce step, the files are in the notes instead of a diff
+            paths = re.findall(r"^- \*\*(.+?)\*\*:", prompt.split("## Notes", 1)[1], re.MULTILINE)
+        changes = "\n".join(f"- **{path}**: changed" for path in paths)
+        return SummaryOutput(
+            summary=f"## Update {len(paths)} files\n\n**What:** Offline summary.\n\n### Changes\n{changes}",
+            number_of_changes=len(paths),
+        )
+    return schema.model_construct()
+
+
+_loop: asyncio.AbstractEventLoop | None = None
+_http_client: httpx.AsyncClient | None = None
+_chat_models: dict[str, "ChatOpenAI"] = {}
+_structured_llms: dict[tuple[str, type[BaseModel]], object] = {}
+
+
+def _reset_for_running_loop() -> None:
+    """
+    Drops the cached clients if they were created on a different event loop.
+    httpx connection pools cannot be shared between loops, so each asyncio.run gets its own.
+    """
+    global _loop, _http_client
+    loop = asyncio.get_running_loop()
+    if _loop is loop and _http_client is not None and not _http_client.is_closed:
+        return
+    _loop = loop
+    _http_client = None
+    _chat_models.clear()
+    _structured_llms.clear()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the shared keep-alive async http client for the running event loop.
+    """
+    global _http_client
+    _reset_for_running_loop()
+    if _http_client is None:
+        max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=60,
+            ),
+            timeout=httpx.Timeout(300, connect=10),
+        )
+    return _http_client
+
+
+def get_chat_model(model: str = DEFAULT_MODEL) -> "ChatOpenAI":
+    """
+    Returns the shared chat model for the given model name.
+    """
+    http_client = get_http_client()
+    if model not in _chat_models:
+        logger.debug(f"Creating chat model {model}")
+        _chat_models[model] = load_backend("openai").ChatOpenAI(model=model, http_async_client=http_client)
+    return _chat_models[model]
+
+
+def prompt_cache_key(schema: type[BaseModel]) -> str:
+    """The provider cache key for prompts answered with schema, see prompts.py."""
+    return f"codereviewer-{schema.__name__.lower()}-v{PROMPT_VERSION}"
+
+
+def get_structured_llm(schema: type[BaseModel], model: str = DEFAULT_MODEL):
+    """
+    Returns the cached structured-output binding of a model for a pydantic schema.
+
+    Args:
+        schema: The pydantic model the response is parsed into.
+        model: The model name.
+
+    Returns:
+        A runnable whose ainvoke returns a dict with the raw message (for token usage),
+        the parsed schema instance and the parsing error, if any.
+    """
+    llm = get_chat_model(model)
+    key = (model, schema)
+    if key not in _structured_llms:
+        _structured_llms[key] = llm.with_structured_output(schema, include_raw=True, prompt_cache_key=prompt_cache_key(schema))
+    return _structured_llms[key]
+
+
+async def ainvoke_structured(prompt: str, schema: type[BaseModel], model: str = DEFAULT_MODEL) -> BaseModel:
+    """
+    Sends a prompt to the model without blocking the event loop and parses the response.
+
+    Args:
+        prompt: The prompt to send.
+        schema: The pydantic model the response is parsed into.
+        model: The model name.
+
+    Returns:
+        An instance of schema.
+    """
+    with span(f"llm.{schema.__name__}", model=model, calls=1, bytes_out=len(prompt.encode())) as llm_span:
+        response = await _ainvoke_backend(prompt, schema, model, llm_span)
+        llm_span.record(bytes_in=len(response.model_dump_json().encode()))
+        return response
+
+
+async def _ainvoke_backend(prompt: str, schema: type[BaseModel], model: str, llm_span) -> BaseModel:
+    backend = get_backend()
+    llm_span.record(backend=backend)
+    if backend == "fake":
+        await _fake_latency()
+        return fake_response(schema, prompt)
+
+    path = _fixture_path(schema.__name__, model, prompt)
+    if backend == "replay":
+        await _fake_latency()
+        return schema.model_validate(_load_fixture(path)["response"])
+
+    structured_llm = get_structured_llm(schema, model)
+    result = await structured_llm.ainvoke(prompt)
+    if result.get("parsing_error") is not None:
+        raise result["parsing_error"]
+    response = result["parsed"]
+
+    usage = getattr(result["raw"], "usage_metadata", None) or {}
+    tokens_in, tokens_out = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    tokens_cached = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+    llm_span.record(
+        tokens_in=tokens_in,
+        tokens_out=tokens_out,
+        tokens_cached=tokens_cached,
+        cost_usd=token_cost(model, tokens_in, tokens_out, tokens_cached),
+    )
+
+    if backend == "record":
+        _save_fixture(path, {"schema": schema.__name__, "model": model, "response": response.model_dump()})
+    return response
+
+
+def _result_message(started: float, result: str):
+    return load_backend("claude").ResultMessage(
+        subtype="success",
+        duration_ms=int((time.perf_counter() - started) * 1000),
+        duration_api_ms=0,
+        is_error=False,
+        num_turns=1,
+        session_id="offline",
+        total_cost_usd=0.0,
+        result=result,
+    )
+
+
+async def agent_query(prompt: str, options, channel) -> AsyncIterator:
+    """
+    Runs the Claude agent and streams its messages, or stands in for it offline.
+    The agent hands its findings back through the channel; the offline backends do that themselves.
+
+    Args:
+        prompt: The agent prompt.
+        options: The ClaudeAgentOptions for the session.
+        channel: The ReviewChannel collecting this review's findings.
+    """
+    backend = get_backend()
+    started = time.perf_counter()
+    # the scratch path is different every run, keep it out of the fixture key
+    fixture = _fixture_path("agent", options.model or "", prompt.replace(channel.result_file, "<review-file>"))
+
+    if backend in ("fake", "replay"):
+        await _fake_latency()
+        if backend == "fake":
+            channel.submit(ReviewOutput(issues=_fake_issues(prompt)).model_dump())
+        else:
+            with open(channel.result_file, "w") as f:
+                f.write(_load_fixture(fixture)["review"])
+        yield _result_message(started, "Findings submitted")
+        return
+
+    async for message in load_backend("claude").query(prompt=prompt, options=options):
+        yield message
+
+    raw_review = channel.read()
+    if backend == "record" and raw_review is not None:
+        _save_fixture(fixture, {"model": options.model, "review": raw_review})
+
+
+async def aclose_clients() -> None:
+    """
+    Closes the shared http client. Call once at the end of a run.
+    """
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+    _chat_models.clear()
+    _structured_llms.clear()
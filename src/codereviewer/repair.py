@@ -0,0 +1,160 @@
+# local parsing of the review file the Claude agent writes.
+# the agent's JSON is usually valid, and when it is not the problems are the same few every time:
+# a markdown code fence around it, prose before it, trailing commas, a file cut off mid-array when
+# the agent ran out of turns, and line numbers written as strings ("42", "L42", "42-45").
+# those are fixed deterministically here so the LLM validation pass only runs when this fails.
+
+import json
+import re
+
+from pydantic import ValidationError
+
+from .models import Issue, ReviewOutput
+
+FENCE_RE = re.compile(r"```(?:json|JSON)?[ \t]*\n")
+TRAILING_COMMA_RE = re.compile(r",(\s*[}\]])")
+LINE_NUMBER_RE = re.compile(r"\d+")
+TEXT_FIELDS = ("category", "issue", "impact", "recommendation")
+
+
+class ReviewRepairError(ValueError):
+    pass
+
+
+def _strip_fence(text: str) -> str:
+    """Drops everything up to an opening code fence, the closing one is cut with the trailing prose."""
+    match = FENCE_RE.search(text)
+    return text[match.end():] if match else text
+
+
+def _remove_trailing_commas(text: str) -> str:
+    """Drops commas directly before a closing bracket, leaving string contents alone."""
+    out, in_string, escaped, i = [], False, False, 0
+    while i < len(text):
+        char = text[i]
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+            out.append(char)
+        elif char == ",":
+            match = TRAILING_COMMA_RE.match(text, i)
+            if not match:
+                out.append(char)
+        else:
+            out.append(char)
+        i += 1
+    return "".join(out)
+
+
+def _close_truncated(text: str) -> str:
+    """
+    Cuts a truncated document back to the last complete array element and closes what is still open.
+    """
+    stack, in_string, escaped = [], False, False
+    # (cut position, brackets still open there)
+    last_complete = None
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            # an array that was just opened at the issues level can always be closed empty
+            if char == "[" and len(stack) <= 2:
+                last_complete = (i + 1, list(stack))
+        elif char in "}]":
+            if not stack:
+                break
+            stack.pop()
+            if not stack:
+                return text[:i + 1]
+            if stack[-1] == "]":
+                last_complete = (i + 1, list(stack))
+    if last_complete is None:
+        raise ReviewRepairError("No complete review element to recover")
+    end, open_brackets = last_complete
+    return text[:end] + "".join(reversed(open_brackets))
+
+
+def repair_json(text: str) -> object:
+    """
+    Parses JSON, repairing code fences, surrounding prose, trailing commas and truncation.
+
+    Raises:
+        ReviewRepairError: If the text cannot be repaired.
+    """
+    text = text.strip()
+    if not text.startswith(("{", "[")):
+        text = _strip_fence(text).strip()
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        raise ReviewRepairError("No JSON object or array found")
+    text = _remove_trailing_commas(text[min(starts):])
+
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(_remove_trailing_commas(_close_truncated(text)))
+    except json.JSONDecodeError as e:
+        raise ReviewRepairError(f"Could not repair review JSON: {e}") from e
+
+
+def _normalize_issue(raw: dict) -> dict:
+    issue = dict(raw)
+    line = issue.get("line")
+    if isinstance(line, str):
+        match = LINE_NUMBER_RE.search(line)
+        issue["line"] = int(match.group()) if match else line
+    elif isinstance(line, float) and line.is_integer():
+        issue["line"] = int(line)
+    for key in TEXT_FIELDS:
+        if isinstance(issue.get(key), list):
+            issue[key] = "\n".join(str(item) for item in issue[key])
+    return issue
+
+
+def parse_review(text: str) -> ReviewOutput:
+    """
+    Parses the agent's review file into ReviewOutput without calling a model.
+
+    Args:
+        text: The raw contents of the review file.
+
+    Returns:
+        The validated review.
+
+    Raises:
+        ReviewRepairError: If the file cannot be repaired or an issue does not validate.
+    """
+    data = repair_json(text)
+    if isinstance(data, list):
+        data = {"issues": data}
+    # an object without the key is some other shape, not an empty review
+    if not isinstance(data, dict) or not isinstance(data.get("issues"), list):
+        raise ReviewRepairError("Review JSON has no issues list")
+
+    issues = []
+    for raw in data["issues"]:
+        if not isinstance(raw, dict):
+            raise ReviewRepairError(f"Issue is not an object: {raw!r}")
+        try:
+            issues.append(Issue.model_validate(_normalize_issue(raw)))
+        except ValidationError as e:
+            raise ReviewRepairError(f"Invalid issue: {e}") from e
+    return ReviewOutput(issues=issues)
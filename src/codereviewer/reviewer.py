@@ -1,84 +1,140 @@
-from claude_agent_sdk import query, ClaudeAgentOptions
-from claude_agent_sdk.types import AssistantMessage, ToolUseBlock, ResultMessage, TextBlock
+import asyncio
 import os
-from .prompts import get_complex_review_prompt, get_simple_review_prompt
+from functools import partial
+from .prompts import COMPLEX_REVIEW_SYSTEM_PROMPT, get_complex_review_prompt, get_simple_review_prompt
 from .models import ReviewOutput
-from langchain_openai import ChatOpenAI
+from .providers import ainvoke_structured, agent_query, load_backend, DEFAULT_MODEL
+from .sharding import Shard, estimate_tokens, partition_files, read_codeowners, shard_diff, DEFAULT_SHARD_TOKEN_BUDGET
+from .telemetry import span
+from .repair import parse_review, ReviewRepairError
+from .channel import ReviewChannel, QUALIFIED_TOOL_NAME
+from .posting import issue_key, publish
+from .diffs import FileDiff, parse_diff
+from .job import workdir
+from .budget import current_budget
+from .symbols import QUALIFIED_LOOKUP_TOOL_NAME, build_symbol_index, lookup_tool
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def review_commplex_changes(diff: str, summary: str) -> dict:
+COMPLEX_REVIEW_MODEL = "claude-haiku-4-5-20251001"
+SIMPLE_REVIEW_MODEL = DEFAULT_MODEL
+DEFAULT_AGENT_TURNS = 25
+# the agent is told it has this share of its hard turn limit, so it submits before the SDK cuts it off
+STATED_TURNS_SHARE = 0.6
+# partitioned agent reviews: sessions at once, the least diff worth its own session, turns per session
+DEFAULT_AGENT_SESSIONS = 4
+DEFAULT_PARTITION_TOKENS = 8000
+DEFAULT_PARTITION_TURNS = 12
+
+def not_reviewed(files: list[FileDiff]) -> dict:
+    """An empty review of files that did not get one, listed so their hunks are not cached as clean."""
+    return {"issues": [], "unreviewed": sorted({file.path for file in files})}
+
+
+def stated_turns(max_turns: int) -> int:
+    """The turn limit the agent prompt states for a session capped at max_turns, 15 of the default 25."""
+    return max(1, min(int(max_turns * STATED_TURNS_SHARE), max_turns - 1))
+
+
+async def review_commplex_changes(diff: str, summary: str, max_turns: int = DEFAULT_AGENT_TURNS) -> dict:
     """
         Reviews the changes in a pr diff that are complex and require navigating the codebase.
 
         Args:
             diff: The diff of the pull request.
             summary: The summary of the changes.
+            max_turns: The turn budget of the agent session.
 
         Returns:
             A dictionary containing the issues.
     """
-    cwd = os.getcwd()
-    review_file = "/tmp/review.json"
-    
-    # Remove any existing review file
-    if os.path.exists(review_file):
-        os.remove(review_file)
-    
-    async for message in query(
-        prompt=get_complex_review_prompt(cwd, diff, summary),
-        options=ClaudeAgentOptions(
-            model="claude-haiku-4-5-20251001",
-            system_prompt="You are a fast code reviewer. Investigate the code, then use the Write tool to save your findings to /tmp/review.json in JSON format. YOU MUST FOLLOW THE TURN LIMIT INSTRUCTIONS.",
-            allowed_tools=["Write", "Grep", "Bash", "Read"],
-            permission_mode="acceptEdits",
-            max_turns=25,
-            cwd=cwd
+    cwd = workdir() or os.getcwd()
+    sdk = load_backend("claude")
+
+    # callers and signatures are looked up locally instead of by the agent, one turn at a time
+    symbols = None
+    if os.getenv("REVIEW_SYMBOL_INDEX", "on").lower() not in ("0", "off", "false", "no"):
+        with span("symbols") as symbols_span:
+            symbols = await asyncio.to_thread(build_symbol_index, parse_diff(diff), None, cwd)
+            symbols_span.record(changed=len(symbols.changed), call_sites=sum(len(c) for c in symbols.callers.values()))
+
+    with ReviewChannel() as channel:
+        prompt = get_complex_review_prompt(
+            cwd, diff, summary, channel.result_file, symbols.render() if symbols else "", stated_turns(max_turns)
         )
-    ):
-        if hasattr(message, 'data'):
-            logger.debug(f"Session ID: {message.data.get('session_id')}")
-            logger.debug(f"Model: {message.data.get('model')}")
-
-        if isinstance(message, AssistantMessage):
-            for block in message.content:
-                if isinstance(block, TextBlock):
-                    logger.debug(f"Response: {block.text}")
-                elif isinstance(block, ToolUseBlock):
-                    logger.debug(f"Tool used: {block.name}")
-                    logger.debug(f"Tool input: {block.input}")
-        
-        if isinstance(message, ResultMessage):
-            logger.info(f"Total Turns: {message.num_turns}")
-            if hasattr(message, 'usage'):
-                logger.debug(f"Usage: {message.usage}")
-            if hasattr(message, 'total_cost_usd'):
-                logger.info(f"Total Cost: ${message.total_cost_usd:.4f}")
-    
-    # Read the review file written by Claude
-    raw_review = None
-    if os.path.exists(review_file):
-        with open(review_file, 'r') as f:
-            raw_review = f.read()
-        logger.info(f"Read review from {review_file}")
-    else:
-        logger.warning(f"{review_file} not found, Claude may not have written findings")
-        raw_review = '{"issues": []}'
-    
-    # Parse Claude's JSON output with GPT-5-mini for validation
-    llm = ChatOpenAI(model="gpt-5-mini")
-    structured_llm = llm.with_structured_output(ReviewOutput)
-    
-    prompt = f"""Extract and validate the code review issues from this JSON output.
-If the JSON is malformed, do your best to extract the issues:
-
-{raw_review}
-
-Return in the required structured format."""
-    
-    response = structured_llm.invoke(prompt)
-    
+        with span("llm.agent", model=COMPLEX_REVIEW_MODEL, calls=1, bytes_out=len(prompt.encode())) as agent_span:
+            async for message in agent_query(
+                prompt=prompt,
+                channel=channel,
+                options=sdk.ClaudeAgentOptions(
+                    model=COMPLEX_REVIEW_MODEL,
+                    # static so the cached prefix is shared by every review, the scratch path is in the prompt
+                    system_prompt=COMPLEX_REVIEW_SYSTEM_PROMPT,
+                    mcp_servers=channel.mcp_servers([lookup_tool(symbols)] if symbols else None),
+                    allowed_tools=[QUALIFIED_TOOL_NAME, QUALIFIED_LOOKUP_TOOL_NAME, "Write", "Grep", "Bash", "Read"],
+                    permission_mode="acceptEdits",
+                    max_turns=max_turns,
+                    cwd=cwd
+                )
+            ):
+                if hasattr(message, 'data'):
+                    logger.debug(f"Session ID: {message.data.get('session_id')}")
+                    logger.debug(f"Model: {message.data.get('model')}")
+
+                if isinstance(message, sdk.AssistantMessage):
+                    for block in message.content:
+                        if isinstance(block, sdk.TextBlock):
+                            logger.debug(f"Response: {block.text}")
+                        elif isinstance(block, sdk.ToolUseBlock):
+                            logger.debug(f"Tool used: {block.name}")
+                            logger.debug(f"Tool input: {block.input}")
+
+                if isinstance(message, sdk.ResultMessage):
+                    logger.info(f"Total Turns: {message.num_turns}")
+                    usage = message.usage or {}
+                    logger.debug(f"Usage: {usage}")
+                    tokens_in = sum(usage.get(key, 0) for key in ("input_tokens", "cache_read_input_tokens", "cache_creation_input_tokens"))
+                    agent_span.record(
+                        turns=message.num_turns,
+                        tokens_in=tokens_in,
+                        tokens_cached=usage.get("cache_read_input_tokens", 0),
+                        tokens_out=usage.get("output_tokens", 0),
+                        cost_usd=message.total_cost_usd,
+                    )
+                    if message.total_cost_usd is not None:
+                        logger.info(f"Total Cost: ${message.total_cost_usd:.4f}")
+            agent_span.record(submissions=channel.submissions)
+
+        # Findings from the submit_review tool, or the scratch file if the agent fell back to it
+        raw_review = channel.read()
+    if raw_review is None:
+        logger.warning("Claude did not submit findings")
+        return not_reviewed(parse_diff(diff))
+
+    with span("review.validate") as validate_span:
+        try:
+            response = parse_review(raw_review)
+            validate_span.record(method="local")
+        except ReviewRepairError as e:
+            budget = current_budget()
+            if budget.exhausted():
+                budget.degrade(f"The agent's findings could not be parsed ({e}) and the budget left no room to repair them")
+                validate_span.record(method="skipped")
+                return not_reviewed(parse_diff(diff))
+            logger.warning(f"Local review parsing failed ({e}), validating with {DEFAULT_MODEL}")
+            validate_span.record(method="llm")
+            prompt = f"""Extract and validate the code review issues from the JSON output below.
+If the JSON is malformed, do your best to extract the issues.
+Return them in the required structured format.
+
+{raw_review}"""
+            try:
+                response = await budget.run(ainvoke_structured(prompt, ReviewOutput))
+            except TimeoutError:
+                budget.degrade("The repair of the agent's unparseable findings was stopped at the deadline")
+                return not_reviewed(parse_diff(diff))
+
     return {
         "issues": [issue.model_dump() for issue in response.issues]
     }
@@ -96,10 +152,195 @@ async def review_simple_changes(diff: str, summary: str) -> dict:
         Returns:
             A dictionary containing the issues.
     """
-    llm = ChatOpenAI(model="gpt-5-mini")
-    structured_llm = llm.with_structured_output(ReviewOutput)
     prompt = get_simple_review_prompt(diff, summary)
-    response = structured_llm.invoke(prompt)
+    response = await ainvoke_structured(prompt, ReviewOutput, SIMPLE_REVIEW_MODEL)
     return {
         "issues": [issue.model_dump() for issue in response.issues]
-    }
\ No newline at end of file
+    }
+
+
+def merge_reviews(reviews: list[dict]) -> dict:
+    """
+        Merges the reviews of several shards into one review.
+        Issues reported twice for the same file and line are only kept once,
+        and the files any of the reviews left unreviewed are carried over.
+
+        Args:
+            reviews: The review dictionaries to merge.
+
+        Returns:
+            A dictionary containing the merged issues sorted by file and line.
+    """
+    issues, seen, unreviewed = [], set(), set()
+    for review in reviews:
+        unreviewed.update(review.get("unreviewed", []))
+        for issue in review.get("issues", []):
+            key = issue_key(issue)
+            if key in seen:
+                continue
+            seen.add(key)
+            issues.append(issue)
+    issues.sort(key=lambda issue: (issue["file"], issue["line"]))
+    if unreviewed:
+        return {"issues": issues, "unreviewed": sorted(unreviewed)}
+    return {"issues": issues}
+
+
+async def review_sharded_changes(
+    diff: str,
+    summary: dict,
+    review_fn=review_simple_changes,
+    token_budget: int | None = None,
+    max_concurrency: int | None = None,
+    group_by: str | None = None,
+) -> dict:
+    """
+        Splits the diff into shards that fit the token budget, reviews the shards
+        concurrently and merges the issues back into a single review.
+        A diff that fits in one shard is reviewed in a single call.
+
+        Args:
+            diff: The diff of the pull request.
+            summary: The summary of the changes.
+            review_fn: The reviewer to run on each shard.
+            token_budget: The shard size in tokens, defaults to REVIEW_SHARD_TOKEN_BUDGET.
+            max_concurrency: How many shards are reviewed at once, defaults to REVIEW_MAX_CONCURRENCY.
+            group_by: "file" or "directory", defaults to REVIEW_SHARD_GROUP_BY.
+
+        Returns:
+            A dictionary containing the issues.
+    """
+    token_budget = token_budget or int(os.getenv("REVIEW_SHARD_TOKEN_BUDGET", DEFAULT_SHARD_TOKEN_BUDGET))
+    max_concurrency = max_concurrency or int(os.getenv("REVIEW_MAX_CONCURRENCY", "4"))
+    group_by = group_by or os.getenv("REVIEW_SHARD_GROUP_BY", "directory")
+
+    shards = shard_diff(diff, token_budget, group_by)
+    if len(shards) <= 1:
+        return await _review_whole(diff, summary, review_fn)
+
+    logger.info(f"Reviewing {len(shards)} shards (budget {token_budget} tokens, concurrency {max_concurrency})")
+    return await _review_shards(shards, summary, review_fn, max_concurrency)
+
+
+def plan_agent_sessions(files: list[FileDiff], max_sessions: int | None = None) -> list[Shard]:
+    """
+    The partitions an agent review of the files is split into. Each session gets at least
+    REVIEW_AGENT_PARTITION_TOKENS of diff, so a small agent diff stays one session.
+
+    Args:
+        files: The parsed diff the agent reviews.
+        max_sessions: The most sessions to run at once, defaults to REVIEW_AGENT_SESSIONS.
+
+    Returns:
+        The partitions, largest first.
+    """
+    max_sessions = max_sessions or int(os.getenv("REVIEW_AGENT_SESSIONS", DEFAULT_AGENT_SESSIONS))
+    min_tokens = int(os.getenv("REVIEW_AGENT_PARTITION_TOKENS", DEFAULT_PARTITION_TOKENS))
+    partition_by = os.getenv("REVIEW_AGENT_PARTITION_BY", "package")
+    sessions = min(max_sessions, sum(estimate_tokens(file.text) for file in files) // max(min_tokens, 1))
+    if sessions <= 1:
+        return [Shard(files=list(files))]
+    owners = read_codeowners(workdir()) if partition_by == "owner" else None
+    return partition_files(files, sessions, partition_by, owners)
+
+
+async def review_partitioned_changes(
+    diff: str,
+    summary: dict,
+    agent_fn=review_commplex_changes,
+    max_sessions: int | None = None,
+    max_turns: int | None = None,
+) -> dict:
+    """
+        Splits a big agent review into subsystem partitions (see plan_agent_sessions) and runs
+        one agent session per partition at the same time, each on its own slice of the diff
+        with a smaller turn budget. The findings are merged and deduplicated.
+        A diff too small to split is reviewed in a single session.
+
+        Args:
+            diff: The diff for the agent.
+            summary: The summary of the changes.
+            agent_fn: The agent reviewer, called as agent_fn(diff, summary, max_turns=...) per partition.
+            max_sessions: The most sessions, defaults to REVIEW_AGENT_SESSIONS.
+            max_turns: The turn budget of each session, defaults to REVIEW_AGENT_PARTITION_TURNS.
+
+        Returns:
+            A dictionary containing the issues.
+    """
+    partitions = plan_agent_sessions(parse_diff(diff), max_sessions)
+    if len(partitions) <= 1:
+        return await _review_whole(diff, summary, agent_fn, "agent review")
+
+    max_turns = max_turns or int(os.getenv("REVIEW_AGENT_PARTITION_TURNS", DEFAULT_PARTITION_TURNS))
+    logger.info(f"Agent review split into {len(partitions)} sessions of up to {max_turns} turns: {[p.name for p in partitions]}")
+    session_fn = partial(agent_fn, max_turns=max_turns)
+    return await _review_shards(partitions, summary, session_fn, len(partitions), "agent sessions")
+
+
+async def _review_whole(diff: str, summary: dict, review_fn, kind: str = "review") -> dict:
+    """Runs one review over the whole diff within the run's budget."""
+    budget = current_budget()
+    if budget.exhausted():
+        budget.degrade(f"{len(parse_diff(diff))} files got no {kind}, the budget ran out first")
+        return not_reviewed(parse_diff(diff))
+    try:
+        review = await budget.run(review_fn(diff, summary))
+    except TimeoutError:
+        budget.degrade(f"The {kind} of {len(parse_diff(diff))} files was stopped at the deadline")
+        return not_reviewed(parse_diff(diff))
+    publish(review.get("issues", []))
+    return review
+
+
+async def _review_shards(shards: list[Shard], summary: dict, review_fn, max_concurrency: int, kind: str = "review shards") -> dict:
+    """
+    Reviews shards concurrently within the run's budget and merges their findings.
+    Shards not started when the budget runs out, or still running at the deadline, are dropped.
+    A shard whose review fails is dropped too, the other shards' findings are kept.
+    """
+    budget = current_budget()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    skipped: list[Shard] = []
+
+    async def review_shard(index: int, shard: Shard) -> dict:
+        async with semaphore:
+            # shards still queued when the time or money runs out are dropped, not started
+            if budget.exhausted():
+                skipped.append(shard)
+                return {"issues": []}
+            name = f" ({shard.name})" if shard.name else ""
+            logger.info(f"Shard {index + 1}/{len(shards)}{name}: {len(shard.files)} files, ~{shard.tokens} tokens")
+            review = await review_fn(shard.text, summary)
+        # findings go to the PR as each shard finishes, when progressive posting is on
+        publish(review.get("issues", []))
+        return review
+
+    tasks = {asyncio.ensure_future(review_shard(i, shard)): shard for i, shard in enumerate(shards)}
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=budget.timeout())
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    dropped = skipped + [tasks[task] for task in pending]
+    if dropped:
+        files = sum(len(shard.files) for shard in dropped)
+        budget.degrade(f"{len(dropped)} of {len(shards)} {kind} ({files} files) were not reviewed within the budget")
+    reviews, failed = [], []
+    for task in tasks:
+        if task not in done or tasks[task] in skipped:
+            continue
+        if task.exception() is not None:
+            shard = tasks[task]
+            name = f" ({shard.name})" if shard.name else ""
+            logger.error(f"Review of shard{name} with {len(shard.files)} files failed: {task.exception()!r}")
+            failed.append(shard)
+            continue
+        reviews.append(task.result())
+    if failed:
+        files = sum(len(shard.files) for shard in failed)
+        budget.degrade(f"{len(failed)} of {len(shards)} {kind} ({files} files) failed and were not reviewed")
+    return merge_reviews(reviews + [not_reviewed(shard.files) for shard in dropped + failed])
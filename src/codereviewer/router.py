@@ -0,0 +1,322 @@
+# picks how each file of a PR is reviewed.
+# every file is scored on its size in tokens, its language, how much it deletes, whether its path
+# looks security sensitive, and how many call sites in the repo use the definitions it changes.
+# files over the agent threshold go to the Claude agent, everything else gets the cheap sharded
+# OpenAI pass first. files the cheap pass flags (Security/Logic findings) or fails on are then
+# escalated to the agent, so the agent only runs where it is likely to pay for itself.
+# lockfiles, generated files and docs never go to the agent, however big they are.
+# under a run budget the agent only gets the highest-scoring files it can afford in time and money,
+# the files it drops get the cheap pass instead. a big agent diff is reviewed by several agent
+# sessions at once, one per subsystem partition (see reviewer.review_partitioned_changes).
+
+import logging
+import os
+import re
+import subprocess
+from collections import Counter
+from dataclasses import dataclass, field
+
+from .budget import AGENT_MIN_SECONDS, current_budget
+from .context import DEFINITION_RE, NAME_RE
+from .diffs import FileDiff, parse_diff
+from .job import workdir
+from .posting import publish
+from .reviewer import (
+    COMPLEX_REVIEW_MODEL,
+    SIMPLE_REVIEW_MODEL,
+    merge_reviews,
+    not_reviewed,
+    plan_agent_sessions,
+    review_sharded_changes,
+)
+from .sharding import DEFAULT_SHARD_TOKEN_BUDGET, estimate_tokens, shard_files
+from .telemetry import span, token_cost
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AGENT_THRESHOLD = 4.0
+DEFAULT_ESCALATE_CATEGORIES = ("Security", "Logic")
+# names looked up with git grep per review, the most changed first
+MAX_CALL_SITE_NAMES = 50
+
+# relative weight of a file's score by kind, 0 keeps it off the agent entirely
+LOW_RISK_NAMES = {
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "uv.lock", "Cargo.lock",
+    "Gemfile.lock", "composer.lock", "go.sum", "Pipfile.lock",
+}
+LOW_RISK_SUFFIXES = (".lock", ".min.js", ".min.css", ".map", ".snap", ".svg", ".md", ".rst", ".txt", ".csv")
+CONFIG_SUFFIXES = (".json", ".yaml", ".yml", ".toml", ".ini", ".cfg", ".xml", ".env")
+GENERATED_RE = re.compile(r"(^|/)(vendor|node_modules|dist|build|generated|__generated__)/|_pb2\.py$|\.pb\.go$")
+SENSITIVE_RE = re.compile(
+    r"auth|login|session|token|password|secret|crypt|permission|acl|payment|billing|migration|sql|security",
+    re.IGNORECASE,
+)
+
+# rough shape of the requests, for the predicted cost in the log
+SIMPLE_PROMPT_TOKENS = 600
+SIMPLE_OUTPUT_TOKENS = 800
+AGENT_BASE_TOKENS = 25000
+AGENT_CONTEXT_MULTIPLIER = 4
+AGENT_OUTPUT_TOKENS = 4000
+
+
+@dataclass
+class FileRoute:
+    path: str
+    score: float
+    tier: str
+    reasons: list[str] = field(default_factory=list)
+
+
+@dataclass
+class RoutePlan:
+    files: list[FileRoute]
+    predicted_cost: float = 0.0
+
+    def paths(self, tier: str) -> set[str]:
+        return {route.path for route in self.files if route.tier == tier}
+
+
+def language_weight(path: str) -> float:
+    name = os.path.basename(path)
+    if name in LOW_RISK_NAMES or path.endswith(LOW_RISK_SUFFIXES) or GENERATED_RE.search(path):
+        return 0.0
+    if path.endswith(CONFIG_SUFFIXES):
+        return 0.3
+    return 1.0
+
+
+def changed_names(file: FileDiff) -> list[str]:
+    """Definitions the file's hunks add, remove or change, including the function each hunk sits in."""
+    names = []
+    for hunk in file.hunks:
+        section = hunk.header.split("@@", 2)[-1] if hunk.header.count("@@") >= 2 else ""
+        lines = [section] + [line[1:] for line in hunk.lines if line.startswith(("+", "-"))]
+        for line in lines:
+            if DEFINITION_RE.match(line):
+                match = NAME_RE.search(line)
+                if match:
+                    names.append(match.group(1))
+    return names
+
+
+def count_call_sites(files: list[FileDiff], cwd: str | None = None) -> dict[str, int]:
+    """
+    Counts the references in the repo to the definitions each file changes, with one git grep.
+
+    Returns:
+        path -> number of call sites, 0 when git grep is unavailable.
+    """
+    names_by_file = {file.path: set(changed_names(file)) for file in files}
+    counts = Counter(name for names in names_by_file.values() for name in names)
+    names = [name for name, _ in counts.most_common(MAX_CALL_SITE_NAMES)]
+    if not names:
+        return {path: 0 for path in names_by_file}
+
+    patterns = [arg for name in names for arg in ("-e", name)]
+    try:
+        result = subprocess.run(
+            ["git", "grep", "-I", "-w", "-o", "-h", *patterns], cwd=cwd, capture_output=True, text=True, timeout=30
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return {path: 0 for path in names_by_file}
+    references = Counter(result.stdout.split())
+    # every name is referenced once by its own definition
+    return {
+        path: sum(max(references[name] - 1, 0) for name in names if name in references)
+        for path, names in names_by_file.items()
+    }
+
+
+def score_file(file: FileDiff, call_sites: int) -> FileRoute:
+    weight = language_weight(file.path)
+    tokens = estimate_tokens(file.text)
+    changed = file.insertions + file.deletions
+    reasons = []
+
+    score = min(tokens / 1500, 3.0)
+    if tokens >= 1500:
+        reasons.append(f"~{tokens} tokens")
+    if changed and file.deletions / changed > 0.5 and file.deletions >= 10:
+        score += 1.0
+        reasons.append(f"{file.deletions} deletions")
+    if call_sites:
+        score += min(call_sites / 5, 3.0)
+        reasons.append(f"{call_sites} call sites")
+    if SENSITIVE_RE.search(file.path):
+        score += 2.0
+        reasons.append("sensitive path")
+    score *= weight
+    if weight == 0:
+        reasons = ["lockfile, generated or docs"]
+    elif weight < 1:
+        reasons.append("config")
+    return FileRoute(path=file.path, score=round(score, 2), tier="cheap", reasons=reasons)
+
+
+def plan_review(files: list[FileDiff], call_sites: dict[str, int], threshold: float | None = None) -> RoutePlan:
+    """
+    Scores every file and assigns it to the cheap pass or the agent.
+
+    Args:
+        files: The parsed diff.
+        call_sites: path -> call sites touched, see count_call_sites.
+        threshold: Score from which a file goes straight to the agent, defaults to REVIEW_AGENT_THRESHOLD.
+
+    Returns:
+        The plan, with the predicted cost of running it without escalations.
+    """
+    threshold = threshold if threshold is not None else float(os.getenv("REVIEW_AGENT_THRESHOLD", DEFAULT_AGENT_THRESHOLD))
+    routes = []
+    for file in files:
+        route = score_file(file, call_sites.get(file.path, 0))
+        if not file.hunks:
+            route.tier = "skip"
+        elif route.score >= threshold:
+            route.tier = "agent"
+        routes.append(route)
+
+    plan = RoutePlan(files=routes)
+    by_path = {file.path: file for file in files}
+    plan.predicted_cost = predict_cost(
+        [by_path[path] for path in plan.paths("cheap")],
+        [by_path[path] for path in plan.paths("agent")],
+    )
+    return plan
+
+
+def predict_cost(cheap: list[FileDiff], agent: list[FileDiff], simple_model: str | None = None, agent_model: str | None = None) -> float:
+    """Estimated USD for one cheap pass over `cheap` and the agent sessions over `agent`."""
+    cost = 0.0
+    for shard in shard_files(cheap, DEFAULT_SHARD_TOKEN_BUDGET) if cheap else []:
+        cost += token_cost(simple_model or SIMPLE_REVIEW_MODEL, shard.tokens + SIMPLE_PROMPT_TOKENS, SIMPLE_OUTPUT_TOKENS) or 0.0
+    # every partitioned session pays the agent's base prompt again
+    for session in plan_agent_sessions(agent) if agent else []:
+        tokens_in = AGENT_BASE_TOKENS + session.tokens * AGENT_CONTEXT_MULTIPLIER
+        cost += token_cost(agent_model or COMPLEX_REVIEW_MODEL, tokens_in, AGENT_OUTPUT_TOKENS) or 0.0
+    return cost
+
+
+def fit_agent_budget(plan: RoutePlan, files: list[FileDiff], paths: set[str], reserved: float = 0.0) -> set[str]:
+    """
+    The highest-scoring of the agent paths whose predicted cost fits in the run's budget.
+
+    Args:
+        plan: The route plan, for the scores.
+        files: The parsed diff.
+        paths: The paths the agent would review.
+        reserved: USD of the budget already set aside for other work.
+
+    Returns:
+        The paths the agent can still review, all of them without a budget.
+    """
+    budget = current_budget()
+    if not paths or not budget.limited:
+        return paths
+    if budget.seconds_left() < AGENT_MIN_SECONDS:
+        budget.degrade(f"Not enough time left for the agent, {len(paths)} files got the cheap review only")
+        return set()
+
+    by_path = {file.path: file for file in files}
+    scores = {route.path: route.score for route in plan.files}
+    kept: list[FileDiff] = []
+    for path in sorted(paths, key=lambda path: -scores.get(path, 0)):
+        if predict_cost([], kept + [by_path[path]]) > budget.cost_left() - reserved:
+            break
+        kept.append(by_path[path])
+    if len(kept) < len(paths):
+        budget.degrade(
+            f"The agent only reviewed the riskiest {len(kept)} of {len(paths)} files routed to it, "
+            f"the rest got the cheap review only"
+        )
+    return {file.path for file in kept}
+
+
+def _log_plan(plan: RoutePlan) -> None:
+    agent = [route for route in plan.files if route.tier == "agent"]
+    logger.info(
+        f"Router: {len(plan.files)} files -> {len(plan.paths('cheap'))} cheap, {len(agent)} agent, "
+        f"{len(plan.paths('skip'))} skipped, predicted cost ${plan.predicted_cost:.4f}"
+    )
+    for route in sorted(agent, key=lambda r: -r.score)[:10]:
+        logger.info(f"Router: {route.path} -> agent (score {route.score}: {', '.join(route.reasons)})")
+
+
+async def review_routed(diff: str, summary: dict, simple_fn, agent_fn, cwd: str | None = None, threshold: float | None = None) -> dict:
+    """
+    Reviews a diff with the cheap pass first and the agent only where it is needed.
+
+    Args:
+        diff: The diff to review.
+        summary: The summary of the changes.
+        simple_fn: The cheap reviewer, run sharded over the cheap files.
+        agent_fn: The agent reviewer, run once over the agent and escalated files.
+        cwd: The repository, for counting call sites. Defaults to the job's checkout or the current directory.
+        threshold: See plan_review.
+
+    Returns:
+        A dictionary containing the issues.
+    """
+    files = parse_diff(diff)
+    with span("route") as route_span:
+        plan = plan_review(files, count_call_sites(files, cwd or workdir()), threshold)
+        route_span.record(
+            files=len(files),
+            agent_files=len(plan.paths("agent")),
+            predicted_cost_usd=round(plan.predicted_cost, 6),
+        )
+    _log_plan(plan)
+
+    cheap_paths, agent_paths = plan.paths("cheap"), plan.paths("agent")
+    # what the agent cannot afford goes through the cheap pass, with money kept back for that pass
+    by_path = {file.path: file for file in files}
+    affordable = fit_agent_budget(plan, files, agent_paths, reserved=predict_cost([by_path[path] for path in cheap_paths], []))
+    # files the agent should have reviewed only got the cheap pass, their results are not cached
+    short = agent_paths - affordable
+    cheap_paths, agent_paths = cheap_paths | short, affordable
+    reviews = []
+    failed: set[str] = set()
+
+    async def cheap_review(shard_diff: str, shard_summary: dict) -> dict:
+        try:
+            return await simple_fn(shard_diff, shard_summary)
+        except Exception as e:
+            paths = [file.path for file in parse_diff(shard_diff)]
+            logger.warning(f"Cheap review failed for {len(paths)} files, escalating them: {e}")
+            failed.update(paths)
+            return {"issues": []}
+
+    if cheap_paths:
+        cheap_diff = "".join(file.text for file in files if file.path in cheap_paths)
+        with span("review.cheap", files=len(cheap_paths)):
+            cheap = await review_sharded_changes(cheap_diff, summary, review_fn=cheap_review)
+        reviews.append(cheap)
+
+        categories = {
+            c.strip().lower()
+            for c in os.getenv("REVIEW_ESCALATE_CATEGORIES", ",".join(DEFAULT_ESCALATE_CATEGORIES)).split(",")
+            if c.strip()
+        }
+        flagged = {issue["file"] for issue in cheap.get("issues", []) if issue["category"].lower() in categories}
+        # lockfiles and generated files stay on the cheap path even when flagged
+        escalated = {path for path in (flagged | failed) & cheap_paths if language_weight(path) > 0}
+        if escalated:
+            logger.info(f"Router: escalating {len(escalated)} files to the agent ({len(failed & escalated)} failed, {len(flagged & escalated)} flagged)")
+            # the files routed to the agent up front keep their place, escalations get what is left
+            kept = fit_agent_budget(plan, files, escalated, reserved=predict_cost([], [by_path[path] for path in agent_paths]))
+            short |= escalated - kept
+            escalated = kept
+        # a failed cheap review that was not escalated left its files without any review
+        short |= failed - escalated
+        agent_paths = agent_paths | escalated
+
+    if agent_paths:
+        agent_diff = "".join(file.text for file in files if file.path in agent_paths)
+        with span("review.agent", files=len(agent_paths)):
+            agent = await agent_fn(agent_diff, summary)
+        publish(agent.get("issues", []))
+        reviews.append(agent)
+
+    if short:
+        reviews.append(not_reviewed([by_path[path] for path in short]))
+    return merge_reviews(reviews)
@@ -0,0 +1,370 @@
+# long-running review service for self-hosted setups.
+# a webhook receiver turns GitHub pull_request events into review jobs, and a bounded pool of
+# workers runs them in one process on the shared LLM and GitHub client pools. every job gets its
+# own git worktree off a per-repo mirror, its own telemetry tracer and its own PR context (job.py).
+# a newer push to a PR cancels the review of the older commit if it is running, and replaces it if
+# it is still queued, so outdated commits are never paid for.
+#
+#   python -m codereviewer.service
+#
+# listens on REVIEW_SERVICE_HOST:REVIEW_SERVICE_PORT, POST / for webhooks and GET /health for stats.
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .__main__ import run
+from .github_client import aclose_client
+from .job import ReviewJob, running
+from .providers import aclose_clients
+from .telemetry import Tracer, span, use_tracer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "codereviewer", "service")
+REVIEWED_ACTIONS = {"opened", "synchronize", "reopened", "ready_for_review"}
+
+
+def verify_signature(secret: str, body: bytes, signature: str | None) -> bool:
+    """Checks a webhook's X-Hub-Signature-256 header against the shared secret."""
+    if not signature or not signature.startswith("sha256="):
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature.removeprefix("sha256="))
+
+
+def job_from_event(event: str, payload: dict) -> ReviewJob | None:
+    """
+    The review job for a webhook, or None for events that do not need a review.
+
+    Args:
+        event: The X-GitHub-Event header.
+        payload: The parsed webhook body.
+    """
+    if event != "pull_request" or payload.get("action") not in REVIEWED_ACTIONS:
+        return None
+    pull_request = payload["pull_request"]
+    if pull_request.get("draft"):
+        return None
+    return ReviewJob(
+        repo=payload["repository"]["full_name"],
+        number=int(payload.get("number") or pull_request["number"]),
+        head_sha=pull_request["head"]["sha"],
+        base_ref=pull_request["base"]["ref"],
+        clone_url=payload["repository"].get("clone_url"),
+    )
+
+
+def git_auth_env(token: str) -> dict[str, str]:
+    """Git config, passed through the environment, that authenticates https fetches with the token."""
+    credentials = base64.b64encode(f"x-access-token:{token}".encode()).decode()
+    return {
+        "GIT_CONFIG_COUNT": "1",
+        "GIT_CONFIG_KEY_0": "http.extraHeader",
+        "GIT_CONFIG_VALUE_0": f"Authorization: Basic {credentials}",
+    }
+
+
+def _git(*args: str, cwd: str | None = None) -> subprocess.CompletedProcess:
+    return subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True, check=True)
+
+
+# one lock per mirror, git does not like concurrent fetches and worktree changes in one repo
+_mirror_locks: dict[str, threading.Lock] = {}
+_mirror_locks_guard = threading.Lock()
+
+
+def _mirror_lock(path: str) -> threading.Lock:
+    with _mirror_locks_guard:
+        return _mirror_locks.setdefault(path, threading.Lock())
+
+
+def prepare_workdir(job: ReviewJob, root: str) -> str:
+    """
+    Checks out the job's head commit in a worktree of the repo's mirror, cloning the mirror on first use.
+    A job without a head sha gets the PR head it checked out, that is the commit the review marks reviewed.
+
+    Returns:
+        The path of the worktree.
+    """
+    mirror = os.path.join(root, "repos", job.repo.replace("/", "__") + ".git")
+    url = job.clone_url or f"https://github.com/{job.repo}.git"
+    workdir = os.path.join(root, "worktrees", f"{job.repo.replace('/', '-')}-{job.number}-{uuid.uuid4().hex[:8]}")
+
+    with _mirror_lock(mirror):
+        if not os.path.isdir(mirror):
+            os.makedirs(os.path.dirname(mirror), exist_ok=True)
+            _git("clone", "--quiet", "--bare", url, mirror)
+        head = job.head_sha
+        try:
+            if head is None:
+                raise subprocess.CalledProcessError(1, "fetch")
+            _git("fetch", "--quiet", "--no-tags", "origin", head, cwd=mirror)
+        except subprocess.CalledProcessError:
+            # servers that do not serve commits by sha still serve the PR ref
+            _git("fetch", "--quiet", "--no-tags", "origin", f"+refs/pull/{job.number}/head:refs/pull/{job.number}/head", cwd=mirror)
+            head = head or _git("rev-parse", f"refs/pull/{job.number}/head", cwd=mirror).stdout.strip()
+        os.makedirs(os.path.dirname(workdir), exist_ok=True)
+        _git("worktree", "add", "--quiet", "--detach", workdir, head, cwd=mirror)
+    job.head_sha = head
+    return workdir
+
+
+def remove_workdir(workdir: str) -> None:
+    """Removes a worktree made by prepare_workdir."""
+    try:
+        common = _git("rev-parse", "--git-common-dir", cwd=workdir).stdout.strip()
+        mirror = os.path.normpath(os.path.join(workdir, common))
+        with _mirror_lock(mirror):
+            _git("worktree", "remove", "--force", workdir, cwd=mirror)
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.warning(f"Could not remove worktree {workdir} cleanly: {e}")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+class ReviewService:
+    """
+    Runs review jobs on a bounded worker pool, one review per PR at a time.
+
+    Usage:
+        service = ReviewService(workers=4)
+        service.start()
+        service.submit(ReviewJob("owner/repo", 12, head_sha="..."))
+        ...
+        await service.stop()
+    """
+
+    def __init__(self, workers: int | None = None, root: str | None = None, review_fn=None):
+        """
+        Args:
+            workers: Reviews run at once, defaults to REVIEW_SERVICE_WORKERS.
+            root: Where mirrors and worktrees live, defaults to REVIEW_SERVICE_ROOT.
+            review_fn: Runs one job, defaults to a full review in a fresh worktree.
+        """
+        self.workers = workers or int(os.getenv("REVIEW_SERVICE_WORKERS", DEFAULT_WORKERS))
+        self.root = root or os.getenv("REVIEW_SERVICE_ROOT", DEFAULT_ROOT)
+        self.review_fn = review_fn or self.review_job
+        self.completed = 0
+        self.failed = 0
+        self.superseded = 0
+        self._queue: asyncio.Queue[tuple[str, int]] = asyncio.Queue()
+        self._pending: dict[tuple[str, int], ReviewJob] = {}
+        self._running: dict[tuple[str, int], tuple[ReviewJob, asyncio.Task]] = {}
+        self._workers: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+            logger.info(f"Review service started with {self.workers} workers")
+
+    async def stop(self) -> None:
+        """Cancels the running reviews and stops the workers."""
+        for _, task in list(self._running.values()):
+            task.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, job: ReviewJob) -> None:
+        """
+        Queues a review. A newer commit of a PR replaces its queued review and cancels its running one.
+        Must be called on the service's event loop.
+        """
+        current = self._running.get(job.key)
+        if current is not None:
+            if current[0].head_sha == job.head_sha:
+                logger.info(f"{job} is already being reviewed")
+                return
+            logger.info(f"{job} supersedes {current[0]}, cancelling its review")
+            current[1].cancel()
+        if job.key in self._pending:
+            logger.info(f"{job} replaces queued {self._pending[job.key]}")
+            self.superseded += 1
+            self._pending[job.key] = job
+            return
+        self._pending[job.key] = job
+        self._queue.put_nowait(job.key)
+
+    async def join(self) -> None:
+        """Waits until every submitted review has finished."""
+        await self._queue.join()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": len(self._pending),
+            "running": [str(job) for job, _ in self._running.values()],
+            "completed": self.completed,
+            "failed": self.failed,
+            "superseded": self.superseded,
+        }
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._queue.get()
+            try:
+                await self._run_next(key)
+            finally:
+                self._queue.task_done()
+
+    async def _run_next(self, key: tuple[str, int]) -> None:
+        job = self._pending.pop(key, None)
+        if job is None:
+            return
+        task = asyncio.create_task(self.review_fn(job))
+        self._running[key] = (job, task)
+        try:
+            # wait without raising, so cancelling the job does not cancel the worker
+            await asyncio.wait({task})
+        finally:
+            if self._running.get(key, (None, None))[1] is task:
+                del self._running[key]
+        if task.cancelled():
+            self.superseded += 1
+            logger.info(f"Review of {job} cancelled")
+        elif task.exception() is not None:
+            self.failed += 1
+            logger.error(f"Review of {job} failed: {task.exception()}", exc_info=task.exception())
+        else:
+            self.completed += 1
+
+    async def review_job(self, job: ReviewJob) -> None:
+        """Reviews one job in its own worktree, with its own telemetry."""
+        # the checkout runs in a thread and is waited for even on cancel, so it is always cleaned up
+        prepare = asyncio.ensure_future(asyncio.to_thread(prepare_workdir, job, self.root))
+        try:
+            job.workdir = await asyncio.shield(prepare)
+            with running(job), use_tracer(Tracer()) as tracer:
+                with span("run", repo=job.repo, number=job.number):
+                    await run()
+                totals = tracer.report()["totals"]
+                logger.info(f"Reviewed {job} in {time.perf_counter() - tracer.started:.1f}s, ${totals['cost_usd']:.4f}")
+        finally:
+            if not prepare.done():
+                await asyncio.wait({prepare})
+            if not prepare.cancelled() and prepare.exception() is None:
+                await asyncio.to_thread(remove_workdir, prepare.result())
+
+
+class WebhookServer:
+    """
+    Receives GitHub webhooks on a background thread and submits review jobs to the service's loop.
+
+    Usage:
+        with WebhookServer(service, asyncio.get_running_loop(), port=8080) as server:
+            ...
+    """
+
+    def __init__(self, service: ReviewService, loop: asyncio.AbstractEventLoop, host: str = "127.0.0.1", port: int = 0, secret: str | None = None):
+        self.service = service
+        self.loop = loop
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self._server: ThreadingHTTPServer | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "WebhookServer":
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+            def _reply(self, status: int, data: dict) -> None:
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/health":
+                    self._reply(200, receiver.service.stats())
+                else:
+                    self._reply(404, {"message": "Not Found"})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if receiver.secret and not verify_signature(receiver.secret, body, self.headers.get("X-Hub-Signature-256")):
+                    self._reply(401, {"message": "Bad signature"})
+                    return
+                try:
+                    job = job_from_event(self.headers.get("X-GitHub-Event", ""), json.loads(body))
+                except (ValueError, KeyError, TypeError) as e:
+                    self._reply(400, {"message": f"Bad payload: {e}"})
+                    return
+                if job is None:
+                    self._reply(200, {"queued": False})
+                    return
+                receiver.loop.call_soon_threadsafe(receiver.service.submit, job)
+                logger.info(f"Queued review of {job}")
+                self._reply(202, {"queued": True, "job": str(job)})
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "WebhookServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+async def serve() -> None:
+    """Runs the webhook receiver and the worker pool until SIGINT or SIGTERM."""
+    secret = os.getenv("REVIEW_WEBHOOK_SECRET")
+    if not secret:
+        logger.warning("REVIEW_WEBHOOK_SECRET is not set, webhook signatures are not checked")
+    token = os.getenv("GITHUB_TOKEN")
+    if token and "GIT_CONFIG_COUNT" not in os.environ:
+        os.environ.update(git_auth_env(token))
+
+    loop = asyncio.get_running_loop()
+    stopped = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopped.set)
+
+    service = ReviewService()
+    service.start()
+    host = os.getenv("REVIEW_SERVICE_HOST", "127.0.0.1")
+    port = int(os.getenv("REVIEW_SERVICE_PORT", "8080"))
+    try:
+        with WebhookServer(service, loop, host, port, secret) as server:
+            logger.info(f"Listening for webhooks on {server.url}")
+            await stopped.wait()
+    finally:
+        await service.stop()
+        await aclose_clients()
+        await aclose_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
@@ -0,0 +1,207 @@
+# splits a pr diff into shards that fit a token budget so big prs can be reviewed in parallel.
+# files are grouped per file or per directory, oversized files are split between hunks,
+# and the groups are packed in diff order so related files tend to land in the same shard.
+# the agent review is split differently, into a fixed number of subsystem partitions (top-level
+# package or CODEOWNERS owner) balanced by size, so each agent session sees a whole subsystem.
+
+import fnmatch
+import os
+from dataclasses import dataclass, field
+
+from .diffs import FileDiff, parse_diff
+
+# rough chars-per-token ratio for code, good enough for budgeting without a tokenizer
+CHARS_PER_TOKEN = 4
+DEFAULT_SHARD_TOKEN_BUDGET = 30000
+GROUP_BY_MODES = ("file", "directory")
+PARTITION_BY_MODES = ("package", "owner")
+# directories that hold packages rather than being one, src/pkg is the package and not src
+CONTAINER_DIRS = {"src", "lib", "libs", "packages", "apps", "services", "cmd", "pkg", "internal", "modules"}
+CODEOWNERS_PATHS = (".github/CODEOWNERS", "CODEOWNERS", "docs/CODEOWNERS")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+@dataclass
+class Shard:
+    files: list[FileDiff] = field(default_factory=list)
+    # the packages or owners of a partition, for the logs
+    name: str = ""
+
+    @property
+    def text(self) -> str:
+        return "".join(file.text for file in self.files)
+
+    @property
+    def paths(self) -> list[str]:
+        return [file.path for file in self.files]
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+
+def _group_key(file: FileDiff, group_by: str) -> str:
+    if group_by == "directory":
+        return os.path.dirname(file.path)
+    return file.path
+
+
+def _split_file(file: FileDiff, token_budget: int) -> list[FileDiff]:
+    """
+    Splits a single oversized file diff between hunks. A single hunk bigger than the
+    budget is kept whole, since cutting inside a hunk would break the diff.
+    """
+    header_tokens = estimate_tokens("\n".join(file.header))
+    pieces, hunks, tokens = [], [], header_tokens
+    for hunk in file.hunks:
+        hunk_tokens = estimate_tokens(hunk.text)
+        if hunks and tokens + hunk_tokens > token_budget:
+            pieces.append(file.with_hunks(hunks))
+            hunks, tokens = [], header_tokens
+        hunks.append(hunk)
+        tokens += hunk_tokens
+    if hunks or not pieces:
+        pieces.append(file.with_hunks(hunks))
+    return pieces
+
+
+def shard_files(files: list[FileDiff], token_budget: int = DEFAULT_SHARD_TOKEN_BUDGET, group_by: str = "directory") -> list[Shard]:
+    """
+    Packs parsed file diffs into shards of at most token_budget estimated tokens.
+
+    Args:
+        files: The parsed file diffs.
+        token_budget: The target size of each shard in tokens.
+        group_by: "file" or "directory". Files of one directory are kept together when they fit.
+
+    Returns:
+        The shards in diff order.
+    """
+    groups: dict[str, list[FileDiff]] = {}
+    for file in files:
+        groups.setdefault(_group_key(file, group_by), []).append(file)
+
+    # each unit is a list of file diffs that should stay in one shard
+    units: list[list[FileDiff]] = []
+    for group in groups.values():
+        if estimate_tokens("".join(file.text for file in group)) <= token_budget:
+            units.append(group)
+            continue
+        for file in group:
+            if estimate_tokens(file.text) <= token_budget:
+                units.append([file])
+            else:
+                units.extend([piece] for piece in _split_file(file, token_budget))
+
+    shards: list[Shard] = []
+    current, tokens = Shard(), 0
+    for unit in units:
+        unit_tokens = estimate_tokens("".join(file.text for file in unit))
+        if current.files and tokens + unit_tokens > token_budget:
+            shards.append(current)
+            current, tokens = Shard(), 0
+        current.files.extend(unit)
+        tokens += unit_tokens
+    if current.files:
+        shards.append(current)
+    return shards
+
+
+def shard_diff(diff: str, token_budget: int = DEFAULT_SHARD_TOKEN_BUDGET, group_by: str = "directory") -> list[Shard]:
+    """
+    Parses a diff and packs it into shards of at most token_budget estimated tokens.
+    """
+    return shard_files(parse_diff(diff), token_budget, group_by)
+
+
+def package_of(path: str) -> str:
+    """The top-level package of a path, one level further down below src/, packages/ and the like."""
+    parts = path.split("/")[:-1]
+    if not parts:
+        return "."
+    if parts[0] in CONTAINER_DIRS and len(parts) > 1:
+        return "/".join(parts[:2])
+    return parts[0]
+
+
+def read_codeowners(cwd: str | None = None) -> list[tuple[str, str]]:
+    """
+    The (pattern, owners) rules of the repo's CODEOWNERS file, empty if it has none.
+    """
+    for candidate in CODEOWNERS_PATHS:
+        try:
+            with open(os.path.join(cwd or ".", candidate)) as f:
+                lines = f.read().splitlines()
+        except OSError:
+            continue
+        rules = []
+        for line in lines:
+            fields = line.split("#", 1)[0].split()
+            if len(fields) >= 2:
+                rules.append((fields[0], " ".join(fields[1:])))
+        return rules
+    return []
+
+
+def _codeowners_match(pattern: str, path: str) -> bool:
+    # a pattern with a slash is anchored at the repo root, one without matches any file or directory name
+    if "/" in pattern.rstrip("/"):
+        pattern = pattern.strip("/")
+        # a directory owns everything below it
+        return fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(path, f"{pattern}/*")
+    pattern = pattern.rstrip("/")
+    return any(fnmatch.fnmatch(part, pattern) for part in path.split("/"))
+
+
+def owner_of(path: str, rules: list[tuple[str, str]]) -> str | None:
+    """The owners of a path, the last matching rule wins like on GitHub. None if no rule matches."""
+    for pattern, owners in reversed(rules):
+        if _codeowners_match(pattern, path):
+            return owners
+    return None
+
+
+def partition_files(
+    files: list[FileDiff],
+    max_partitions: int,
+    by: str = "package",
+    owners: list[tuple[str, str]] | None = None,
+) -> list[Shard]:
+    """
+    Splits file diffs into at most max_partitions subsystem partitions of similar size.
+
+    Args:
+        files: The parsed file diffs.
+        max_partitions: How many partitions to make at most.
+        by: "package" groups by top-level package, "owner" by CODEOWNERS owner (package if unowned).
+        owners: The CODEOWNERS rules, see read_codeowners.
+
+    Returns:
+        The partitions, largest first, with the files of each in diff order.
+    """
+    groups: dict[str, list[FileDiff]] = {}
+    for file in files:
+        key = owner_of(file.path, owners or []) if by == "owner" else None
+        groups.setdefault(key or package_of(file.path), []).append(file)
+
+    # largest group first into the smallest partition, so the largest partition stays as small as it can
+    order = {file.path: i for i, file in enumerate(files)}
+    sized = sorted(groups.items(), key=lambda item: -estimate_tokens("".join(file.text for file in item[1])))
+    partitions: list[tuple[int, list[str], list[FileDiff]]] = []
+    for key, group in sized:
+        tokens = estimate_tokens("".join(file.text for file in group))
+        if len(partitions) < max_partitions:
+            partitions.append((tokens, [key], list(group)))
+            continue
+        smallest = min(range(len(partitions)), key=lambda i: partitions[i][0])
+        size, keys, members = partitions[smallest]
+        partitions[smallest] = (size + tokens, keys + [key], members + group)
+
+    partitions.sort(key=lambda partition: -partition[0])
+    return [
+        Shard(files=sorted(members, key=lambda file: order[file.path]), name=", ".join(keys))
+        for _, keys, members in partitions
+    ]
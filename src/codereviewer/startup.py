@@ -0,0 +1,83 @@
+# startup import profiling.
+# with REVIEW_PROFILE_IMPORTS=on the package installs an import hook before anything else is
+# loaded and times every module import, like python -X importtime but readable from inside the
+# run: the slowest modules are logged at the end and added to the telemetry report.
+
+import importlib.abc
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# module -> [cumulative seconds, self seconds]
+_timings: dict[str, list[float]] = {}
+_stack: list[list[float]] = []
+
+
+class _TimedLoader(importlib.abc.Loader):
+    def __init__(self, loader, name: str):
+        self._loader = loader
+        self._name = name
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        # children add their time to the frame below, which is subtracted for self time
+        _stack.append([0.0])
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            cumulative = time.perf_counter() - start
+            children = _stack.pop()[0]
+            if _stack:
+                _stack[-1][0] += cumulative
+            _timings[self._name] = [cumulative, cumulative - children]
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, fullname)
+                return spec
+        return None
+
+
+_finder = _TimingFinder()
+
+
+def profiling_enabled() -> bool:
+    return os.getenv("REVIEW_PROFILE_IMPORTS", "off").lower() in ("1", "on", "true", "yes")
+
+
+def install() -> None:
+    """Starts timing imports. Modules imported before this call are not covered."""
+    if _finder not in sys.meta_path:
+        sys.meta_path.insert(0, _finder)
+
+
+def import_profile(limit: int = 25) -> list[dict]:
+    """The slowest imports so far, by cumulative time."""
+    rows = sorted(_timings.items(), key=lambda item: -item[1][0])[:limit]
+    return [{"module": name, "seconds": cumulative, "self_seconds": own} for name, (cumulative, own) in rows]
+
+
+def log_import_profile(limit: int = 25) -> list[dict]:
+    """Logs the slowest imports and returns them, see import_profile."""
+    profile = import_profile(limit)
+    total = sum(own for _, own in _timings.values())
+    logger.info(f"Import profile: {len(_timings)} modules, {total:.3f}s")
+    for row in profile:
+        logger.info(f"  {row['seconds'] * 1000:8.1f}ms cumulative {row['self_seconds'] * 1000:8.1f}ms self  {row['module']}")
+    return profile
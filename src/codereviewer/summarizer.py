@@ -1,27 +1,232 @@
 # planning straight up api call with the diff to chatgpt and very cheap for a general summary. give it some
 # structure so it knows how to make the output look nice and readable.
+# big diffs are summarized map-reduce: the files are packed into chunks that are summarized
+# concurrently into short per-file notes, and one last call turns the notes into the summary.
+# the notes are cached per file content, so on a later push only the files that changed are sent.
+# a PR with more notes than fit in one call gets a per-directory pass in between.
 
-from langchain_openai import ChatOpenAI
-from .prompts import get_summarizer_prompt
-from .models import SummaryOutput
+import asyncio
+import logging
+import os
 
+from .cache import ReviewCache, summary_key
+from .diffs import FileDiff, parse_diff
+from .providers import DEFAULT_MODEL, ainvoke_structured
+from .prompts import (
+    get_directory_summary_prompt,
+    get_file_summary_prompt,
+    get_summarizer_prompt,
+    get_summary_reduce_prompt,
+)
+from .models import FileSummariesOutput, SummaryOutput
+from .sharding import DEFAULT_SHARD_TOKEN_BUDGET, estimate_tokens, shard_files
+from .telemetry import span
 
-async def summarize_changes(diff: str) -> dict:
+logger = logging.getLogger(__name__)
+
+DEFAULT_SUMMARY_TOKEN_BUDGET = DEFAULT_SHARD_TOKEN_BUDGET
+
+
+async def summarize_changes(
+    diff: str,
+    cache: ReviewCache | None = None,
+    token_budget: int | None = None,
+    max_concurrency: int | None = None,
+) -> dict:
     """
     Summarizes the changes in a pull request diff.
+    A diff over the token budget is summarized map-reduce, see summarize_map_reduce.
 
     Args:
         diff: The diff of the pull request.
+        cache: Where per-file notes of big diffs are kept between runs, or None.
+        token_budget: The size of one summarizer call in tokens, defaults to REVIEW_SUMMARY_TOKEN_BUDGET.
+        max_concurrency: How many map calls run at once, defaults to REVIEW_MAX_CONCURRENCY.
 
     Returns:
         A dictionary containing the summary and number_of_changes.
     """
-    llm = ChatOpenAI(model="gpt-5-mini")
-    structured_llm = llm.with_structured_output(SummaryOutput)
+    token_budget = token_budget or int(os.getenv("REVIEW_SUMMARY_TOKEN_BUDGET", DEFAULT_SUMMARY_TOKEN_BUDGET))
+    if estimate_tokens(diff) > token_budget:
+        return await summarize_map_reduce(parse_diff(diff), cache, token_budget, max_concurrency)
+
     prompt = get_summarizer_prompt(diff)
-    response = structured_llm.invoke(prompt)
+    response = await ainvoke_structured(prompt, SummaryOutput)
     return {
         "summary": response.summary, 
         "number_of_changes": response.number_of_changes
     }
 
+
+def _local_note(file: FileDiff) -> str:
+    """A note for a file the map step does not send, or that the model left out."""
+    if file.binary:
+        return "Binary file changed."
+    if file.spill_path:
+        return f"Too large to summarize (+{file.insertions}/-{file.deletions} lines)."
+    if not file.hunks:
+        return "Renamed or mode change only."
+    return f"Changed (+{file.insertions}/-{file.deletions} lines)."
+
+
+def _render_notes(notes: list[tuple[str, str]]) -> str:
+    return "\n".join(f"- **{path}**: {note}" for path, note in notes)
+
+
+def _pack(notes: list[tuple[str, str]], token_budget: int) -> list[list[tuple[str, str]]]:
+    """Packs notes in order into chunks of at most token_budget estimated tokens."""
+    chunks, current, tokens = [], [], 0
+    for path, note in notes:
+        note_tokens = estimate_tokens(f"- **{path}**: {note}")
+        if current and tokens + note_tokens > token_budget:
+            chunks.append(current)
+            current, tokens = [], 0
+        current.append((path, note))
+        tokens += note_tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def summarize_map_reduce(
+    files: list[FileDiff],
+    cache: ReviewCache | None = None,
+    token_budget: int = DEFAULT_SUMMARY_TOKEN_BUDGET,
+    max_concurrency: int | None = None,
+    model: str = DEFAULT_MODEL,
+) -> dict:
+    """
+    Summarizes a big diff in three steps: concurrent per-file notes for the files the cache
+    does not have, per-directory notes if the file notes do not fit in one call, and a reduce
+    call that writes the summary from the notes.
+
+    Args:
+        files: The parsed diff.
+        cache: Where per-file notes are kept between runs, or None.
+        token_budget: The size of one call in tokens.
+        max_concurrency: How many map calls run at once, defaults to REVIEW_MAX_CONCURRENCY.
+        model: The summarizer model, part of the cache key.
+
+    Returns:
+        A dictionary containing the summary and number_of_changes.
+    """
+    max_concurrency = max_concurrency or int(os.getenv("REVIEW_MAX_CONCURRENCY", "4"))
+    notes: dict[str, str] = {}
+    keys: dict[str, str] = {}
+    missed: list[FileDiff] = []
+    for file in files:
+        if file.binary or file.spill_path or not file.hunks:
+            notes[file.path] = _local_note(file)
+            continue
+        if cache is not None:
+            keys[file.path] = summary_key(file, model)
+            stored = cache.get_summary(keys[file.path])
+            if stored is not None:
+                notes[file.path] = stored
+                continue
+        missed.append(file)
+    if cache is not None:
+        cache.commit()
+
+    chunks = shard_files(missed, token_budget, group_by="directory")
+    logger.info(
+        f"Summarizing {len(files)} files map-reduce: {len(missed)} in {len(chunks)} chunks, "
+        f"{len(files) - len(missed)} cached or skipped"
+    )
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def summarize_chunk(chunk) -> list[tuple[str, str]]:
+        async with semaphore:
+            response = await ainvoke_structured(get_file_summary_prompt(chunk.text), FileSummariesOutput, model)
+        return [(entry.file, entry.summary.strip()) for entry in response.files]
+
+    with span("summarize.map", files=len(missed), chunks=len(chunks), cached=len(files) - len(missed)):
+        results = await asyncio.gather(*(summarize_chunk(chunk) for chunk in chunks))
+
+    # an oversized file is split across chunks, its notes are joined back in diff order
+    fresh: dict[str, list[str]] = {}
+    paths = {file.path for file in missed}
+    for entries in results:
+        for path, note in entries:
+            path = path.removeprefix("a/").removeprefix("b/")
+            if path in paths and note:
+                fresh.setdefault(path, []).append(note)
+    for file in missed:
+        if file.path in fresh:
+            notes[file.path] = " ".join(fresh[file.path])
+            if cache is not None:
+                cache.put_summary(keys[file.path], notes[file.path])
+        else:
+            notes[file.path] = _local_note(file)
+    if cache is not None:
+        cache.commit()
+
+    ordered = [(file.path, notes[file.path]) for file in files]
+    if estimate_tokens(_render_notes(ordered)) > token_budget:
+        ordered = await _summarize_directories(ordered, token_budget, semaphore, model)
+
+    insertions = sum(file.insertions for file in files)
+    deletions = sum(file.deletions for file in files)
+    stat = f"{len(files)} files changed, +{insertions}/-{deletions} lines"
+    with span("summarize.reduce", notes=len(ordered)):
+        response = await ainvoke_structured(get_summary_reduce_prompt(_render_notes(ordered), stat), SummaryOutput, model)
+    return {
+        "summary": response.summary,
+        "number_of_changes": len(files)
+    }
+
+
+async def _summarize_directories(
+    notes: list[tuple[str, str]], token_budget: int, semaphore: asyncio.Semaphore, model: str
+) -> list[tuple[str, str]]:
+    """Condenses per-file notes into per-directory notes, keeping the files of a directory together."""
+    by_directory: dict[str, list[tuple[str, str]]] = {}
+    for path, note in notes:
+        by_directory.setdefault(os.path.dirname(path) or ".", []).append((path, note))
+    grouped = [note for group in by_directory.values() for note in group]
+
+    async def summarize_chunk(chunk: list[tuple[str, str]]) -> list[tuple[str, str]]:
+        async with semaphore:
+            response = await ainvoke_structured(get_directory_summary_prompt(_render_notes(chunk)), FileSummariesOutput, model)
+        return [(entry.file, entry.summary.strip()) for entry in response.files]
+
+    chunks = _pack(grouped, token_budget)
+    with span("summarize.directories", chunks=len(chunks)):
+        results = await asyncio.gather(*(summarize_chunk(chunk) for chunk in chunks))
+    condensed = [entry for entries in results for entry in entries]
+    # whatever the model wrote, the reduce call has to fit
+    dropped = 0
+    while condensed and estimate_tokens(_render_notes(condensed)) > token_budget:
+        condensed.pop()
+        dropped += 1
+    if dropped:
+        logger.warning(f"Dropped {dropped} directory notes to fit the summary in {token_budget} tokens")
+    return condensed
+
+
+
+def build_local_summary(diff_stat: dict, max_files: int = 50) -> dict:
+    """
+    Builds a cheap summary from the diff stats without calling the LLM.
+    Used as the review hint when the review does not wait for the real summary.
+
+    Args:
+        diff_stat: The diff stats from get_diff_stat.
+        max_files: The maximum number of file names to list.
+
+    Returns:
+        A dictionary containing the summary and number_of_changes.
+    """
+    files = diff_stat["files"]
+    lines = [
+        f"Changes touch {len(files)} files "
+        f"(+{diff_stat['insertions']}/-{diff_stat['deletions']} lines).",
+        "Changed files:",
+    ]
+    lines.extend(f"- {file}" for file in files[:max_files])
+    if len(files) > max_files:
+        lines.append(f"- ... and {len(files) - max_files} more")
+    return {
+        "summary": "\n".join(lines),
+        "number_of_changes": len(files)
+    }
@@ -0,0 +1,303 @@
+# symbol and call-site index for the complex reviewer.
+# before the agent starts, the definitions the diff touches are looked up locally: their signatures,
+# every call site in the repo (with the function each call sits in) and the repo functions they call.
+# python is parsed with ast, other languages fall back to definition-line matching and git grep hits.
+# the slice is put in the agent prompt and served by a lookup_symbol tool, so the agent does not
+# spend its turns grepping for callers and signatures.
+
+import ast
+import asyncio
+import logging
+import os
+import subprocess
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from .channel import SERVER_NAME
+from .context import DEFINITION_RE, NAME_RE, FileReader, _changed_new_lines, make_file_reader
+from .diffs import FileDiff
+from .providers import load_backend
+
+logger = logging.getLogger(__name__)
+
+# names looked up per review, changed definitions first
+MAX_NAMES = 60
+# python files parsed for call sites
+MAX_PARSED_FILES = 300
+DEFAULT_MAX_CALLERS = 10
+LOOKUP_TOOL_NAME = "lookup_symbol"
+QUALIFIED_LOOKUP_TOOL_NAME = f"mcp__{SERVER_NAME}__{LOOKUP_TOOL_NAME}"
+# names too common to say anything about a call site
+IGNORED_NAMES = {"__init__", "main", "run", "get", "set", "update", "append", "format", "print", "len", "str", "int", "dict", "list"}
+
+
+@dataclass
+class Definition:
+    name: str
+    path: str
+    line: int
+    signature: str
+
+
+@dataclass
+class CallSite:
+    path: str
+    line: int
+    caller: str | None
+    text: str
+
+
+@dataclass
+class SymbolIndex:
+    """Definitions changed by a diff, their call sites and the repo definitions they call."""
+
+    changed: list[Definition] = field(default_factory=list)
+    definitions: dict[str, list[Definition]] = field(default_factory=lambda: defaultdict(list))
+    callers: dict[str, list[CallSite]] = field(default_factory=lambda: defaultdict(list))
+    callees: dict[str, set[str]] = field(default_factory=lambda: defaultdict(set))
+    read_file: FileReader | None = None
+    cwd: str | None = None
+
+    def lookup(self, name: str, max_callers: int = 25) -> str:
+        """
+        Definitions and call sites of a name, searched in the repo if the index does not have it yet.
+        """
+        name = name.strip().split(".")[-1].split("(")[0]
+        if not name.isidentifier():
+            return f"'{name}' is not a symbol name"
+        if name not in self.definitions and name not in self.callers and self.read_file is not None:
+            _search(self, [name])
+        lines = [f"{d.path}:{d.line} {d.signature}" for d in self.definitions.get(name, [])]
+        if not lines:
+            lines.append(f"No definition of {name} found in the repo")
+        callers = self.callers.get(name, [])
+        lines.append(f"call sites ({len(callers)}):")
+        lines.extend(f"  {_format_call(call)}" for call in callers[:max_callers])
+        if len(callers) > max_callers:
+            lines.append(f"  ... and {len(callers) - max_callers} more")
+        return "\n".join(lines)
+
+    def render(self, max_callers: int | None = None) -> str:
+        """The slice for the agent prompt, empty when the diff changes no definitions."""
+        if not self.changed:
+            return ""
+        max_callers = max_callers or int(os.getenv("REVIEW_SYMBOL_CALLERS", DEFAULT_MAX_CALLERS))
+        lines = []
+        for definition in self.changed:
+            lines.append(f"{definition.path}:{definition.line} {definition.signature}")
+            callers = [
+                call for call in self.callers.get(definition.name, [])
+                if (call.path, call.line) != (definition.path, definition.line)
+            ]
+            if callers:
+                lines.append(f"  called from ({len(callers)}):")
+                lines.extend(f"    {_format_call(call)}" for call in callers[:max_callers])
+                if len(callers) > max_callers:
+                    lines.append(f"    ... and {len(callers) - max_callers} more")
+            else:
+                lines.append("  no call sites in the repo")
+            for callee in sorted(self.callees.get(_key(definition), ())):
+                for target in self.definitions.get(callee, [])[:3]:
+                    lines.append(f"  calls {target.path}:{target.line} {target.signature}")
+        return "\n".join(lines)
+
+
+def _key(definition: Definition) -> str:
+    return f"{definition.path}:{definition.line}"
+
+
+def _format_call(call: CallSite) -> str:
+    where = f" in {call.caller}" if call.caller else ""
+    return f"{call.path}:{call.line}{where}: {call.text}"
+
+
+def _signature(node: ast.AST) -> str:
+    if isinstance(node, ast.ClassDef):
+        bases = ", ".join(ast.unparse(base) for base in node.bases)
+        return f"class {node.name}({bases})" if bases else f"class {node.name}"
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+    return f"{prefix} {node.name}({ast.unparse(node.args)}){returns}"
+
+
+def _call_name(node: ast.Call) -> str | None:
+    if isinstance(node.func, ast.Name):
+        return node.func.id
+    if isinstance(node.func, ast.Attribute):
+        return node.func.attr
+    return None
+
+
+class _PythonScanner(ast.NodeVisitor):
+    """Collects definitions and calls of a file, with the qualified name of the enclosing scope."""
+
+    def __init__(self, path: str, source: list[str]):
+        self.path = path
+        self.source = source
+        self.scope: list[str] = []
+        self.definitions: list[ast.AST] = []
+        self.calls: list[tuple[str, CallSite]] = []
+
+    def _visit_scope(self, node):
+        self.definitions.append(node)
+        self.scope.append(node.name)
+        self.generic_visit(node)
+        self.scope.pop()
+
+    visit_FunctionDef = visit_AsyncFunctionDef = visit_ClassDef = _visit_scope
+
+    def visit_Call(self, node: ast.Call):
+        name = _call_name(node)
+        if name:
+            text = self.source[node.lineno - 1].strip() if node.lineno <= len(self.source) else ""
+            caller = ".".join(self.scope) or None
+            self.calls.append((name, CallSite(self.path, node.lineno, caller, text[:160])))
+        self.generic_visit(node)
+
+
+def _scan_python(path: str, source: list[str]) -> _PythonScanner | None:
+    try:
+        tree = ast.parse("\n".join(source))
+    except (SyntaxError, ValueError):
+        return None
+    scanner = _PythonScanner(path, source)
+    scanner.visit(tree)
+    return scanner
+
+
+def _changed_definitions(file: FileDiff, source: list[str], index: SymbolIndex) -> None:
+    """Adds the definitions a file's hunks touch to the index, with the names they call."""
+    changed_lines = {line for hunk in file.hunks for line in _changed_new_lines(hunk)}
+    scanner = _scan_python(file.path, source) if file.path.endswith(".py") else None
+    if scanner is not None:
+        for node in scanner.definitions:
+            start = min([node.lineno, *(d.lineno for d in node.decorator_list)])
+            end = node.end_lineno or node.lineno
+            if isinstance(node, ast.ClassDef) and node.body:
+                # a class is only listed when its own lines change, not for every changed method
+                end = node.body[0].lineno - 1
+            if any(start <= line <= end for line in changed_lines):
+                definition = Definition(node.name, file.path, node.lineno, _signature(node))
+                index.changed.append(definition)
+                index.definitions[node.name].append(definition)
+                for inner in ast.walk(node):
+                    if isinstance(inner, ast.Call) and (name := _call_name(inner)) and name != node.name:
+                        index.callees[_key(definition)].add(name)
+        return
+
+    # other languages: definition lines among the changed lines, located in the new file
+    for hunk in file.hunks:
+        section = hunk.header.split("@@", 2)[-1] if hunk.header.count("@@") >= 2 else ""
+        for text in [section] + [line[1:] for line in hunk.lines if line.startswith(("+", "-"))]:
+            match = NAME_RE.search(text) if DEFINITION_RE.match(text) else None
+            if not match or any(d.name == match.group(1) and d.path == file.path for d in index.changed):
+                continue
+            number = next((i + 1 for i, line in enumerate(source) if DEFINITION_RE.match(line) and NAME_RE.search(line) and NAME_RE.search(line).group(1) == match.group(1)), 0)
+            signature = source[number - 1].strip() if number else f"{text.strip()} (removed)"
+            definition = Definition(match.group(1), file.path, number, signature)
+            index.changed.append(definition)
+            if number:
+                index.definitions[definition.name].append(definition)
+
+
+def _grep(names: list[str], cwd: str | None) -> list[tuple[str, int, str]]:
+    """Every line of a tracked file that mentions one of the names, as (path, line, text)."""
+    patterns = [arg for name in names for arg in ("-e", name)]
+    try:
+        result = subprocess.run(
+            ["git", "grep", "-I", "-n", "-w", "--full-name", *patterns],
+            cwd=cwd, capture_output=True, text=True, errors="replace", timeout=30,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+    hits = []
+    for line in result.stdout.splitlines():
+        path, _, rest = line.partition(":")
+        number, _, text = rest.partition(":")
+        if number.isdigit():
+            hits.append((path, int(number), text))
+    return hits
+
+
+def _search(index: SymbolIndex, names: list[str]) -> None:
+    """Adds the definitions and call sites of names across the repo to the index."""
+    wanted = set(names)
+    hits = _grep(names, index.cwd)
+    by_path: dict[str, list[tuple[int, str]]] = defaultdict(list)
+    for path, number, text in hits:
+        by_path[path].append((number, text))
+
+    known = {(d.path, d.line) for ds in index.definitions.values() for d in ds}
+    parsed = 0
+    for path, lines in by_path.items():
+        if path.endswith(".py") and parsed < MAX_PARSED_FILES:
+            source = index.read_file(path)
+            scanner = _scan_python(path, source) if source is not None else None
+            if scanner is not None:
+                parsed += 1
+                for node in scanner.definitions:
+                    if node.name in wanted and (path, node.lineno) not in known:
+                        index.definitions[node.name].append(Definition(node.name, path, node.lineno, _signature(node)))
+                for name, call in scanner.calls:
+                    if name in wanted:
+                        index.callers[name].append(call)
+                continue
+        # no ast: definition lines are definitions, every other mention counts as a call site
+        for number, text in lines:
+            match = NAME_RE.search(text) if DEFINITION_RE.match(text) else None
+            if match and match.group(1) in wanted:
+                if (path, number) not in known:
+                    index.definitions[match.group(1)].append(Definition(match.group(1), path, number, text.strip()[:160]))
+                continue
+            for name in wanted:
+                if name in text:
+                    index.callers[name].append(CallSite(path, number, None, text.strip()[:160]))
+    for name in wanted:
+        index.callers.setdefault(name, [])
+
+
+def build_symbol_index(files: list[FileDiff], read_file: FileReader | None = None, cwd: str | None = None) -> SymbolIndex:
+    """
+    Indexes the definitions a diff changes, their callers and the repo definitions they call.
+
+    Args:
+        files: The parsed diff.
+        read_file: Loads the new version of a file, defaults to the working tree at cwd.
+        cwd: The repository.
+
+    Returns:
+        The index, see SymbolIndex.render for the agent's slice of it.
+    """
+    index = SymbolIndex(read_file=read_file or make_file_reader(cwd=cwd), cwd=cwd)
+    for file in files:
+        if file.binary or not file.hunks:
+            continue
+        source = index.read_file(file.path)
+        if source is not None:
+            _changed_definitions(file, source, index)
+
+    changed_names = list(dict.fromkeys(d.name for d in index.changed if d.name not in IGNORED_NAMES))
+    called = {name for names in index.callees.values() for name in names} - set(changed_names) - IGNORED_NAMES
+    names = (changed_names + sorted(called))[:MAX_NAMES]
+    if names:
+        _search(index, names)
+    # calls into the standard library or dependencies have no definition in the repo
+    for key in list(index.callees):
+        index.callees[key] = {name for name in index.callees[key] if index.definitions.get(name)}
+    return index
+
+
+def lookup_tool(index: SymbolIndex):
+    """The lookup_symbol tool for the agent, answering from the index."""
+    @load_backend("claude").tool(
+        LOOKUP_TOOL_NAME,
+        "Look up a function or class in the repo: its definitions with signatures and every call site. "
+        "Faster than grepping.",
+        {"name": str},
+    )
+    async def lookup_symbol(args: dict) -> dict:
+        # names outside the index are searched with git grep, keep that off the event loop
+        text = await asyncio.to_thread(index.lookup, str(args.get("name", "")))
+        return {"content": [{"type": "text", "text": text}]}
+
+    return lookup_symbol
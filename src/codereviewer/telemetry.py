@@ -0,0 +1,216 @@
+# per-run tracing.
+# every stage of a run is a span with its wall time and whatever the stage knows about itself:
+# tokens in and out, cost, retries, payload sizes. spans nest through a contextvar, so LLM calls
+# and GitHub requests made inside a stage (or inside tasks the stage started) land under it.
+# at the end of the run the spans are written as a JSON report (REVIEW_TELEMETRY_PATH) and as a
+# markdown table in the GitHub step summary.
+
+import json
+import logging
+import os
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# USD per million tokens (input, output), for models that do not report their own cost
+MODEL_PRICES = {
+    "gpt-5-mini": (0.25, 2.00),
+    "gpt-5": (1.25, 10.00),
+    "claude-haiku-4-5-20251001": (1.00, 5.00),
+}
+# cached prompt tokens are billed at this fraction of the input price (OpenAI and Anthropic cache reads)
+CACHED_INPUT_RATE = 0.1
+# attributes that are summed when recorded more than once on a span
+COUNTERS = ("tokens_in", "tokens_out", "tokens_cached", "cost_usd", "retries", "requests", "bytes_out", "bytes_in", "calls")
+
+
+@dataclass
+class Span:
+    id: int
+    name: str
+    parent: int | None
+    start: float
+    end: float | None = None
+    attrs: dict = field(default_factory=dict)
+    error: str | None = None
+
+    @property
+    def seconds(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def record(self, **attrs) -> None:
+        for key, value in attrs.items():
+            if value is None:
+                continue
+            if key in COUNTERS:
+                self.attrs[key] = self.attrs.get(key, 0) + value
+            else:
+                self.attrs[key] = value
+
+
+class Tracer:
+    """Collects the spans of one run."""
+
+    def __init__(self):
+        self.spans: list[Span] = []
+        # extra top-level sections of the JSON report, e.g. the import profile
+        self.extra: dict = {}
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[Span]:
+        parent = _current.get()
+        span = Span(id=len(self.spans) + 1, name=name, parent=parent.id if parent else None, start=time.perf_counter())
+        span.record(**attrs)
+        self.spans.append(span)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.end = time.perf_counter()
+            _current.reset(token)
+
+    def total(self, key: str) -> float:
+        """One counter summed over the spans so far."""
+        return sum(span.attrs.get(key, 0) for span in self.spans)
+
+    def report(self) -> dict:
+        """The run as a JSON-serialisable dict: every span plus totals over the leaf counters."""
+        totals = {key: 0 for key in COUNTERS}
+        for span in self.spans:
+            for key in COUNTERS:
+                totals[key] += span.attrs.get(key, 0)
+        totals["cache_hit_rate"] = round(cache_hit_rate(totals["tokens_cached"], totals["tokens_in"]), 4)
+        return {
+            "started_at": self.started_at,
+            "seconds": time.perf_counter() - self.started,
+            "totals": totals,
+            "spans": [
+                {
+                    "id": span.id,
+                    "name": span.name,
+                    "parent": span.parent,
+                    "offset": span.start - self.started,
+                    "seconds": span.seconds,
+                    "error": span.error,
+                    **span.attrs,
+                }
+                for span in self.spans
+            ],
+            **self.extra,
+        }
+
+    def step_summary(self) -> str:
+        """A markdown table with one row per stage name, in the order the stages started."""
+        rows: dict[str, dict] = {}
+        for span in self.spans:
+            row = rows.setdefault(span.name, {"count": 0, "seconds": 0.0, **{key: 0 for key in COUNTERS}})
+            row["count"] += 1
+            row["seconds"] += span.seconds
+            for key in COUNTERS:
+                row[key] += span.attrs.get(key, 0)
+
+        lines = [
+            "### Code review telemetry",
+            "",
+            "| Stage | Count | Wall (s) | Tokens in | Tokens out | Cache hit | Cost (USD) | Retries | Sent (KB) | Received (KB) |",
+            "|---|---:|---:|---:|---:|---:|---:|---:|---:|---:|",
+        ]
+        for name, row in rows.items():
+            lines.append(
+                f"| {name} | {row['count']} | {row['seconds']:.2f} | {row['tokens_in']} | {row['tokens_out']} "
+                f"| {cache_hit_rate(row['tokens_cached'], row['tokens_in']):.0%} | {row['cost_usd']:.4f} | {row['retries']} | {row['bytes_out'] / 1024:.1f} | {row['bytes_in'] / 1024:.1f} |"
+            )
+        totals = self.report()["totals"]
+        lines.append(
+            f"| **total** | | {time.perf_counter() - self.started:.2f} | {totals['tokens_in']} | {totals['tokens_out']} "
+            f"| {totals['cache_hit_rate']:.0%} | {totals['cost_usd']:.4f} | {totals['retries']} | {totals['bytes_out'] / 1024:.1f} | {totals['bytes_in'] / 1024:.1f} |"
+        )
+        degraded = self.extra.get("budget", {}).get("degradations")
+        if degraded:
+            lines.extend(["", "**Degraded to stay within the run budget:**", ""])
+            lines.extend(f"- {reason}" for reason in degraded)
+        return "\n".join(lines) + "\n"
+
+
+_current: ContextVar[Span | None] = ContextVar("codereviewer_span", default=None)
+_tracer = Tracer()
+# a tracer of its own for each review running in service mode
+_job_tracer: ContextVar[Tracer | None] = ContextVar("codereviewer_tracer", default=None)
+
+
+def get_tracer() -> Tracer:
+    return _job_tracer.get() or _tracer
+
+
+@contextmanager
+def use_tracer(tracer: Tracer) -> Iterator[Tracer]:
+    """Records the spans of this context, and the tasks started from it, on their own tracer."""
+    token = _job_tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _job_tracer.reset(token)
+
+
+def reset_tracer() -> Tracer:
+    """Starts a new run. Spans of the previous run are dropped."""
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def span(name: str, **attrs):
+    """Context manager that records a stage of the current run, see Tracer.span."""
+    return get_tracer().span(name, **attrs)
+
+
+def record(**attrs) -> None:
+    """Adds attributes to the innermost open span, if any. Counters are summed."""
+    current = _current.get()
+    if current is not None:
+        current.record(**attrs)
+
+
+def token_cost(model: str, tokens_in: int, tokens_out: int, tokens_cached: int = 0) -> float | None:
+    """Cost of a call from MODEL_PRICES, None for unknown models. tokens_cached is part of tokens_in."""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    uncached = tokens_in - tokens_cached
+    return (uncached * prices[0] + tokens_cached * prices[0] * CACHED_INPUT_RATE + tokens_out * prices[1]) / 1_000_000
+
+
+def cache_hit_rate(tokens_cached: int, tokens_in: int) -> float:
+    """Share of the prompt tokens served from the provider's prompt cache."""
+    return tokens_cached / tokens_in if tokens_in else 0.0
+
+
+def write_reports(tracer: Tracer | None = None) -> None:
+    """
+    Writes the JSON report to REVIEW_TELEMETRY_PATH and the table to GITHUB_STEP_SUMMARY, when set.
+    """
+    tracer = tracer or get_tracer()
+    totals = tracer.report()["totals"]
+    if totals["tokens_in"]:
+        logger.info(f"Prompt cache: {totals['tokens_cached']}/{totals['tokens_in']} input tokens cached ({totals['cache_hit_rate']:.0%})")
+    path = os.getenv("REVIEW_TELEMETRY_PATH")
+    summary_path = os.getenv("GITHUB_STEP_SUMMARY")
+    try:
+        if path:
+            with open(path, "w") as f:
+                json.dump(tracer.report(), f, indent=2)
+            logger.info(f"Telemetry written to {path}")
+        if summary_path and os.getenv("REVIEW_STEP_SUMMARY", "on").lower() not in ("0", "off", "false", "no"):
+            with open(summary_path, "a") as f:
+                f.write(tracer.step_summary())
+    except OSError as e:
+        logger.warning(f"Could not write telemetry: {e}")
@@ -0,0 +1,200 @@
+"""
+Offline tests for partitioned agent sessions.
+No API keys needed.
+
+Setup: Run `pip install -e .` from the project root before running tests.
+"""
+
+import asyncio
+import os
+import re
+import tempfile
+import time
+
+from codereviewer import reviewer
+from codereviewer.budget import Budget, budgeted
+from codereviewer.diffs import parse_diff
+from codereviewer.reviewer import (
+    DEFAULT_AGENT_TURNS,
+    DEFAULT_PARTITION_TURNS,
+    plan_agent_sessions,
+    review_commplex_changes,
+    review_partitioned_changes,
+)
+from codereviewer.sharding import owner_of, package_of, partition_files, read_codeowners
+
+
+def file_diff(path: str, added: int = 50) -> str:
+    lines = [f"+value_{i} = compute({i})  # {path}" for i in range(added)]
+    return f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -0,0 +1,{added} @@\n" + "\n".join(lines) + "\n"
+
+
+# three subsystems of very different size, plus a few small top-level files
+DIFF = (
+    "".join(file_diff(f"src/api/handler{i}.py", 300) for i in range(4))
+    + "".join(file_diff(f"src/storage/table{i}.py", 300) for i in range(2))
+    + file_diff("web/app.ts", 200)
+    + file_diff("setup.py", 20)
+    + file_diff("README.md", 20)
+)
+
+
+def test_partitions_by_package():
+    """Files are grouped by top-level package and the partitions are balanced, largest first."""
+    print("\n🧪 Testing Package Partitions...")
+    assert package_of("src/api/handler.py") == "src/api"
+    assert package_of("web/app.ts") == "web"
+    assert package_of("setup.py") == "."
+
+    files = parse_diff(DIFF)
+    partitions = partition_files(files, 3)
+    assert [p.name for p in partitions] == ["src/api", "src/storage", "web, ."], [p.name for p in partitions]
+    assert sorted(path for p in partitions for path in p.paths) == sorted(file.path for file in files)
+    assert all(p.paths == sorted(p.paths, key=[f.path for f in files].index) for p in partitions), "Diff order inside a partition"
+    print("✅ Package partitions test passed!")
+
+
+def test_partitions_by_owner():
+    """With CODEOWNERS, files of one team share a session whatever their package, unowned ones fall back to the package."""
+    print("\n🧪 Testing Owner Partitions...")
+    with tempfile.TemporaryDirectory() as repo:
+        os.makedirs(os.path.join(repo, ".github"))
+        with open(os.path.join(repo, ".github", "CODEOWNERS"), "w") as f:
+            f.write("# owners\n* @org/everyone\n/src/ @org/backend\n*.ts @org/frontend\n/src/storage/ @org/data  # db\n")
+        rules = read_codeowners(repo)
+
+    assert owner_of("src/api/handler0.py", rules) == "@org/backend"
+    assert owner_of("src/storage/table0.py", rules) == "@org/data", "The last matching rule wins"
+    assert owner_of("web/app.ts", rules) == "@org/frontend"
+    assert owner_of("README.md", rules) == "@org/everyone"
+    assert owner_of("README.md", []) is None
+
+    partitions = partition_files(parse_diff(DIFF), 4, by="owner", owners=rules)
+    names = {p.name: p.paths for p in partitions}
+    assert names["@org/everyone"] == ["setup.py", "README.md"], names
+    assert len(names["@org/backend"]) == 4 and len(names["@org/data"]) == 2
+    print("✅ Owner partitions test passed!")
+
+
+def test_sessions_run_concurrently():
+    """Each partition gets its own session and turn budget, and the run takes about as long as the largest one."""
+    print("\n🧪 Testing Concurrent Agent Sessions...")
+    sessions = []
+
+    async def agent_fn(diff: str, summary: dict, max_turns: int = DEFAULT_AGENT_TURNS) -> dict:
+        paths = [file.path for file in parse_diff(diff)]
+        sessions.append((paths, max_turns))
+        await asyncio.sleep(0.3)
+        # every session reports the shared finding, it must only be kept once
+        issues = [{"category": "Logic", "file": "src/api/handler0.py", "line": 1, "issue": "Shared bug", "impact": "x", "recommendation": "y"}]
+        issues.append({"category": "Logic", "file": paths[0], "line": 2, "issue": "Own bug", "impact": "x", "recommendation": "y"})
+        return {"issues": issues}
+
+    os.environ["REVIEW_AGENT_PARTITION_TOKENS"] = "1000"
+    try:
+        started = time.perf_counter()
+        review = asyncio.run(review_partitioned_changes(DIFF, {}, agent_fn, max_sessions=3, max_turns=8))
+        elapsed = time.perf_counter() - started
+    finally:
+        os.environ.pop("REVIEW_AGENT_PARTITION_TOKENS", None)
+
+    assert len(sessions) == 3 and all(turns == 8 for _, turns in sessions), sessions
+    assert sorted(path for paths, _ in sessions for path in paths) == sorted(file.path for file in parse_diff(DIFF))
+    assert elapsed < 0.6, f"Sessions should run at the same time, took {elapsed:.2f}s"
+    shared = [issue for issue in review["issues"] if issue["issue"] == "Shared bug"]
+    assert len(shared) == 1 and len(review["issues"]) == 4, review["issues"]
+    print("✅ Concurrent agent sessions test passed!")
+
+
+def test_failed_session_keeps_the_others():
+    """A session that raises is recorded as a degradation and the other sessions' findings are kept."""
+    print("\n🧪 Testing Failed Agent Session...")
+
+    async def agent_fn(diff: str, summary: dict, max_turns: int = DEFAULT_AGENT_TURNS) -> dict:
+        paths = [file.path for file in parse_diff(diff)]
+        if any(path.startswith("src/storage/") for path in paths):
+            raise RuntimeError("agent crashed")
+        return {"issues": [{"category": "Logic", "file": paths[0], "line": 2, "issue": "Own bug", "impact": "x", "recommendation": "y"}]}
+
+    async def run():
+        with budgeted(Budget()) as budget:
+            return await review_partitioned_changes(DIFF, {}, agent_fn, max_sessions=3, max_turns=8), budget
+
+    os.environ["REVIEW_AGENT_PARTITION_TOKENS"] = "1000"
+    try:
+        review, budget = asyncio.run(run())
+    finally:
+        os.environ.pop("REVIEW_AGENT_PARTITION_TOKENS", None)
+
+    assert len(review["issues"]) == 2, review["issues"]
+    assert review["unreviewed"] == ["src/storage/table0.py", "src/storage/table1.py"], review
+    assert budget.degradations and "1 of 3 agent sessions" in budget.degradations[0], budget.degradations
+    print("✅ Failed agent session test passed!")
+
+
+def test_small_diff_single_session():
+    """A diff too small to be worth splitting is reviewed in one session with the full turn budget."""
+    print("\n🧪 Testing Single Agent Session...")
+    calls = []
+
+    async def agent_fn(diff: str, summary: dict, max_turns: int = DEFAULT_AGENT_TURNS) -> dict:
+        calls.append(max_turns)
+        return {"issues": []}
+
+    small = file_diff("src/api/a.py") + file_diff("web/b.ts")
+    assert len(plan_agent_sessions(parse_diff(small))) == 1
+    asyncio.run(review_partitioned_changes(small, {}, agent_fn))
+    assert calls == [DEFAULT_AGENT_TURNS], calls
+    print("✅ Single agent session test passed!")
+
+
+def test_prompt_turn_limit_fits_session():
+    """The turn limit the agent is told is below the session's hard limit, so it submits before it is cut off."""
+    print("\n🧪 Testing Stated Turn Limit...")
+    sessions = []
+    original = reviewer.agent_query
+
+    async def recording_query(prompt, options, channel):
+        stated = int(re.search(r"You have (\d+) turns MAX", prompt).group(1))
+        sessions.append((stated, options.max_turns))
+        async for message in original(prompt, options, channel):
+            yield message
+
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["REVIEW_SYMBOL_INDEX"] = "off"
+    reviewer.agent_query = recording_query
+    try:
+        for max_turns in (1, 2, 5, DEFAULT_PARTITION_TURNS, DEFAULT_AGENT_TURNS, 40):
+            asyncio.run(review_commplex_changes(file_diff("src/api/a.py"), "summary", max_turns=max_turns))
+        asyncio.run(review_commplex_changes(file_diff("src/api/a.py"), "summary"))
+    finally:
+        reviewer.agent_query = original
+        os.environ.pop("LLM_BACKEND", None)
+        os.environ.pop("REVIEW_SYMBOL_INDEX", None)
+
+    assert all(stated <= limit for stated, limit in sessions), sessions
+    assert all(stated < limit for stated, limit in sessions if limit > 1), "Leave the agent a turn to submit"
+    assert sessions[-1] == (15, DEFAULT_AGENT_TURNS), "A single session keeps the old 15 of 25"
+    print("✅ Stated turn limit test passed!")
+
+
+def run_all_tests():
+    """Run all agent session tests."""
+    print("=" * 60)
+    print("Running Agent Session Tests")
+    print("=" * 60)
+
+    test_partitions_by_package()
+    test_partitions_by_owner()
+    test_sessions_run_concurrently()
+    test_failed_session_keeps_the_others()
+    test_small_diff_single_session()
+    test_prompt_turn_limit_fits_session()
+
+    print("\n" + "=" * 60)
+    print("✅ All agent session tests passed!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,66 @@
+"""
+Offline tests for the synthetic diff generator and the benchmark runner.
+No API keys needed.
+
+Setup: Run `pip install -e .` from the project root before running tests.
+"""
+
+import json
+import os
+import tempfile
+
+from benchmarks.run import main as run_benchmarks
+from benchmarks.synthetic import generate_diff
+from codereviewer.diffs import compute_diff_stat, parse_diff
+
+
+def test_generated_diff_shape():
+    """The generated diff has the requested files, renames, binaries and about the requested lines."""
+    print("\n🧪 Testing Synthetic Diff...")
+    files = parse_diff(generate_diff(lines=2000, files=100))
+    stat = compute_diff_stat(files)
+
+    assert len(files) == 100, f"Expected 100 files, got {len(files)}"
+    assert sum(file.binary for file in files) == 2, "Expected 2 binary files"
+    assert sum("/moved/" in file.path for file in files) == 5, "Expected 5 renamed files"
+    assert 1500 <= stat["total"] <= 2000, f"Expected about 2000 changed lines, got {stat['total']}"
+    assert generate_diff(lines=10, files=1) == generate_diff(lines=10, files=1), "Generator should be deterministic"
+    print(f"✅ Synthetic diff test passed! ({stat['total']} lines)")
+
+
+def test_benchmark_report():
+    """The runner writes a JSON report and fails when a stage is over its threshold."""
+    print("\n🧪 Testing Benchmark Report...")
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "bench.json")
+        thresholds = os.path.join(tmp, "thresholds.json")
+        with open(thresholds, "w") as f:
+            json.dump({"small": {"parse_diff": 0.0}}, f)
+
+        status = run_benchmarks(["--scenarios", "small", "--repeat", "1", "--no-end-to-end",
+                                 "--output", output, "--thresholds", thresholds])
+        with open(output) as f:
+            report = json.load(f)
+
+    assert status == 1, "A stage over its threshold should fail the run"
+    assert [r["stage"] for r in report["regressions"]] == ["parse_diff"]
+    assert set(report["scenarios"][0]["stages"]) >= {"parse_diff", "diff_stat", "prompts", "sharding"}
+    print("✅ Benchmark report test passed!")
+
+
+def run_all_tests():
+    """Run all benchmark tests."""
+    print("=" * 60)
+    print("Running Benchmark Tests")
+    print("=" * 60)
+
+    test_generated_diff_shape()
+    test_benchmark_report()
+
+    print("\n" + "=" * 60)
+    print("✅ All benchmark tests passed!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,141 @@
+"""
+Offline tests for the run deadline and spend budget.
+No API keys or network needed.
+
+Setup: Run `pip install -e .` from the project root before running tests.
+"""
+
+import asyncio
+import os
+import subprocess
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_files, write_repo
+from codereviewer.__main__ import run
+from codereviewer.budget import Budget, budgeted
+from codereviewer.diffs import parse_diff
+from codereviewer.fake_github import FakeGitHub
+from codereviewer.github_client import REVIEWED_SHA_MARKER
+from codereviewer.job import ReviewJob, running
+from codereviewer.reviewer import review_sharded_changes
+from codereviewer.router import fit_agent_budget, plan_review, predict_cost
+from codereviewer.telemetry import Tracer, use_tracer
+
+REPO = "owner/repo"
+
+
+def file_diff(path: str, added: int = 5) -> str:
+    lines = [f"+value_{i} = {i}" for i in range(added)]
+    return f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -0,0 +1,{added} @@\n" + "\n".join(lines) + "\n"
+
+
+def test_deadline_drops_late_shards():
+    """Shards still running at the deadline are cancelled and the finished ones are kept."""
+    print("\n🧪 Testing Shard Deadline...")
+    diff = "".join(file_diff(f"dir{i}/file{i}.py") for i in range(6))
+
+    async def review_fn(shard: str, summary: dict) -> dict:
+        path = parse_diff(shard)[0].path
+        await asyncio.sleep(0.05 if path.startswith(("dir0", "dir1")) else 5)
+        return {"issues": [{"category": "Logic", "file": path, "line": 1, "issue": "x", "impact": "y", "recommendation": "z"}]}
+
+    async def run_review():
+        # 0.6s review window once the posting reserve (half of a short deadline) is kept back
+        with budgeted(Budget(deadline_seconds=1.2)) as budget:
+            review = await review_sharded_changes(diff, {}, review_fn, token_budget=20, max_concurrency=6, group_by="file")
+        return review, budget
+
+    started = time.perf_counter()
+    review, budget = asyncio.run(run_review())
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 2, f"The review should stop at the deadline, took {elapsed:.1f}s"
+    assert sorted(issue["file"] for issue in review["issues"]) == ["dir0/file0.py", "dir1/file1.py"]
+    assert budget.degradations and "4 of 6 review shards" in budget.degradations[0], budget.degradations
+    print("✅ Shard deadline test passed!")
+
+
+def test_agent_gets_riskiest_files_it_can_afford():
+    """With money for one agent session over one file, the agent gets the highest-scoring file."""
+    print("\n🧪 Testing Agent Budget...")
+    files = parse_diff(file_diff("auth/session.py", 2000) + file_diff("lib/util.py", 2000) + file_diff("lib/other.py", 2000))
+    plan = plan_review(files, {}, threshold=0.5)
+    agent = plan.paths("agent")
+    assert len(agent) == 3, plan
+
+    one_file = predict_cost([], [files[0]])
+    with budgeted(Budget(max_cost_usd=one_file * 1.2)) as budget:
+        kept = fit_agent_budget(plan, files, agent)
+    assert kept == {"auth/session.py"}, f"The sensitive path scores highest, got {kept}"
+    assert "riskiest 1 of 3" in budget.degradations[0], budget.degradations
+
+    with budgeted(Budget(deadline_seconds=30)) as budget:
+        kept = fit_agent_budget(plan, files, agent)
+    assert kept == set(), "Too little time for the agent should route everything to the cheap pass"
+
+    with budgeted(Budget()) as budget:
+        assert fit_agent_budget(plan, files, agent) == agent and not budget.degradations
+    print("✅ Agent budget test passed!")
+
+
+def test_run_degrades_and_reports():
+    """A run with slow models and a short deadline finishes on time, says it is partial and is not marked reviewed."""
+    print("\n🧪 Testing Run Under Deadline...")
+    with tempfile.TemporaryDirectory() as root, FakeGitHub() as github:
+        work = write_repo(root, generate_files(lines=200, files=5, seed=5))
+        head = subprocess.run(["git", "rev-parse", "HEAD"], cwd=work, capture_output=True, text=True, check=True).stdout.strip()
+        pr = github.add_pull_request(REPO, 9, head_sha=head)
+        env = {
+            "LLM_BACKEND": "fake",
+            "LLM_FAKE_LATENCY": "10",
+            "GITHUB_TOKEN": "token",
+            "GITHUB_API_URL": github.url,
+            "REVIEW_CACHE": "off",
+            "REVIEW_POST_FLUSH_SECONDS": "0",
+            "REVIEW_DEADLINE_SECONDS": "4",
+        }
+        saved = {key: os.environ.get(key) for key in env}
+        os.environ.update(env)
+        try:
+            async def review():
+                with use_tracer(Tracer()) as tracer, running(ReviewJob(REPO, 9, head_sha=head, base_ref="main", workdir=work)):
+                    await run()
+                return tracer
+
+            started = time.perf_counter()
+            tracer = asyncio.run(review())
+            elapsed = time.perf_counter() - started
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+    summary = pr.comments[0]["body"]
+    assert elapsed < 6, f"The run should finish near its deadline, took {elapsed:.1f}s"
+    assert "Partial review" in summary and "lists the changed files" in summary, summary
+    assert REVIEWED_SHA_MARKER.format(sha=head) not in summary, "A partial review must not be marked reviewed"
+    assert tracer.extra["budget"]["degradations"], tracer.extra
+    assert "Degraded to stay within the run budget" in tracer.step_summary()
+    print("✅ Run under deadline test passed!")
+
+
+def run_all_tests():
+    """Run all budget tests."""
+    print("=" * 60)
+    print("Running Budget Tests")
+    print("=" * 60)
+
+    test_deadline_drops_late_shards()
+    test_agent_gets_riskiest_files_it_can_afford()
+    test_run_degrades_and_reports()
+
+    print("\n" + "=" * 60)
+    print("✅ All budget tests passed!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    run_all_tests()
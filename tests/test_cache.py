@@ -0,0 +1,157 @@
+"""
+Offline tests for the hunk review cache.
+No API keys needed.
+
+Setup: Run `pip install -e .` from the project root before running tests.
+"""
+
+import asyncio
+from functools import partial
+from pathlib import Path
+
+from codereviewer.budget import Budget, budgeted
+from codereviewer.cache import ReviewCache, review_with_cache
+from codereviewer.diffs import parse_diff
+from codereviewer.reviewer import review_sharded_changes
+
+
+def load_sample_diff(filename: str) -> str:
+    """Load a sample diff from test_data directory."""
+    test_data_dir = Path(__file__).parent / "test_data"
+    with open(test_data_dir / filename, "r") as f:
+        return f.read()
+
+
+class CountingReviewer:
+    """Stand-in reviewer that records the diffs it is asked to review."""
+
+    def __init__(self, issues: list[dict]):
+        self.issues = issues
+        self.diffs = []
+
+    async def __call__(self, diff: str, summary: dict) -> dict:
+        self.diffs.append(diff)
+        return {"issues": [dict(issue) for issue in self.issues]}
+
+
+ISSUE = {
+    "category": "Security",
+    "file": "auth.py",
+    "line": 6,
+    "issue": "Hardcoded credentials",
+    "impact": "Anyone can log in as admin",
+    "recommendation": "Load credentials from a secret store",
+}
+
+
+def test_second_run_hits_cache():
+    """The second review of the same diff does not call the reviewer and returns the same issues."""
+    print("\n🧪 Testing Cache Hit...")
+    diff = load_sample_diff("buggy_diff.txt") + load_sample_diff("simple_diff.txt")
+    cache = ReviewCache(":memory:")
+    reviewer = CountingReviewer([ISSUE])
+
+    first = asyncio.run(review_with_cache(diff, {}, reviewer, "test-model", cache))
+    second = asyncio.run(review_with_cache(diff, {}, reviewer, "test-model", cache))
+
+    assert len(reviewer.diffs) == 1, f"Reviewer called {len(reviewer.diffs)} times, expected 1"
+    assert first["issues"] == second["issues"], "Cached issues differ from the original review"
+    print("✅ Cache hit test passed!")
+
+
+def test_only_changed_hunks_are_reviewed():
+    """After one file changes only that file is sent to the reviewer."""
+    print("\n🧪 Testing Partial Cache Miss...")
+    buggy = load_sample_diff("buggy_diff.txt")
+    simple = load_sample_diff("simple_diff.txt")
+    cache = ReviewCache(":memory:")
+    reviewer = CountingReviewer([ISSUE])
+
+    asyncio.run(review_with_cache(buggy + simple, {}, reviewer, "test-model", cache))
+    changed = simple.replace("Hello", "Hi")
+    result = asyncio.run(review_with_cache(buggy + changed, {}, reviewer, "test-model", cache))
+
+    assert len(reviewer.diffs) == 2, "Reviewer should run once per run with a miss"
+    assert "utils.py" in reviewer.diffs[1] and "auth.py" not in reviewer.diffs[1], "Only utils.py should be reviewed again"
+    assert ISSUE in result["issues"], "Cached auth.py issue should be reused"
+    print("✅ Partial cache miss test passed!")
+
+
+def test_model_is_part_of_key():
+    """A different model does not reuse another model's findings."""
+    print("\n🧪 Testing Cache Key Model...")
+    diff = load_sample_diff("buggy_diff.txt")
+    cache = ReviewCache(":memory:")
+    reviewer = CountingReviewer([])
+
+    asyncio.run(review_with_cache(diff, {}, reviewer, "model-a", cache))
+    asyncio.run(review_with_cache(diff, {}, reviewer, "model-b", cache))
+
+    assert len(reviewer.diffs) == 2, "Different models should not share cache entries"
+    print("✅ Cache key model test passed!")
+
+
+def test_dropped_shards_are_not_cached():
+    """Shards the budget dropped are reviewed again on the next run instead of cached as clean."""
+    print("\n🧪 Testing Dropped Shards Not Cached...")
+    diff = "".join(
+        f"diff --git a/dir{i}/file.py b/dir{i}/file.py\n--- a/dir{i}/file.py\n+++ b/dir{i}/file.py\n@@ -0,0 +1,1 @@\n+x = {i}\n"
+        for i in range(4)
+    )
+    cache = ReviewCache(":memory:")
+
+    async def reviewer(shard: str, summary: dict, slow: bool) -> dict:
+        path = parse_diff(shard)[0].path
+        if slow and path != "dir0/file.py":
+            await asyncio.sleep(5)
+        return {"issues": [{**ISSUE, "file": path, "line": 1}]}
+
+    def review_fn(slow: bool):
+        return partial(review_sharded_changes, review_fn=partial(reviewer, slow=slow), token_budget=10, group_by="file")
+
+    async def degraded():
+        with budgeted(Budget(deadline_seconds=1.2)):
+            return await review_with_cache(diff, {}, review_fn(True), "test-model", cache)
+
+    first = asyncio.run(degraded())
+    second = asyncio.run(review_with_cache(diff, {}, review_fn(False), "test-model", cache))
+
+    assert len(first["issues"]) == 1 and len(first["unreviewed"]) == 3, first
+    assert len(second["issues"]) == 4, f"The dropped shards should be reviewed again, got {second['issues']}"
+    assert "unreviewed" not in second
+    print("✅ Dropped shards not cached test passed!")
+
+
+def test_evict_by_entries():
+    """Eviction keeps at most max_entries rows."""
+    print("\n🧪 Testing Cache Eviction...")
+    cache = ReviewCache(":memory:", max_entries=3)
+    for i in range(10):
+        cache.put(f"key{i}", [])
+    removed = cache.evict()
+    remaining = cache.conn.execute("SELECT COUNT(*) FROM reviews").fetchone()[0]
+
+    assert remaining == 3, f"Expected 3 entries left, got {remaining}"
+    assert removed == 7, f"Expected 7 evicted, got {removed}"
+    print("✅ Cache eviction test passed!")
+
+
+def run_all_tests():
+    """Run all cache tests."""
+    print("=" * 60)
+    print("Running Review Cache Tests")
+    print("=" * 60)
+
+    test_second_run_hits_cache()
+    test_only_changed_hunks_are_reviewed()
+    test_model_is_part_of_key()
+    test_dropped_shards_are_not_cached()
+    test_evict_by_entries()
+
+    print("\n" + "=" * 60)
+    print("✅ All review cache tests passed!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,97 @@
+"""
+Offline tests for the complex reviewer's in-process result channel.
+No API keys needed.
+
+Setup: Run `pip install -e .` from the project root before running tests.
+"""
+
+import asyncio
+import os
+from pathlib import Path
+
+from codereviewer.channel import ReviewChannel
+from codereviewer.reviewer import review_commplex_changes
+
+ISSUE = {
+    "category": "Logic",
+    "file": "app.py",
+    "line": 3,
+    "issue": "Off by one",
+    "impact": "Skips the last item",
+    "recommendation": "Use <= instead of <",
+}
+
+
+def load_sample_diff(filename: str) -> str:
+    """Load a sample diff from test_data directory."""
+    test_data_dir = Path(__file__).parent / "test_data"
+    with open(test_data_dir / filename, "r") as f:
+        return f.read()
+
+
+def test_submit_tool_validates_findings():
+    """The tool stores valid findings and reports invalid ones back to the agent."""
+    print("\n🧪 Testing submit_review Tool...")
+    with ReviewChannel() as channel:
+        handler = channel.submit_tool().handler
+        bad = asyncio.run(handler({"issues": [{"file": "app.py"}]}))
+        good = asyncio.run(handler({"issues": [ISSUE]}))
+        raw = channel.read()
+        scratch = channel.scratch_dir
+
+    assert bad.get("is_error"), "Invalid findings should be an error result"
+    assert not good.get("is_error"), f"Valid findings should be accepted: {good}"
+    assert '"Off by one"' in raw, "Submitted findings should be readable"
+    assert not os.path.exists(scratch), "Scratch directory should be removed"
+    print("✅ submit_review tool test passed!")
+
+
+def test_scratch_file_fallback():
+    """Without a tool call the channel reads its own scratch file, and channels never share one."""
+    print("\n🧪 Testing Scratch File Fallback...")
+    with ReviewChannel() as first, ReviewChannel() as second:
+        assert first.result_file != second.result_file, "Each review needs its own scratch path"
+        assert first.read() is None, "Nothing submitted or written yet"
+        with open(first.result_file, "w") as f:
+            f.write('{"issues": []}')
+        assert first.read() == '{"issues": []}'
+        assert second.read() is None
+    print("✅ Scratch file fallback test passed!")
+
+
+def test_concurrent_complex_reviews():
+    """Several complex reviews run at once in one process without mixing their findings."""
+    print("\n🧪 Testing Concurrent Complex Reviews...")
+    diffs = [load_sample_diff("buggy_diff.txt"), load_sample_diff("simple_diff.txt")]
+    os.environ["LLM_BACKEND"] = "fake"
+    try:
+        async def run():
+            return await asyncio.gather(*(review_commplex_changes(diff, "summary") for diff in diffs * 2))
+
+        reviews = asyncio.run(run())
+    finally:
+        os.environ.pop("LLM_BACKEND", None)
+
+    files = [sorted({issue["file"] for issue in review["issues"]}) for review in reviews]
+    assert files[0] == files[2] and files[1] == files[3], f"Same diff should give the same findings: {files}"
+    assert files[0] != files[1], f"Different diffs should not share findings: {files}"
+    print("✅ Concurrent complex reviews test passed!")
+
+
+def run_all_tests():
+    """Run all result channel tests."""
+    print("=" * 60)
+    print("Running Result Channel Tests")
+    print("=" * 60)
+
+    test_submit_tool_validates_findings()
+    test_scratch_file_fallback()
+    test_concurrent_complex_reviews()
+
+    print("\n" + "=" * 60)
+    print("✅ All result channel tests passed!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    run_all_tests()
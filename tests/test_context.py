@@ -0,0 +1,149 @@
+"""
+Offline tests for the token-budgeted diff context builder.
+No API keys needed.
+
+Setup: Run `pip install -e .` from the project root before running tests.
+"""
+
+import asyncio
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from codereviewer.context import expand_diff_context, make_file_reader, with_context
+from codereviewer.diffs import parse_diff
+
+
+def make_function(name: str, body_lines: int) -> list[str]:
+    """A python function with a numbered body."""
+    return [f"def {name}(x):"] + [f"    x = x + {i}" for i in range(body_lines)] + ["    return x", ""]
+
+
+def diff_in_repo(old: list[str], new: list[str]) -> tuple[str, str]:
+    """Commit old as app.py, write new over it and return (diff, repo dir)."""
+    repo = tempfile.mkdtemp()
+    path = Path(repo) / "app.py"
+    git = ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+    subprocess.run(["git", "init", "-q"], cwd=repo, check=True)
+    path.write_text("\n".join(old) + "\n")
+    subprocess.run(["git", "add", "app.py"], cwd=repo, check=True)
+    subprocess.run([*git, "commit", "-qm", "base"], cwd=repo, check=True)
+    path.write_text("\n".join(new) + "\n")
+    result = subprocess.run(["git", "diff", "-U3"], cwd=repo, check=True, capture_output=True, text=True)
+    return result.stdout, repo
+
+
+def check_hunk_lengths(diff: str):
+    """Every hunk header must match the lines in the hunk."""
+    for file in parse_diff(diff):
+        for hunk in file.hunks:
+            old = sum(1 for line in hunk.lines if line[:1] in (" ", "-"))
+            new = sum(1 for line in hunk.lines if line[:1] in (" ", "+"))
+            assert (old, new) == (hunk.old_len, hunk.new_len), f"Bad hunk header {hunk.header}"
+
+
+def test_hunk_grows_to_enclosing_function():
+    """A non-trivial change in a long function is shown with the def line."""
+    print("\n🧪 Testing Function Scope Context...")
+    old = make_function("first", 5) + make_function("target", 40) + make_function("last", 5)
+    new = list(old)
+    for i in (30, 31, 32):
+        new[i] = new[i].replace("x + ", "x * ")
+    diff, repo = diff_in_repo(old, new)
+
+    expanded = expand_diff_context(diff, make_file_reader(cwd=repo), token_budget=10000)
+
+    assert " def target(x):" not in diff.splitlines(), "The small diff should not reach the def line"
+    assert " def target(x):" in expanded.splitlines(), "Expanded diff should include the enclosing def"
+    assert " def first(x):" not in expanded.splitlines(), "Expanded diff should not pull in other functions"
+    check_hunk_lengths(expanded)
+    print("✅ Function scope context test passed!")
+
+
+def test_trivial_hunk_keeps_small_context():
+    """A one-line change keeps the diff's own context."""
+    print("\n🧪 Testing Trivial Hunk Context...")
+    old = make_function("target", 40)
+    new = list(old)
+    new[20] = new[20].replace("x + ", "x - ")
+    diff, repo = diff_in_repo(old, new)
+
+    expanded = expand_diff_context(diff, make_file_reader(cwd=repo), token_budget=10000)
+
+    assert expanded == diff, "Trivial hunk should not be expanded"
+    print("✅ Trivial hunk context test passed!")
+
+
+def test_budget_trims_context():
+    """With no room in the budget the diff is sent as fetched."""
+    print("\n🧪 Testing Context Budget...")
+    old = make_function("target", 60)
+    new = list(old)
+    for i in (40, 41, 42):
+        new[i] = new[i].replace("x + ", "x * ")
+    diff, repo = diff_in_repo(old, new)
+
+    unlimited = expand_diff_context(diff, make_file_reader(cwd=repo), token_budget=100000)
+    trimmed = expand_diff_context(diff, make_file_reader(cwd=repo), token_budget=1)
+
+    assert len(unlimited) > len(diff), "Expected context to be added without a tight budget"
+    assert trimmed == diff, "Expected no added context with a budget of 1 token"
+    check_hunk_lengths(unlimited)
+    print("✅ Context budget test passed!")
+
+
+def test_context_does_not_block_the_loop():
+    """Reading files for context runs off the event loop, so other tasks keep going meanwhile."""
+    print("\n🧪 Testing Context Off The Event Loop...")
+    old = make_function("target", 40)
+    new = list(old)
+    for i in (20, 21, 22):
+        new[i] = new[i].replace("x + ", "x * ")
+    diff, repo = diff_in_repo(old, new)
+    reader = make_file_reader(cwd=repo)
+
+    def slow_reader(path: str) -> list[str] | None:
+        time.sleep(0.3)
+        return reader(path)
+
+    async def review_fn(diff: str, summary: dict) -> dict:
+        return {"issues": []}
+
+    async def run() -> int:
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.ensure_future(tick())
+        await with_context(review_fn, slow_reader, token_budget=10000)(diff, {})
+        ticker.cancel()
+        return ticks
+
+    ticks = asyncio.run(run())
+    assert ticks >= 10, f"The event loop should keep running while files are read, ticked {ticks} times"
+    print("✅ Context off the event loop test passed!")
+
+
+def run_all_tests():
+    """Run all context tests."""
+    print("=" * 60)
+    print("Running Diff Context Tests")
+    print("=" * 60)
+
+    test_hunk_grows_to_enclosing_function()
+    test_trivial_hunk_keeps_small_context()
+    test_budget_trims_context()
+    test_context_does_not_block_the_loop()
+
+    print("\n" + "=" * 60)
+    print("✅ All diff context tests passed!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    run_all_tests()
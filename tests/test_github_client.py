@@ -0,0 +1,232 @@
+"""
+Offline tests for the async GitHub client against the local fake GitHub server.
+No API keys or network needed.
+
+Setup: Run `pip install -e .` from the project root before running tests.
+"""
+
+import asyncio
+import os
+import time
+
+from codereviewer.fake_github import FakeGitHub
+from codereviewer.github_client import (
+    GitHubClient,
+    GitHubAPIError,
+    PullRequestRef,
+    REVIEWED_SHA_MARKER,
+    _submit_review,
+    get_incremental_base,
+    post_comments,
+    post_review,
+    aclose_client,
+)
+
+REPO = "owner/repo"
+HEAD = "a" * 40
+
+
+def make_comments(count: int) -> list[dict]:
+    return [{"path": "app.py", "line": i, "side": "RIGHT", "body": f"issue {i}"} for i in range(1, count + 1)]
+
+
+def make_issue(line: int) -> dict:
+    return {
+        "category": "Logic",
+        "file": "app.py",
+        "line": line,
+        "issue": f"Problem on line {line}",
+        "impact": "Wrong result",
+        "recommendation": "Fix it",
+    }
+
+
+def test_batch_posts_in_one_call():
+    """All comments and the body go out in a single review."""
+    print("\n🧪 Testing Batched Review...")
+    with FakeGitHub() as github:
+        pr = github.add_pull_request(REPO, 1, head_sha=HEAD)
+
+        async def run():
+            client = GitHubClient("token", api_url=github.url)
+            try:
+                return await _submit_review(client, PullRequestRef(REPO, 1), HEAD, make_comments(40), "summary")
+            finally:
+                await client.aclose()
+
+        posted = asyncio.run(run())
+
+    assert posted == 40, f"Expected 40 comments posted, got {posted}"
+    assert len(github.requests) == 1, f"Expected 1 API call, got {len(github.requests)}"
+    assert [r["body"] for r in pr.reviews] == ["summary"], "Body should be sent with the batch"
+    print("✅ Batched review test passed!")
+
+
+def test_rejected_batch_is_split():
+    """A rejected batch is split until only the bad comment fails, and the body is still posted once."""
+    print("\n🧪 Testing Rejected Batch Fallback...")
+    with FakeGitHub() as github:
+        pr = github.add_pull_request(REPO, 1, head_sha=HEAD, commentable_lines={"app.py": set(range(1, 17)) - {7}})
+
+        async def run():
+            client = GitHubClient("token", api_url=github.url)
+            try:
+                return await _submit_review(client, PullRequestRef(REPO, 1), HEAD, make_comments(16), "summary")
+            finally:
+                await client.aclose()
+
+        posted = asyncio.run(run())
+
+    assert posted == 15, f"Expected 15 comments posted, got {posted}"
+    assert [r["body"] for r in pr.reviews if r["body"]] == ["summary"], "Body should be posted exactly once"
+    assert len(github.requests) < 16, f"Expected fewer calls than comments, got {len(github.requests)}"
+    print(f"✅ Rejected batch fallback test passed! ({len(github.requests)} calls)")
+
+
+def test_other_errors_are_not_split():
+    """Only a 422 splits the batch, an auth error fails once instead of once per chunk."""
+    print("\n🧪 Testing Unsplittable Errors...")
+    with FakeGitHub() as github:
+        github.add_pull_request(REPO, 1, head_sha=HEAD)
+        github.fail_next(1, status=401)
+
+        async def run():
+            client = GitHubClient("token", api_url=github.url)
+            try:
+                await _submit_review(client, PullRequestRef(REPO, 1), HEAD, make_comments(16), "summary")
+            except GitHubAPIError as e:
+                return e.status
+            finally:
+                await client.aclose()
+
+        status = asyncio.run(run())
+
+    assert status == 401, f"The auth error should be raised, got {status}"
+    assert len(github.requests) == 1, f"Expected one call, got {len(github.requests)}"
+    print("✅ Unsplittable errors test passed!")
+
+
+def test_retries_follow_rate_limit_headers():
+    """Throttled and 5xx responses are retried, a 404 is not."""
+    print("\n🧪 Testing Retries...")
+    with FakeGitHub() as github:
+        github.add_pull_request(REPO, 1, head_sha=HEAD)
+        github.throttle_next(1, retry_after=0)
+        github.exhaust_rate_limit(1, reset_in=0)
+        github.fail_next(1, status=502)
+
+        async def run():
+            client = GitHubClient("token", api_url=github.url, max_retries=5, backoff=0.01)
+            try:
+                response = await client.request("GET", f"/repos/{REPO}/pulls/1")
+                try:
+                    await client.request("GET", f"/repos/{REPO}/pulls/2")
+                    raise AssertionError("Expected a 404")
+                except GitHubAPIError as e:
+                    assert e.status == 404, f"Expected 404, got {e.status}"
+                return response.json(), client.retries
+            finally:
+                await client.aclose()
+
+        start = time.perf_counter()
+        pr, retries = asyncio.run(run())
+        elapsed = time.perf_counter() - start
+
+    assert pr["head"]["sha"] == HEAD, "Should get the PR after retrying"
+    assert retries == 3, f"Expected 3 retries, got {retries}"
+    print(f"✅ Retry test passed! ({elapsed:.2f}s)")
+
+
+def test_incremental_marker_round_trip():
+    """A posted review records the head commit that the next run reviews from."""
+    print("\n🧪 Testing Reviewed Commit Marker...")
+
+    with FakeGitHub() as github:
+        github.add_pull_request(REPO, 1, head_sha=HEAD)
+        env = {"GITHUB_TOKEN": "token", "GITHUB_API_URL": github.url}
+        saved = {key: os.environ.get(key) for key in env}
+        os.environ.update(env)
+
+        async def run():
+            try:
+                ref = PullRequestRef(REPO, 1)
+                before = await get_incremental_base("b" * 40, ref)
+                await post_review({"issues": [make_issue(3)]}, {"summary": "Adds things"}, HEAD, ref)
+                after = await get_incremental_base("b" * 40, ref)
+                github.compare_status[(HEAD, "c" * 40)] = "diverged"
+                forced = await get_incremental_base("c" * 40, ref)
+                return before, after, forced
+            finally:
+                await aclose_client()
+
+        try:
+            before, after, forced = asyncio.run(run())
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+    assert before is None, "First run should review the whole PR"
+    assert after == HEAD, f"Expected incremental base {HEAD}, got {after}"
+    assert forced is None, "A force-push should fall back to a full review"
+    print("✅ Reviewed commit marker test passed!")
+
+
+def test_lost_comments_are_not_marked():
+    """A review that lost comments is not marked reviewed, in batched and in individual mode."""
+    print("\n🧪 Testing Lost Comments Not Marked...")
+    with FakeGitHub() as github:
+        # line 4 is outside the diff, GitHub rejects it
+        pr = github.add_pull_request(REPO, 1, head_sha=HEAD, commentable_lines={"app.py": {1, 2, 3}})
+        ref = PullRequestRef(REPO, 1)
+        env = {"GITHUB_TOKEN": "token", "GITHUB_API_URL": github.url}
+        saved = {key: os.environ.get(key) for key in env}
+        os.environ.update(env)
+
+        async def run():
+            try:
+                batched = await post_review({"issues": [make_issue(i) for i in range(1, 5)]}, {"summary": "Adds things"}, HEAD, ref)
+                complete = await post_review({"issues": [make_issue(1)]}, {"summary": "Adds things"}, HEAD, ref)
+                individual = await post_comments({"issues": [make_issue(i) for i in range(1, 5)]}, ref)
+                return batched, complete, individual
+            finally:
+                await aclose_client()
+
+        try:
+            batched, complete, individual = asyncio.run(run())
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+    marker = REVIEWED_SHA_MARKER.format(sha=HEAD)
+    assert not batched and marker not in pr.reviews[0]["body"], "A batch that lost a comment must not be marked"
+    assert complete and marker in pr.reviews[-1]["body"], "A complete review should be marked"
+    assert not individual, "Individual posting should report the lost comment"
+    print("✅ Lost comments not marked test passed!")
+
+
+def run_all_tests():
+    """Run all GitHub client tests."""
+    print("=" * 60)
+    print("Running GitHub Client Tests")
+    print("=" * 60)
+
+    test_batch_posts_in_one_call()
+    test_rejected_batch_is_split()
+    test_other_errors_are_not_split()
+    test_retries_follow_rate_limit_headers()
+    test_incremental_marker_round_trip()
+    test_lost_comments_are_not_marked()
+
+    print("\n" + "=" * 60)
+    print("✅ All GitHub client tests passed!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    run_all_tests()
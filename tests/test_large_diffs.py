@@ -0,0 +1,168 @@
+"""
+Offline tests for memory-bounded diff parsing with spill to disk.
+No API keys needed.
+
+Setup: Run `pip install -e .` from the project root before running tests.
+"""
+
+import asyncio
+import os
+import subprocess
+import tempfile
+
+from benchmarks.synthetic import generate_files, write_repo
+from codereviewer.__main__ import run
+from codereviewer.diffs import acquire_diff, compute_diff_stat, iter_file_diffs, parse_diff
+from codereviewer.fake_github import FakeGitHub
+from codereviewer.github_client import REVIEWED_SHA_MARKER
+from codereviewer.job import ReviewJob, running
+
+REPO = "owner/repo"
+
+
+def file_diff(path: str, added: int) -> str:
+    lines = [f"+line {i} of {path}" for i in range(added)]
+    return f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -0,0 +1,{added} @@\n" + "\n".join(lines) + "\n"
+
+
+def test_oversized_file_is_spilled():
+    """A file over the per-file limit goes to disk, keeps its counts and can be read back."""
+    print("\n🧪 Testing Oversized File Spill...")
+    diff = file_diff("small.py", 5) + file_diff("vendor/huge.js", 5000) + file_diff("after.py", 5)
+    with tempfile.TemporaryDirectory() as spill_dir:
+        files = list(iter_file_diffs(diff.rstrip("\n").split("\n"), max_file_bytes=10_000, spill_dir=spill_dir))
+        huge = files[1]
+
+        assert [file.path for file in files] == ["small.py", "vendor/huge.js", "after.py"]
+        assert huge.spill_path and not huge.hunks, "The huge file should only be on disk"
+        assert huge.insertions == 5000, f"Counts should survive the spill, got {huge.insertions}"
+        assert compute_diff_stat(files)["insertions"] == 5010
+        assert huge.load_spilled().text == file_diff("vendor/huge.js", 5000), "Spilled diff should read back intact"
+        assert files[0].spill_path is None and files[2].spill_path is None
+        assert not huge.over_memory, "A file over its own limit is not a memory cap exclusion"
+
+        # the in-memory diff keeps a note in place of the hunks, and still parses
+        reparsed = parse_diff("".join(file.text for file in files))
+        assert "diff too large, 5000 changed lines" in reparsed[1].text
+        assert len(reparsed[2].hunks) == 1
+    print("✅ Oversized file spill test passed!")
+
+
+def test_memory_cap_spills_the_rest():
+    """Once the memory cap is reached, later files are spilled whatever their size."""
+    print("\n🧪 Testing Diff Memory Cap...")
+    diff = "".join(file_diff(f"file{i}.py", 50) for i in range(20))
+    with tempfile.TemporaryDirectory() as spill_dir:
+        files = list(iter_file_diffs(diff.rstrip("\n").split("\n"), max_total_bytes=5_000, spill_dir=spill_dir))
+        kept = sum(len(file.text) for file in files if file.spill_path is None)
+        spilled = [file for file in files if file.spill_path]
+
+        assert kept <= 5_000 + 200, f"In-memory diff should stay near the cap, got {kept} bytes"
+        assert spilled and files[0].spill_path is None, "The first files stay in memory, the rest spill"
+        assert all(file.over_memory for file in spilled), "Files spilled by the cap should be marked"
+        assert compute_diff_stat(files)["insertions"] == 1000
+    print("✅ Diff memory cap test passed!")
+
+
+def test_acquire_diff_cleans_up():
+    """acquire_diff spills under the configured limit and removes the spill directory on cleanup."""
+    print("\n🧪 Testing Spill Cleanup...")
+    with tempfile.TemporaryDirectory() as root:
+        work = write_repo(root, generate_files(lines=400, files=4, seed=7))
+        os.environ["REVIEW_DIFF_MAX_FILE_KB"] = "1"
+        try:
+            result = acquire_diff(cwd=work, context=3)
+        finally:
+            os.environ.pop("REVIEW_DIFF_MAX_FILE_KB", None)
+
+        assert result.spilled, "Files over 1 KB should be spilled"
+        assert result.stat["total"] > 0
+        spill_dir = result.spill_dir
+        result.cleanup()
+        assert not os.path.exists(spill_dir), "cleanup should remove the spill directory"
+    print("✅ Spill cleanup test passed!")
+
+
+def test_diff_starts_at_merge_base():
+    """Commits that landed on the base branch after the branch point are not part of the PR diff."""
+    print("\n🧪 Testing Merge Base Diff...")
+    with tempfile.TemporaryDirectory() as root:
+        work = write_repo(root, generate_files(lines=40, files=2, seed=3))
+        before = acquire_diff(cwd=work, context=3)
+        before.cleanup()
+
+        def git(*args):
+            subprocess.run(["git", *args], cwd=work, capture_output=True, check=True)
+
+        git("checkout", "-q", "main")
+        with open(os.path.join(work, "landed_on_main.py"), "w") as f:
+            f.write("x = 1\n")
+        git("add", "-A")
+        git("commit", "-q", "-m", "later base commit")
+        git("push", "-q", "origin", "main")
+        git("checkout", "-q", "feature")
+
+        result = acquire_diff(cwd=work, context=3)
+        result.cleanup()
+
+    assert "landed_on_main.py" not in result.stat["files"], "A later base commit should not show up as reverted"
+    assert result.stat == before.stat, "The diff should be the same as before the base moved"
+    print("✅ Merge base diff test passed!")
+
+
+def test_memory_cap_makes_partial_review():
+    """Files left out by the memory cap make the run partial, so its head is not marked reviewed."""
+    print("\n🧪 Testing Memory Cap Review...")
+    with tempfile.TemporaryDirectory() as root, FakeGitHub() as github:
+        # a bit over 1 MB of diff
+        work = write_repo(root, generate_files(lines=40000, files=40, seed=5))
+        head = subprocess.run(["git", "rev-parse", "HEAD"], cwd=work, capture_output=True, text=True, check=True).stdout.strip()
+        pr = github.add_pull_request(REPO, 4, head_sha=head)
+        env = {
+            "LLM_BACKEND": "fake",
+            "GITHUB_TOKEN": "token",
+            "GITHUB_API_URL": github.url,
+            "REVIEW_CACHE": "off",
+            "REVIEW_POST_FLUSH_SECONDS": "0",
+            "REVIEW_DIFF_MEMORY_MB": "1",
+        }
+        saved = {key: os.environ.get(key) for key in env}
+        os.environ.update(env)
+        try:
+            async def review():
+                with running(ReviewJob(REPO, 4, head_sha=head, base_ref="main", workdir=work)):
+                    await run()
+
+            asyncio.run(review())
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+    summary = pr.comments[0]["body"]
+    assert "Partial review" in summary and "over REVIEW_DIFF_MEMORY_MB" in summary, summary
+    assert REVIEWED_SHA_MARKER.format(sha=head) not in summary, "A partial review must not be marked reviewed"
+    print("✅ Memory cap review test passed!")
+
+
+def run_all_tests():
+    """Run all large diff tests."""
+    print("=" * 60)
+    print("Running Large Diff Tests")
+    print("=" * 60)
+
+    test_oversized_file_is_spilled()
+    test_memory_cap_spills_the_rest()
+    test_acquire_diff_cleans_up()
+    test_diff_starts_at_merge_base()
+    test_memory_cap_makes_partial_review()
+
+    print("\n" + "=" * 60)
+    print("✅ All large diff tests passed!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,175 @@
+"""
+Offline tests for placing review comments on the lines of the PR diff.
+No API keys or network needed.
+
+Setup: Run `pip install -e .` from the project root before running tests.
+"""
+
+import asyncio
+import os
+import subprocess
+import tempfile
+
+from codereviewer.diffs import parse_diff
+from codereviewer.fake_github import FakeGitHub
+from codereviewer.github_client import PullRequestRef, aclose_client, issue_comments, post_review
+from codereviewer.positions import build_line_index
+from codereviewer.posting import PostingQueue
+
+REPO = "owner/repo"
+HEAD = "c" * 40
+
+# app.py changes lines 10-16 and 40-44 of the new file, notes.bin is binary
+DIFF = """diff --git a/src/app.py b/src/app.py
+--- a/src/app.py
++++ b/src/app.py
+@@ -10,6 +10,7 @@ def handler():
+ a
+ b
+ c
++d
+ e
+ f
+ g
+@@ -38,5 +39,6 @@ def other():
+ h
+-i
++j
++k
+ l
+ m
+diff --git a/notes.bin b/notes.bin
+Binary files a/notes.bin and b/notes.bin differ
+"""
+
+
+def issue(path: str, line: int) -> dict:
+    return {"category": "Logic", "file": path, "line": line, "issue": "Bug", "impact": "Wrong", "recommendation": "Fix"}
+
+
+def test_index_places_lines():
+    """Lines on a hunk stay, lines near one are moved onto it, the rest go file-level."""
+    print("\n🧪 Testing Line Index...")
+    index = build_line_index(parse_diff(DIFF), max_snap=5)
+
+    assert index.ranges == {"src/app.py": [(10, 16), (39, 44)], "notes.bin": []}, index.ranges
+    assert index.commentable("src/app.py", 13) and not index.commentable("src/app.py", 20)
+    assert index.place("src/app.py", 13).line == 13
+    assert index.place("src/app.py", 19).line == 16, "Three lines below the first hunk snaps to its end"
+    assert index.place("src/app.py", 36).line == 39, "Three lines above the second hunk snaps to its start"
+    assert index.place("src/app.py", 28).line is None, "Midway between hunks goes file-level"
+    assert index.place("notes.bin", 1).line is None, "A file without hunks only takes file-level comments"
+    assert index.place("b/src/app.py", 13).path == "src/app.py"
+    assert index.place("app.py", 13).path == "src/app.py", "A partial path naming one file is resolved"
+    assert index.place("src/other.py", 13) is None, "Files outside the PR cannot be commented"
+    print("✅ Line index test passed!")
+
+
+def test_index_of_wide_context_diff():
+    """A diff fetched with more context indexes the same lines as the diff GitHub shows."""
+    print("\n🧪 Testing Wide Context Index...")
+    old = [f"line {i}" for i in range(1, 61)]
+    new = list(old)
+    new[1] = "changed 2"
+    new[12] = "changed 13"
+    new[20] = "changed 21"
+    del new[40]
+    new.insert(57, "added")
+
+    def diff(context: int) -> str:
+        with tempfile.TemporaryDirectory() as root:
+            for name, lines in (("a", old), ("b", new)):
+                with open(os.path.join(root, name), "w") as f:
+                    f.write("\n".join(lines) + "\n")
+            result = subprocess.run(
+                ["git", "diff", "--no-index", "--no-color", f"-U{context}", "a", "b"],
+                cwd=root, capture_output=True, text=True,
+            )
+        return result.stdout
+
+    github = build_line_index(parse_diff(diff(3)), max_snap=0)
+    for context in (3, 10, 35):
+        index = build_line_index(parse_diff(diff(context)), max_snap=0)
+        assert index.ranges == github.ranges, f"-U{context}: {index.ranges} != {github.ranges}"
+    assert len(github.ranges["b"]) > 1, "The changes should be in separate hunks on GitHub"
+    print("✅ Wide context index test passed!")
+
+
+def test_comments_built_from_index():
+    """Moved and file-level comments say which line the finding was reported for."""
+    print("\n🧪 Testing Comment Placement...")
+    index = build_line_index(parse_diff(DIFF), max_snap=5)
+    comments = issue_comments([issue("src/app.py", 12), issue("src/app.py", 18), issue("src/app.py", 90), issue("gone.py", 1)], index)
+
+    assert [(c["path"], c.get("line"), c.get("subject_type")) for c in comments] == [
+        ("src/app.py", 12, None), ("src/app.py", 16, None), ("src/app.py", None, "file"),
+    ], comments
+    assert "Reported for line 18, moved" in comments[1]["body"]
+    assert "Reported for line 90, which is outside the diff" in comments[2]["body"]
+    assert len(issue_comments([issue("src/app.py", 90)])) == 1, "Without an index every line is posted as reported"
+    print("✅ Comment placement test passed!")
+
+
+def with_github(test):
+    """Runs test(github, pr) against a fake GitHub server that only takes comments on the diff's lines."""
+    with FakeGitHub() as github:
+        pr = github.add_pull_request(REPO, 1, head_sha=HEAD, commentable_lines={"src/app.py": set(range(10, 17)) | set(range(39, 45)), "notes.bin": set()})
+        env = {"GITHUB_TOKEN": "token", "GITHUB_API_URL": github.url}
+        saved = {key: os.environ.get(key) for key in env}
+        os.environ.update(env)
+        try:
+            return test(github, pr)
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+
+def test_no_rejected_requests():
+    """With the index, findings off the diff are posted without a single 422, batched or progressive."""
+    print("\n🧪 Testing Posting Without Rejections...")
+    issues = [issue("src/app.py", 12), issue("src/app.py", 18), issue("src/app.py", 90), issue("notes.bin", 3)]
+    index = build_line_index(parse_diff(DIFF))
+
+    def test(github, pr):
+        async def run():
+            try:
+                await post_review({"issues": issues}, None, HEAD, PullRequestRef(REPO, 1), positions=index)
+                queue = PostingQueue(HEAD, PullRequestRef(REPO, 1), flush_seconds=0, positions=index)
+                queue.start()
+                queue.publish([issue("src/app.py", 41), issue("src/app.py", 120)])
+                return await queue.close()
+            finally:
+                await aclose_client()
+
+        progressive = asyncio.run(run())
+        return progressive, [status for _, _, _, status in github.requests], pr.review_comments
+
+    progressive, statuses, comments = with_github(test)
+    assert 422 not in statuses, f"No request should be rejected: {statuses}"
+    assert progressive == 2
+    assert len(comments) == 6, f"Every finding should reach the PR, got {len(comments)}"
+    assert sum(1 for c in comments if c.get("subject_type") == "file") == 3
+    print("✅ Posting without rejections test passed!")
+
+
+def run_all_tests():
+    """Run all comment position tests."""
+    print("=" * 60)
+    print("Running Comment Position Tests")
+    print("=" * 60)
+
+    test_index_places_lines()
+    test_index_of_wide_context_diff()
+    test_comments_built_from_index()
+    test_no_rejected_requests()
+
+    print("\n" + "=" * 60)
+    print("✅ All comment position tests passed!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,131 @@
+"""
+Offline tests for progressive posting of review findings.
+No API keys or network needed.
+
+Setup: Run `pip install -e .` from the project root before running tests.
+"""
+
+import asyncio
+import os
+
+from codereviewer.fake_github import FakeGitHub
+from codereviewer.github_client import PullRequestRef, aclose_client
+from codereviewer.posting import PostingQueue, publishing
+from codereviewer.reviewer import review_sharded_changes
+
+REPO = "owner/repo"
+HEAD = "a" * 40
+
+
+def file_diff(path: str) -> str:
+    return f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -1 +1 @@\n-old\n+new\n"
+
+
+def issue(path: str, line: int = 1) -> dict:
+    return {
+        "category": "Logic",
+        "file": path,
+        "line": line,
+        "issue": f"Problem in {path}",
+        "impact": "Wrong result",
+        "recommendation": "Fix it",
+    }
+
+
+def with_github(test):
+    """Runs test(github, pr) against a fake GitHub server set up in the environment."""
+    with FakeGitHub() as github:
+        pr = github.add_pull_request(REPO, 1, head_sha=HEAD)
+        env = {"GITHUB_TOKEN": "token", "GITHUB_API_URL": github.url}
+        saved = {key: os.environ.get(key) for key in env}
+        os.environ.update(env)
+        try:
+            return test(github, pr)
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+
+def test_findings_post_while_review_runs():
+    """The fast shard's findings are on the PR before the slow shard is done."""
+    print("\n🧪 Testing Progressive Posting...")
+
+    def test(github, pr):
+        posted_before_slow_shard = []
+
+        async def review_fn(diff: str, summary: dict) -> dict:
+            if "slow.py" in diff:
+                await asyncio.sleep(0.5)
+                posted_before_slow_shard.append(len(pr.review_comments))
+                return {"issues": [issue("slow.py")]}
+            return {"issues": [issue("fast.py")]}
+
+        async def run():
+            queue = PostingQueue(HEAD, PullRequestRef(REPO, 1), flush_seconds=0.05)
+            queue.start()
+            try:
+                with publishing(queue):
+                    review = await review_sharded_changes(
+                        file_diff("fast.py") + file_diff("slow.py"), {}, review_fn, token_budget=1, group_by="file"
+                    )
+                queue.publish(review["issues"])
+                return await queue.close()
+            finally:
+                await aclose_client()
+
+        posted = asyncio.run(run())
+        return posted, posted_before_slow_shard
+
+    posted, before = with_github(test)
+    assert before == [1], f"The fast shard should be posted while the slow one runs: {before}"
+    assert posted == 2, f"Every finding should be posted exactly once, got {posted}"
+    print("✅ Progressive posting test passed!")
+
+
+def test_duplicates_and_failures():
+    """Republished findings are skipped, and a rejected batch does not stop later ones."""
+    print("\n🧪 Testing Posting Queue Dedupe...")
+
+    def test(github, pr):
+        async def run():
+            queue = PostingQueue(HEAD, PullRequestRef(REPO, 1), flush_seconds=0)
+            queue.start()
+            try:
+                assert queue.publish([issue("a.py"), issue("a.py")]) == 1
+                await asyncio.sleep(0.2)
+                github.fail_next(1, status=422)
+                queue.publish([issue("b.py")])
+                await asyncio.sleep(0.2)
+                queue.publish([issue("a.py"), issue("c.py")])
+                return await queue.close(), queue.failed
+            finally:
+                await aclose_client()
+
+        return asyncio.run(run()), [c["path"] for c in pr.review_comments]
+
+    (posted, failed), paths = with_github(test)
+    assert paths == ["a.py", "c.py"], f"Unexpected comments: {paths}"
+    assert posted == 2
+    assert failed == 1, "The rejected finding should be counted, so the run is not marked reviewed"
+    print("✅ Posting queue dedupe test passed!")
+
+
+def run_all_tests():
+    """Run all progressive posting tests."""
+    print("=" * 60)
+    print("Running Progressive Posting Tests")
+    print("=" * 60)
+
+    test_findings_post_while_review_runs()
+    test_duplicates_and_failures()
+
+    print("\n" + "=" * 60)
+    print("✅ All progressive posting tests passed!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,76 @@
+"""
+Offline tests for the prompt layout and prompt cache reporting.
+No API keys needed.
+
+Setup: Run `pip install -e .` from the project root before running tests.
+"""
+
+from codereviewer.prompts import (
+    COMPLEX_REVIEW_INSTRUCTIONS,
+    SIMPLE_REVIEW_INSTRUCTIONS,
+    SUMMARIZER_INSTRUCTIONS,
+    get_complex_review_prompt,
+    get_simple_review_prompt,
+    get_summarizer_prompt,
+)
+from codereviewer.telemetry import Tracer, token_cost
+
+DIFF_A = "diff --git a/a.py b/a.py\n--- a/a.py\n+++ b/a.py\n@@ -1 +1 @@\n-x = 1\n+x = 2\n"
+DIFF_B = "diff --git a/b.py b/b.py\n--- a/b.py\n+++ b/b.py\n@@ -1 +1 @@\n-y = 1\n+y = 2\n"
+
+
+def test_prompts_share_static_prefix():
+    """Every prompt starts with the same instructions, whatever the diff, summary or scratch path."""
+    print("\n🧪 Testing Static Prompt Prefixes...")
+    first = get_simple_review_prompt(DIFF_A, "Summary one")
+    second = get_simple_review_prompt(DIFF_B, "Summary two")
+    assert first.startswith(SIMPLE_REVIEW_INSTRUCTIONS) and second.startswith(SIMPLE_REVIEW_INSTRUCTIONS)
+    assert first.endswith(f"{DIFF_A}\n"), "The diff should come last"
+
+    assert get_summarizer_prompt(DIFF_A).startswith(SUMMARIZER_INSTRUCTIONS)
+    assert get_summarizer_prompt(DIFF_B).startswith(SUMMARIZER_INSTRUCTIONS)
+
+    agent_a = get_complex_review_prompt("/repo/one", DIFF_A, "S", "/tmp/a/review.json")
+    agent_b = get_complex_review_prompt("/repo/two", DIFF_B, "T", "/tmp/b/review.json")
+    assert agent_a.startswith(COMPLEX_REVIEW_INSTRUCTIONS) and agent_b.startswith(COMPLEX_REVIEW_INSTRUCTIONS)
+    for instructions in (SIMPLE_REVIEW_INSTRUCTIONS, SUMMARIZER_INSTRUCTIONS, COMPLEX_REVIEW_INSTRUCTIONS):
+        assert "diff --git" not in instructions and "/tmp/" not in instructions
+    print("✅ Static prompt prefix test passed!")
+
+
+def test_cache_hit_rate_reported():
+    """Cached tokens are summed per stage and in total, and billed at the cached rate."""
+    print("\n🧪 Testing Cache Hit Reporting...")
+    tracer = Tracer()
+    with tracer.span("review"):
+        with tracer.span("llm.ReviewOutput") as first:
+            first.record(tokens_in=2000, tokens_cached=0)
+        with tracer.span("llm.ReviewOutput") as second:
+            second.record(tokens_in=2000, tokens_cached=1500)
+
+    report = tracer.report()
+    assert report["totals"]["tokens_cached"] == 1500
+    assert report["totals"]["cache_hit_rate"] == 0.375, report["totals"]
+    assert "| llm.ReviewOutput | 2 |" in tracer.step_summary()
+    assert "| 38% |" in tracer.step_summary(), tracer.step_summary()
+
+    assert token_cost("gpt-5-mini", 1000, 0, tokens_cached=1000) < token_cost("gpt-5-mini", 1000, 0)
+    print("✅ Cache hit reporting test passed!")
+
+
+def run_all_tests():
+    """Run all prompt tests."""
+    print("=" * 60)
+    print("Running Prompt Tests")
+    print("=" * 60)
+
+    test_prompts_share_static_prefix()
+    test_cache_hit_rate_reported()
+
+    print("\n" + "=" * 60)
+    print("✅ All prompt tests passed!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    run_all_tests()
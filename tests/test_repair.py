@@ -0,0 +1,87 @@
+"""
+Offline tests for local parsing and repair of the complex reviewer's JSON.
+No API keys needed.
+
+Setup: Run `pip install -e .` from the project root before running tests.
+"""
+
+import json
+
+from codereviewer.repair import ReviewRepairError, parse_review
+
+ISSUE = {
+    "category": "Security",
+    "file": "auth.py",
+    "line": 6,
+    "issue": "Hardcoded credentials",
+    "impact": "Anyone can log in as admin",
+    "recommendation": "Use ```secrets``` instead, e.g. {\"key\": 1},",
+}
+
+
+def test_valid_json_is_unchanged():
+    """Valid review files parse as-is, including brackets and fences inside strings."""
+    print("\n🧪 Testing Valid Review JSON...")
+    review = parse_review(json.dumps({"issues": [ISSUE]}))
+    assert [issue.model_dump() for issue in review.issues] == [ISSUE]
+    assert parse_review('{"issues": []}').issues == []
+    print("✅ Valid review JSON test passed!")
+
+
+def test_common_problems_are_repaired():
+    """Code fences, prose, trailing commas and string line numbers are fixed locally."""
+    print("\n🧪 Testing Review JSON Repair...")
+    body = json.dumps({"issues": [ISSUE, {**ISSUE, "line": "L42-45"}]}, indent=2)
+    cases = {
+        "fence": f"Here are my findings:\n```json\n{body}\n```\nLet me know!",
+        "trailing commas": body.replace("\n    }", ",\n    }").replace("}\n  ]", "},\n  ]"),
+        "bare list": json.dumps([ISSUE, {**ISSUE, "line": "42"}]),
+    }
+    for name, text in cases.items():
+        review = parse_review(text)
+        lines = [issue.line for issue in review.issues]
+        assert lines == [6, 42], f"{name}: expected lines [6, 42], got {lines}"
+    print("✅ Review JSON repair test passed!")
+
+
+def test_truncated_file_keeps_complete_issues():
+    """A file cut off mid-array keeps every issue that was written completely."""
+    print("\n🧪 Testing Truncated Review JSON...")
+    full = json.dumps({"issues": [ISSUE, {**ISSUE, "line": 9}, {**ISSUE, "line": 12}]})
+    truncated = full[:full.rindex('"line": 12') + 5]
+    review = parse_review(truncated)
+    assert [issue.line for issue in review.issues] == [6, 9], f"Got {[i.line for i in review.issues]}"
+    assert parse_review('{"issues": [{"category": "Sec').issues == []
+    print("✅ Truncated review JSON test passed!")
+
+
+def test_unrepairable_input_raises():
+    """Input that cannot be repaired raises, so the caller can fall back to the LLM."""
+    print("\n🧪 Testing Unrepairable Review JSON...")
+    for text in ["No issues found.", '{"issues": [{"file": "a.py", "line": "unknown"}]}', '{"issues": "none"}', '{"review": [{"file": "a.py", "line": 1}]}', "{}"]:
+        try:
+            parse_review(text)
+            raise AssertionError(f"Expected ReviewRepairError for {text!r}")
+        except ReviewRepairError:
+            pass
+    print("✅ Unrepairable review JSON test passed!")
+
+
+def run_all_tests():
+    """Run all review repair tests."""
+    print("=" * 60)
+    print("Running Review Repair Tests")
+    print("=" * 60)
+
+    test_valid_json_is_unchanged()
+    test_common_problems_are_repaired()
+    test_truncated_file_keeps_complete_issues()
+    test_unrepairable_input_raises()
+
+    print("\n" + "=" * 60)
+    print("✅ All review repair tests passed!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    run_all_tests()
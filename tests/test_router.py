@@ -0,0 +1,122 @@
+"""
+Offline tests for the review router and tiered escalation.
+No API keys needed.
+
+Setup: Run `pip install -e .` from the project root before running tests.
+"""
+
+import asyncio
+import os
+import subprocess
+import tempfile
+from pathlib import Path
+
+from codereviewer.diffs import parse_diff
+from codereviewer.router import count_call_sites, plan_review, review_routed
+
+
+def file_diff(path: str, added: int, removed: int = 0, code: str = "value = compute()") -> str:
+    """A one-hunk diff for path that adds and removes the given number of lines."""
+    lines = [f"-{code} # old {i}" for i in range(removed)] + [f"+{code} # {i}" for i in range(added)]
+    return (
+        f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n"
+        f"@@ -1,{removed} +1,{added} @@\n" + "\n".join(lines) + "\n"
+    )
+
+
+def issue(path: str, category: str) -> dict:
+    return {
+        "category": category,
+        "file": path,
+        "line": 1,
+        "issue": f"{category} problem",
+        "impact": "Bad",
+        "recommendation": "Fix it",
+    }
+
+
+def test_plan_scores_risk_not_size():
+    """A big lockfile stays cheap, a small change to widely used auth code goes to the agent."""
+    print("\n🧪 Testing Route Plan...")
+    files = parse_diff(
+        file_diff("package-lock.json", 2000)
+        + file_diff("src/auth/session.py", 12, code="def check_token(request):")
+        + file_diff("src/util.py", 10)
+    )
+    plan = plan_review(files, {"src/auth/session.py": 14}, threshold=4.0)
+    tiers = {route.path: route.tier for route in plan.files}
+
+    assert tiers == {"package-lock.json": "cheap", "src/auth/session.py": "agent", "src/util.py": "cheap"}, tiers
+    assert plan.predicted_cost > 0, "Plan should carry a predicted cost"
+    print(f"✅ Route plan test passed! (predicted ${plan.predicted_cost:.4f})")
+
+
+def test_flagged_and_failed_files_escalate():
+    """The agent only sees files the cheap pass flagged or could not review."""
+    print("\n🧪 Testing Tiered Escalation...")
+    diff = (
+        file_diff("app/flagged.py", 5)
+        + file_diff("app/broken.py", 5)
+        + file_diff("app/clean.py", 5)
+        + file_diff("docs/guide.md", 5)
+    )
+    agent_diffs = []
+
+    async def simple_fn(shard_diff: str, summary: dict) -> dict:
+        paths = [file.path for file in parse_diff(shard_diff)]
+        if "app/broken.py" in paths:
+            raise RuntimeError("model refused")
+        return {"issues": [issue(path, "Security") for path in paths if path in ("app/flagged.py", "docs/guide.md")]
+                + [issue(path, "Maintainability") for path in paths if path == "app/clean.py"]}
+
+    async def agent_fn(agent_diff: str, summary: dict) -> dict:
+        agent_diffs.append(agent_diff)
+        return {"issues": [issue(file.path, "Logic") for file in parse_diff(agent_diff)]}
+
+    os.environ.update({"REVIEW_SHARD_TOKEN_BUDGET": "10", "REVIEW_SHARD_GROUP_BY": "file"})
+    try:
+        review = asyncio.run(review_routed(diff, {}, simple_fn, agent_fn, threshold=100))
+    finally:
+        os.environ.pop("REVIEW_SHARD_TOKEN_BUDGET", None)
+        os.environ.pop("REVIEW_SHARD_GROUP_BY", None)
+
+    assert len(agent_diffs) == 1, "Escalated files should share one agent run"
+    escalated = sorted(file.path for file in parse_diff(agent_diffs[0]))
+    assert escalated == ["app/broken.py", "app/flagged.py"], f"Unexpected escalation: {escalated}"
+    assert len(review["issues"]) == 5, f"Expected cheap and agent issues merged, got {review['issues']}"
+    print("✅ Tiered escalation test passed!")
+
+
+def test_call_sites_are_counted():
+    """References to changed definitions are counted across the repo."""
+    print("\n🧪 Testing Call Site Count...")
+    repo = tempfile.mkdtemp()
+    Path(repo, "lib.py").write_text("def check_token(t):\n    return t\n")
+    Path(repo, "a.py").write_text("from lib import check_token\ncheck_token(1)\ncheck_token(2)\n")
+    subprocess.run(["git", "init", "-q"], cwd=repo, check=True)
+    subprocess.run(["git", "add", "."], cwd=repo, check=True)
+
+    files = parse_diff(file_diff("lib.py", 1, code="def check_token(t):") + file_diff("other.py", 1))
+    counts = count_call_sites(files, cwd=repo)
+
+    assert counts == {"lib.py": 3, "other.py": 0}, counts
+    print("✅ Call site count test passed!")
+
+
+def run_all_tests():
+    """Run all router tests."""
+    print("=" * 60)
+    print("Running Router Tests")
+    print("=" * 60)
+
+    test_plan_scores_risk_not_size()
+    test_flagged_and_failed_files_escalate()
+    test_call_sites_are_counted()
+
+    print("\n" + "=" * 60)
+    print("✅ All router tests passed!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,166 @@
+"""
+Offline tests for the multi-PR review service.
+No API keys or network needed.
+
+Setup: Run `pip install -e .` from the project root before running tests.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import subprocess
+import tempfile
+
+import httpx
+
+from benchmarks.synthetic import generate_files, write_repo
+from codereviewer.fake_github import FakeGitHub
+from codereviewer.github_client import REVIEWED_SHA_MARKER
+from codereviewer.job import ReviewJob, current_job
+from codereviewer.service import ReviewService, WebhookServer
+
+REPO = "owner/repo"
+
+
+def event(number: int, sha: str, action: str = "synchronize") -> dict:
+    return {
+        "action": action,
+        "number": number,
+        "pull_request": {"number": number, "head": {"sha": sha}, "base": {"ref": "main"}, "draft": False},
+        "repository": {"full_name": REPO, "clone_url": "https://example.invalid/owner/repo.git"},
+    }
+
+
+def test_newer_push_supersedes_review():
+    """A push to a PR under review cancels that review, a queued one is replaced, other PRs run."""
+    print("\n🧪 Testing Supersede Cancellation...")
+    finished, cancelled = [], []
+
+    async def review_fn(job: ReviewJob) -> None:
+        assert current_job() is None, "review_fn sets up its own job context"
+        try:
+            await asyncio.sleep(0.3)
+            finished.append(str(job))
+        except asyncio.CancelledError:
+            cancelled.append(str(job))
+            raise
+
+    async def run():
+        service = ReviewService(workers=2, review_fn=review_fn)
+        service.start()
+        service.submit(ReviewJob(REPO, 1, head_sha="a" * 40))
+        await asyncio.sleep(0.05)
+        service.submit(ReviewJob(REPO, 1, head_sha="b" * 40))
+        service.submit(ReviewJob(REPO, 2, head_sha="c" * 40))
+        # both workers busy: PR 3's first push is still queued when its second arrives
+        service.submit(ReviewJob(REPO, 3, head_sha="d" * 40))
+        service.submit(ReviewJob(REPO, 3, head_sha="e" * 40))
+        await service.join()
+        await service.stop()
+        return service.stats()
+
+    stats = asyncio.run(run())
+    assert cancelled == [f"{REPO}#1@aaaaaaa"], cancelled
+    assert sorted(finished) == [f"{REPO}#1@bbbbbbb", f"{REPO}#2@ccccccc", f"{REPO}#3@eeeeeee"], finished
+    assert stats["completed"] == 3 and stats["superseded"] == 2, stats
+    print("✅ Supersede cancellation test passed!")
+
+
+def test_webhook_receiver():
+    """Signed pull_request webhooks become jobs, everything else is turned away."""
+    print("\n🧪 Testing Webhook Receiver...")
+    secret = "shh"
+
+    async def run():
+        service = ReviewService(workers=1, review_fn=lambda job: asyncio.sleep(0))
+        submitted = []
+        service.submit = submitted.append
+        with WebhookServer(service, asyncio.get_running_loop(), secret=secret) as server:
+            async with httpx.AsyncClient(base_url=server.url) as client:
+                async def post(payload: dict, kind: str = "pull_request", key: str = secret):
+                    body = json.dumps(payload).encode()
+                    signature = "sha256=" + hmac.new(key.encode(), body, hashlib.sha256).hexdigest()
+                    return await client.post("/", content=body, headers={"X-GitHub-Event": kind, "X-Hub-Signature-256": signature})
+
+                accepted = await post(event(7, "f" * 40))
+                forged = await post(event(7, "f" * 40), key="wrong")
+                closed = await post(event(7, "f" * 40, action="closed"))
+                other = await post({"zen": "hi"}, kind="ping")
+                health = await client.get("/health")
+            await asyncio.sleep(0.05)
+        return submitted, [r.status_code for r in (accepted, forged, closed, other, health)]
+
+    submitted, statuses = asyncio.run(run())
+    assert statuses == [202, 401, 200, 200, 200], statuses
+    assert [(job.number, job.head_sha, job.base_ref) for job in submitted] == [(7, "f" * 40, "main")], submitted
+    print("✅ Webhook receiver test passed!")
+
+
+def test_review_job_in_worktree():
+    """A job is reviewed in its own worktree off the repo mirror, posted to its PR and cleaned up."""
+    print("\n🧪 Testing Service Review Job...")
+    with tempfile.TemporaryDirectory() as root, FakeGitHub() as github:
+        work = write_repo(root, generate_files(lines=200, files=5, seed=3))
+        subprocess.run(["git", "push", "-q", os.path.join(root, "origin.git"), "feature"], cwd=work, check=True)
+        head = subprocess.run(["git", "rev-parse", "HEAD"], cwd=work, capture_output=True, text=True, check=True).stdout.strip()
+        # the PR got another push after the job was queued, the job still reviews its own commit
+        newer = "f" * 40
+        pr = github.add_pull_request(REPO, 5, head_sha=newer)
+
+        env = {
+            "LLM_BACKEND": "fake",
+            "GITHUB_TOKEN": "token",
+            "GITHUB_API_URL": github.url,
+            "REVIEW_CACHE": "off",
+            "REVIEW_POST_FLUSH_SECONDS": "0",
+        }
+        saved = {key: os.environ.get(key) for key in env}
+        os.environ.update(env)
+        try:
+            async def run():
+                service = ReviewService(workers=2, root=os.path.join(root, "service"))
+                service.start()
+                service.submit(ReviewJob(REPO, 5, head_sha=head, base_ref="main", clone_url=os.path.join(root, "origin.git")))
+                await service.join()
+                await service.stop()
+                return service.stats()
+
+            stats = asyncio.run(run())
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+        worktrees = os.listdir(os.path.join(root, "service", "worktrees"))
+
+    assert stats["completed"] == 1, stats
+    assert pr.comments, "The summary should be posted to the job's PR"
+    assert pr.review_comments, "Findings should be posted to the job's PR"
+    summary = pr.comments[0]["body"]
+    assert REVIEWED_SHA_MARKER.format(sha=head) in summary, "The checked out commit should be marked reviewed"
+    assert newer not in summary, "A newer push the job did not check out must not be marked reviewed"
+    assert worktrees == [], f"Worktree should be removed: {worktrees}"
+    print("✅ Service review job test passed!")
+
+
+def run_all_tests():
+    """Run all service tests."""
+    print("=" * 60)
+    print("Running Service Tests")
+    print("=" * 60)
+
+    test_newer_push_supersedes_review()
+    test_webhook_receiver()
+    test_review_job_in_worktree()
+
+    print("\n" + "=" * 60)
+    print("✅ All service tests passed!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    run_all_tests()
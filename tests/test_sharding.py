@@ -0,0 +1,145 @@
+"""
+Offline tests for diff parsing, sharding and merging of shard reviews.
+No API keys needed.
+
+Setup: Run `pip install -e .` from the project root before running tests.
+"""
+
+from pathlib import Path
+
+from codereviewer.diffs import parse_diff, compute_diff_stat
+from codereviewer.reviewer import merge_reviews
+from codereviewer.sharding import shard_diff, estimate_tokens
+
+
+def load_sample_diff(filename: str) -> str:
+    """Load a sample diff from test_data directory."""
+    test_data_dir = Path(__file__).parent / "test_data"
+    with open(test_data_dir / filename, "r") as f:
+        return f.read()
+
+
+def make_file_diff(path: str, hunks: int = 1, lines_per_hunk: int = 10) -> str:
+    """Build a small diff for one file with the given number of hunks."""
+    out = [
+        f"diff --git a/{path} b/{path}",
+        "index 1234567..abcdefg 100644",
+        f"--- a/{path}",
+        f"+++ b/{path}",
+    ]
+    for h in range(hunks):
+        start = h * 100 + 1
+        out.append(f"@@ -{start},{lines_per_hunk} +{start},{lines_per_hunk} @@")
+        out.extend(f"+line {i} of hunk {h}" for i in range(lines_per_hunk))
+    return "\n".join(out) + "\n"
+
+
+def test_parse_diff():
+    """Verify files and hunks are parsed from the sample diffs."""
+    print("\n🧪 Testing Diff Parsing...")
+    files = parse_diff(load_sample_diff("buggy_diff.txt") + load_sample_diff("simple_diff.txt"))
+
+    assert [f.path for f in files] == ["auth.py", "utils.py"], f"Unexpected files: {[f.path for f in files]}"
+    assert len(files[0].hunks) == 1, "auth.py should have one hunk"
+    hunk = files[0].hunks[0]
+    assert (hunk.old_start, hunk.old_len, hunk.new_start, hunk.new_len) == (1, 10, 1, 15)
+    assert files[0].text.startswith("diff --git a/auth.py b/auth.py"), "File text should round trip"
+    print("✅ Diff parsing test passed!")
+
+
+def test_diff_stat_from_records():
+    """Verify the diff stat is computed from the parsed records, binary files included."""
+    print("\n🧪 Testing Diff Stat...")
+    binary = (
+        "diff --git a/logo.png b/logo.png\n"
+        "index 1234567..abcdefg 100644\n"
+        "Binary files a/logo.png and b/logo.png differ\n"
+    )
+    files = parse_diff(load_sample_diff("buggy_diff.txt") + binary)
+    stat = compute_diff_stat(files)
+
+    assert stat["files"] == ["auth.py", "logo.png"], f"Unexpected files: {stat['files']}"
+    assert (stat["insertions"], stat["deletions"]) == (12, 5), f"Unexpected counts: {stat}"
+    assert files[1].binary and not files[1].hunks, "logo.png should be a binary file without hunks"
+    print("✅ Diff stat test passed!")
+
+
+def test_small_diff_is_one_shard():
+    """A diff under the budget is not split."""
+    print("\n🧪 Testing Small Diff Sharding...")
+    shards = shard_diff(load_sample_diff("buggy_diff.txt"), token_budget=10000)
+    assert len(shards) == 1, f"Expected 1 shard, got {len(shards)}"
+    print("✅ Small diff sharding test passed!")
+
+
+def test_shards_respect_budget():
+    """Files are packed into shards under the budget and no file is lost."""
+    print("\n🧪 Testing Shard Budget...")
+    paths = [f"pkg{i % 3}/module{i}.py" for i in range(12)]
+    diff = "".join(make_file_diff(path, hunks=2) for path in paths)
+    budget = estimate_tokens(make_file_diff("pkg0/module0.py", hunks=2)) * 3
+
+    shards = shard_diff(diff, token_budget=budget, group_by="file")
+
+    assert len(shards) > 1, "Expected the diff to be split"
+    assert all(shard.tokens <= budget for shard in shards), "A shard is over budget"
+    sharded_paths = [path for shard in shards for path in shard.paths]
+    assert sorted(sharded_paths) == sorted(paths), "Files were lost or duplicated"
+    print(f"✅ Shard budget test passed! {len(shards)} shards")
+
+
+def test_large_file_split_between_hunks():
+    """A file bigger than the budget is split between its hunks, each piece keeps the header."""
+    print("\n🧪 Testing Large File Split...")
+    diff = make_file_diff("big.py", hunks=6, lines_per_hunk=40)
+    budget = estimate_tokens(diff) // 3
+
+    shards = shard_diff(diff, token_budget=budget)
+
+    assert len(shards) > 1, "Expected the file to be split"
+    hunks = sum(len(f.hunks) for shard in shards for f in shard.files)
+    assert hunks == 6, f"Expected 6 hunks across shards, got {hunks}"
+    assert all(shard.text.startswith("diff --git a/big.py") for shard in shards)
+    print(f"✅ Large file split test passed! {len(shards)} shards")
+
+
+def test_merge_reviews_dedupes():
+    """Merging keeps one copy of an issue reported by two shards."""
+    print("\n🧪 Testing Review Merge...")
+    issue = {
+        "category": "Security",
+        "file": "auth.py",
+        "line": 4,
+        "issue": "Hardcoded credentials",
+        "impact": "Anyone can log in",
+        "recommendation": "Use a secret store",
+    }
+    other = dict(issue, file="a.py", line=1, issue="Division by zero")
+
+    merged = merge_reviews([{"issues": [issue]}, {"issues": [dict(issue), other]}])
+
+    assert len(merged["issues"]) == 2, f"Expected 2 issues, got {len(merged['issues'])}"
+    assert merged["issues"][0]["file"] == "a.py", "Issues should be sorted by file"
+    print("✅ Review merge test passed!")
+
+
+def run_all_tests():
+    """Run all sharding tests."""
+    print("=" * 60)
+    print("Running Sharding Tests")
+    print("=" * 60)
+
+    test_parse_diff()
+    test_diff_stat_from_records()
+    test_small_diff_is_one_shard()
+    test_shards_respect_budget()
+    test_large_file_split_between_hunks()
+    test_merge_reviews_dedupes()
+
+    print("\n" + "=" * 60)
+    print("✅ All sharding tests passed!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    run_all_tests()
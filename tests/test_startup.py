@@ -0,0 +1,72 @@
+"""
+Offline tests for lazy backend loading and the startup import profiler.
+No API keys needed.
+
+Setup: Run `pip install -e .` from the project root before running tests.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+
+def run_python(code: str, **env) -> str:
+    """Runs code in a fresh interpreter, so imports start cold."""
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True, env={**os.environ, **env}
+    )
+    return result.stdout.strip()
+
+
+def test_backends_are_not_imported_at_startup():
+    """Importing the entry point does not pull in the LLM SDKs."""
+    print("\n🧪 Testing Lazy Backends...")
+    loaded = json.loads(run_python(
+        "import sys, json, codereviewer.__main__\n"
+        "print(json.dumps([m for m in ('langchain_openai', 'claude_agent_sdk') if m in sys.modules]))"
+    ))
+    assert loaded == [], f"Backends imported at startup: {loaded}"
+
+    loaded = json.loads(run_python(
+        "import sys, json\n"
+        "from codereviewer.providers import load_backend\n"
+        "assert load_backend('claude') is load_backend('claude')\n"
+        "print(json.dumps([m for m in ('langchain_openai', 'claude_agent_sdk') if m in sys.modules]))"
+    ))
+    assert loaded == ["claude_agent_sdk"], f"Only the requested backend should load: {loaded}"
+    print("✅ Lazy backends test passed!")
+
+
+def test_import_profile():
+    """With profiling on, every package module shows up with its import time."""
+    print("\n🧪 Testing Import Profile...")
+    profile = json.loads(run_python(
+        "import json, codereviewer.__main__\n"
+        "from codereviewer.startup import import_profile\n"
+        "print(json.dumps(import_profile(limit=1000)))",
+        REVIEW_PROFILE_IMPORTS="on",
+    ))
+    modules = {row["module"]: row for row in profile}
+    assert "codereviewer.reviewer" in modules, f"Missing package modules: {sorted(modules)[:20]}"
+    reviewer = modules["codereviewer.reviewer"]
+    assert reviewer["seconds"] >= reviewer["self_seconds"] >= 0, reviewer
+    print(f"✅ Import profile test passed! ({len(profile)} modules)")
+
+
+def run_all_tests():
+    """Run all startup tests."""
+    print("=" * 60)
+    print("Running Startup Tests")
+    print("=" * 60)
+
+    test_backends_are_not_imported_at_startup()
+    test_import_profile()
+
+    print("\n" + "=" * 60)
+    print("✅ All startup tests passed!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,124 @@
+"""
+Offline tests for the map-reduce summarizer, run against the fake LLM backend.
+No API keys needed.
+
+Setup: Run `pip install -e .` from the project root before running tests.
+"""
+
+import asyncio
+import os
+
+from codereviewer import summarizer
+from codereviewer.cache import ReviewCache
+from codereviewer.models import FileSummariesOutput
+from codereviewer.summarizer import summarize_changes
+
+
+def file_diff(path: str, marker: str = "x", added: int = 20) -> str:
+    lines = [f"+{marker} = {i}  # in {path}" for i in range(added)]
+    return f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n@@ -0,0 +1,{added} @@\n" + "\n".join(lines) + "\n"
+
+
+def big_diff(files: int = 12, changed: str = "") -> str:
+    return "".join(file_diff(f"pkg{i % 3}/mod{i}.py", "y" if f"mod{i}.py" == changed else "x") for i in range(files))
+
+
+class RecordingLLM:
+    """Wraps the summarizer's LLM call and records the schema and prompt of every call."""
+
+    def __init__(self):
+        self.calls = []
+        self.original = summarizer.ainvoke_structured
+
+    async def __call__(self, prompt, schema, *args):
+        self.calls.append((schema.__name__, prompt))
+        return await self.original(prompt, schema, *args)
+
+    def __enter__(self):
+        os.environ["LLM_BACKEND"] = "fake"
+        summarizer.ainvoke_structured = self
+        return self
+
+    def __exit__(self, *exc):
+        summarizer.ainvoke_structured = self.original
+        os.environ.pop("LLM_BACKEND", None)
+
+    def mapped_files(self) -> int:
+        return sum(prompt.count("diff --git") for name, prompt in self.calls if name == FileSummariesOutput.__name__)
+
+
+def test_small_diff_single_call():
+    """A diff under the budget is summarized in one call, as before."""
+    print("\n🧪 Testing Single-Call Summary...")
+    with RecordingLLM() as llm:
+        summary = asyncio.run(summarize_changes(big_diff(3), token_budget=10_000))
+    assert [name for name, _ in llm.calls] == ["SummaryOutput"], f"Expected one call, got {llm.calls}"
+    assert summary["number_of_changes"] == 3
+    print("✅ Single-call summary test passed!")
+
+
+def test_map_reduce_covers_every_file():
+    """A diff over the budget is summarized in concurrent chunks and reduced into one summary."""
+    print("\n🧪 Testing Map-Reduce Summary...")
+    diff = big_diff(12)
+    with RecordingLLM() as llm:
+        summary = asyncio.run(summarize_changes(diff, token_budget=800))
+
+    names = [name for name, _ in llm.calls]
+    assert names.count("FileSummariesOutput") > 1, f"Expected several map calls, got {names}"
+    assert names[-1] == "SummaryOutput" and names.count("SummaryOutput") == 1, "One reduce call comes last"
+    assert llm.mapped_files() == 12, "Every file should be sent to the map step once"
+    assert summary["number_of_changes"] == 12
+    assert all(f"mod{i}.py" in summary["summary"] for i in range(12)), "The reduce step should see every file"
+    print("✅ Map-reduce summary test passed!")
+
+
+def test_file_notes_are_cached():
+    """On a later push only the files whose content changed are summarized again."""
+    print("\n🧪 Testing Summary Cache...")
+    cache = ReviewCache(":memory:")
+    with RecordingLLM() as llm:
+        asyncio.run(summarize_changes(big_diff(12), cache=cache, token_budget=800))
+        first = llm.mapped_files()
+        llm.calls.clear()
+        summary = asyncio.run(summarize_changes(big_diff(12, changed="mod5.py"), cache=cache, token_budget=800))
+
+    assert first == 12
+    assert llm.mapped_files() == 1, f"Only the changed file should be summarized, got {llm.mapped_files()}"
+    assert summary["number_of_changes"] == 12
+    assert cache.hits == 11
+    print("✅ Summary cache test passed!")
+
+
+def test_directory_pass_for_many_files():
+    """File notes that do not fit in one call are condensed per directory before the reduce."""
+    print("\n🧪 Testing Directory Summary Pass...")
+    with RecordingLLM() as llm:
+        summary = asyncio.run(summarize_changes(big_diff(60), token_budget=600))
+
+    reduce_prompt = llm.calls[-1][1]
+    assert any("## Notes" in prompt and "diff --git" not in prompt for name, prompt in llm.calls[:-1]), \
+        "Expected a directory pass before the reduce"
+    assert "**pkg0**" in reduce_prompt and "mod7.py" not in reduce_prompt, "The reduce should see directory notes"
+    assert summary["number_of_changes"] == 60
+    print("✅ Directory summary pass test passed!")
+
+
+def run_all_tests():
+    """Run all summarizer tests."""
+    print("=" * 60)
+    print("Running Summarizer Tests")
+    print("=" * 60)
+
+    test_small_diff_single_call()
+    test_map_reduce_covers_every_file()
+    test_file_notes_are_cached()
+    test_directory_pass_for_many_files()
+
+    print("\n" + "=" * 60)
+    print("✅ All summarizer tests passed!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,87 @@
+"""
+Offline tests for the symbol and call-site index given to the complex reviewer.
+No API keys needed.
+
+Setup: Run `pip install -e .` from the project root before running tests.
+"""
+
+import subprocess
+import tempfile
+from pathlib import Path
+
+from codereviewer.diffs import parse_diff
+from codereviewer.symbols import build_symbol_index
+
+FILES = {
+    "auth/tokens.py": "from util import decode\n\n\ndef check_token(token, strict=False) -> bool:\n    data = decode(token)\n    return bool(data)\n",
+    "util.py": "def decode(token: str) -> dict:\n    return {'token': token}\n",
+    "views.py": "from auth.tokens import check_token\n\n\nclass Login:\n    def post(self, request):\n        return check_token(request.token)\n\n\ndef logout(request):\n    check_token(request.token, strict=True)\n",
+    "web/client.js": "function refresh(token) {\n  return token;\n}\n",
+    "web/app.js": "const value = refresh(current);\n",
+}
+
+
+def repo_with_change(path: str, new_text: str) -> tuple[str, str]:
+    """Commit FILES, rewrite one of them and return (diff, repo dir)."""
+    repo = tempfile.mkdtemp()
+    git = ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+    subprocess.run(["git", "init", "-q"], cwd=repo, check=True)
+    for name, text in FILES.items():
+        Path(repo, name).parent.mkdir(parents=True, exist_ok=True)
+        Path(repo, name).write_text(text)
+    subprocess.run(["git", "add", "."], cwd=repo, check=True)
+    subprocess.run([*git, "commit", "-qm", "base"], cwd=repo, check=True)
+    Path(repo, path).write_text(new_text)
+    result = subprocess.run(["git", "diff", "-U3"], cwd=repo, check=True, capture_output=True, text=True)
+    return result.stdout, repo
+
+
+def test_python_callers_and_callees():
+    """A changed python function comes with its signature, its callers and the repo functions it calls."""
+    print("\n🧪 Testing Python Symbol Index...")
+    diff, repo = repo_with_change("auth/tokens.py", FILES["auth/tokens.py"].replace("bool(data)", "data is not None"))
+    index = build_symbol_index(parse_diff(diff), cwd=repo)
+
+    assert [d.name for d in index.changed] == ["check_token"], index.changed
+    assert index.changed[0].signature == "def check_token(token, strict=False) -> bool"
+    callers = sorted((call.path, call.caller) for call in index.callers["check_token"])
+    assert callers == [("views.py", "Login.post"), ("views.py", "logout")], callers
+
+    rendered = index.render()
+    assert "called from (2)" in rendered, rendered
+    assert "calls util.py:1 def decode(token: str) -> dict" in rendered, rendered
+    print("✅ Python symbol index test passed!")
+
+
+def test_other_languages_and_lookup():
+    """Other languages fall back to definition lines and grep hits, and lookups search on demand."""
+    print("\n🧪 Testing Heuristic Index and Lookup...")
+    diff, repo = repo_with_change("web/client.js", "function refresh(token, force) {\n  return token;\n}\n")
+    index = build_symbol_index(parse_diff(diff), cwd=repo)
+
+    assert [d.name for d in index.changed] == ["refresh"], index.changed
+    assert [(call.path, call.line) for call in index.callers["refresh"]] == [("web/app.js", 1)]
+
+    answer = index.lookup("decode")
+    assert "util.py:1 def decode(token: str) -> dict" in answer, answer
+    assert "auth/tokens.py:5 in check_token" in answer, answer
+    assert "No definition of missing" in index.lookup("missing")
+    print("✅ Heuristic index and lookup test passed!")
+
+
+def run_all_tests():
+    """Run all symbol index tests."""
+    print("=" * 60)
+    print("Running Symbol Index Tests")
+    print("=" * 60)
+
+    test_python_callers_and_callees()
+    test_other_languages_and_lookup()
+
+    print("\n" + "=" * 60)
+    print("✅ All symbol index tests passed!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    run_all_tests()
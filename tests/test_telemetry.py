@@ -0,0 +1,120 @@
+"""
+Offline tests for run telemetry.
+No API keys needed.
+
+Setup: Run `pip install -e .` from the project root before running tests.
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+
+from codereviewer.fake_github import FakeGitHub
+from codereviewer.github_client import GitHubClient
+from codereviewer.models import ReviewOutput
+from codereviewer.providers import ainvoke_structured
+from codereviewer.telemetry import record, reset_tracer, span, write_reports
+
+REPO = "owner/repo"
+
+
+def test_spans_nest_across_tasks():
+    """Work done in tasks started inside a stage is attributed to that stage."""
+    print("\n🧪 Testing Span Nesting...")
+    tracer = reset_tracer()
+    os.environ["LLM_BACKEND"] = "fake"
+
+    async def child(name: str):
+        with span(name):
+            record(tokens_in=10, tokens_out=2)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        with span("review"):
+            await asyncio.gather(child("shard"), child("shard"), ainvoke_structured("no diff", ReviewOutput))
+
+    try:
+        asyncio.run(run())
+    finally:
+        os.environ.pop("LLM_BACKEND", None)
+
+    report = tracer.report()
+    review = next(s for s in report["spans"] if s["name"] == "review")
+    children = [s for s in report["spans"] if s["parent"] == review["id"]]
+    assert sorted(s["name"] for s in children) == ["llm.ReviewOutput", "shard", "shard"], children
+    assert report["totals"]["tokens_in"] == 20, f"Expected 20 tokens in, got {report['totals']['tokens_in']}"
+    assert report["totals"]["calls"] == 1, "The LLM call should be counted"
+    print("✅ Span nesting test passed!")
+
+
+def test_github_retries_and_payloads():
+    """GitHub requests, retries and payload sizes are recorded on the open span."""
+    print("\n🧪 Testing GitHub Request Telemetry...")
+    tracer = reset_tracer()
+    with FakeGitHub() as github:
+        github.add_pull_request(REPO, 1)
+        github.fail_next(2, status=503)
+
+        async def run():
+            client = GitHubClient("token", api_url=github.url, backoff=0.01)
+            try:
+                with span("github.post"):
+                    await client.request("POST", f"/repos/{REPO}/issues/1/comments", json={"body": "x" * 1000})
+            finally:
+                await client.aclose()
+
+        asyncio.run(run())
+
+    post = tracer.report()["spans"][0]
+    assert post["retries"] == 2, f"Expected 2 retries, got {post.get('retries')}"
+    assert post["requests"] == 3, f"Expected 3 requests, got {post.get('requests')}"
+    assert post["bytes_out"] > 1000, "Request body size should be recorded"
+    print("✅ GitHub request telemetry test passed!")
+
+
+def test_reports_are_written():
+    """The JSON report and the step summary table are written where the environment says."""
+    print("\n🧪 Testing Telemetry Reports...")
+    tracer = reset_tracer()
+    with span("run"):
+        with span("summarize"):
+            record(tokens_in=1200, tokens_out=300, cost_usd=0.0009)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        report_path, summary_path = os.path.join(tmp, "telemetry.json"), os.path.join(tmp, "summary.md")
+        os.environ.update({"REVIEW_TELEMETRY_PATH": report_path, "GITHUB_STEP_SUMMARY": summary_path})
+        try:
+            write_reports(tracer)
+        finally:
+            os.environ.pop("REVIEW_TELEMETRY_PATH", None)
+            os.environ.pop("GITHUB_STEP_SUMMARY", None)
+        with open(report_path) as f:
+            report = json.load(f)
+        with open(summary_path) as f:
+            table = f.read()
+
+    assert [s["name"] for s in report["spans"]] == ["run", "summarize"]
+    assert report["totals"]["tokens_in"] == 1200
+    assert "| summarize | 1 |" in table, table
+    assert "0.0009" in table, "Cost should be in the table"
+    print("✅ Telemetry reports test passed!")
+
+
+def run_all_tests():
+    """Run all telemetry tests."""
+    print("=" * 60)
+    print("Running Telemetry Tests")
+    print("=" * 60)
+
+    test_spans_nest_across_tasks()
+    test_github_retries_and_payloads()
+    test_reports_are_written()
+
+    print("\n" + "=" * 60)
+    print("✅ All telemetry tests passed!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    run_all_tests()